@@ -71,7 +71,19 @@ export async function GET(request: Request, { params }: { params: { id: string }
 
         // Fetch embeddings
         const embeddingsResult = await client.query({
-            query: `SELECT page_id, embedding, cluster_id FROM page_embeddings WHERE site_id = {projectId:String}`,
+            // Assignments from the latest site clustering live in page_clusters
+            query: `
+                SELECT e.page_id AS page_id, e.embedding AS embedding,
+                       if(c.cluster_id != '', c.cluster_id, e.cluster_id) AS cluster_id
+                FROM page_embeddings AS e
+                LEFT JOIN (
+                    SELECT page_id, argMax(cluster_id, updated) AS cluster_id
+                    FROM page_clusters
+                    WHERE site_id = {projectId:String}
+                    GROUP BY page_id
+                ) AS c ON c.page_id = e.page_id
+                WHERE e.site_id = {projectId:String}
+            `,
             query_params: { projectId },
             format: 'JSONEachRow'
         });
@@ -4,7 +4,8 @@ export interface Cluster {
     site_id: string;
     cluster_id: string;
     label?: string;
-    size?: number;
+    keywords?: string[];
+    page_count?: number;
     centroid_embedding?: number[];
     avg_tspr?: number;
 }
@@ -55,13 +55,24 @@ async function setupSchema() {
       cluster_id String
     ) ENGINE = MergeTree()
     ORDER BY (site_id, page_id)
+    `,
+        `
+    CREATE TABLE IF NOT EXISTS page_clusters (
+      site_id String,
+      page_id String,
+      cluster_id String,
+      updated DateTime
+    ) ENGINE = ReplacingMergeTree(updated)
+    ORDER BY (site_id, page_id)
     `,
         `
     CREATE TABLE IF NOT EXISTS clusters (
       site_id String,
       cluster_id String,
       label String,
-      size UInt32 DEFAULT 0,
+      keywords Array(String),
+      page_count UInt32 DEFAULT 0,
+      avg_health_score Float32 DEFAULT 0.0,
       centroid_embedding Array(Float32),
       avg_tspr Float32 DEFAULT 0.0,
       created_at DateTime DEFAULT now()
@@ -139,6 +150,13 @@ async function setupSchema() {
     `
     ];
 
+    // Brings clusters tables created from older DDL up to the columns above
+    const migrations = [
+        `ALTER TABLE clusters ADD COLUMN IF NOT EXISTS page_count UInt32 DEFAULT 0`,
+        `ALTER TABLE clusters ADD COLUMN IF NOT EXISTS centroid_embedding Array(Float32)`,
+        `ALTER TABLE clusters ADD COLUMN IF NOT EXISTS created_at DateTime DEFAULT now()`,
+    ];
+
     for (const query of tables) {
         try {
             await client.query({ query, format: 'JSONEachRow' });
@@ -148,6 +166,15 @@ async function setupSchema() {
         }
     }
 
+    for (const query of migrations) {
+        try {
+            await client.command({ query });
+            console.log("Executed migration query.");
+        } catch (error) {
+            console.error("Error running migration:", error);
+        }
+    }
+
     console.log("Schema setup complete.");
     await client.close();
 }
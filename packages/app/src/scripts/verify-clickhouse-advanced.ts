@@ -72,7 +72,7 @@ async function verify() {
             site_id: siteId,
             cluster_id: clusterId,
             label: 'Test Cluster',
-            size: 10
+            page_count: 10
         });
         const clusters = await ClickHouseClusterStore.getClustersBySite(siteId);
         console.log(`- Clusters found: ${clusters.length}`);
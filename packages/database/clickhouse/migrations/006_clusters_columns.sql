@@ -0,0 +1,4 @@
+-- Brings clusters tables created before embedding clustering up to schema.sql
+ALTER TABLE clusters ADD COLUMN IF NOT EXISTS page_count UInt32 DEFAULT 0;
+ALTER TABLE clusters ADD COLUMN IF NOT EXISTS centroid_embedding Array(Float32) CODEC(ZSTD(1));
+ALTER TABLE clusters ADD COLUMN IF NOT EXISTS created_at DateTime DEFAULT now();
@@ -42,6 +42,43 @@ CREATE TABLE IF NOT EXISTS page_embeddings (
 ORDER BY (site_id, page_id)
 SETTINGS index_granularity = 8192;
 
+-- Page Cluster Assignments (latest per page wins; read with argMax(cluster_id, updated))
+CREATE TABLE IF NOT EXISTS page_clusters (
+    site_id String,
+    page_id String,
+    cluster_id String,
+    updated DateTime
+) ENGINE = ReplacingMergeTree(updated)
+ORDER BY (site_id, page_id)
+SETTINGS index_granularity = 8192;
+
+-- Clusters Table (keyword clusters, and embedding clusters with a centroid)
+CREATE TABLE IF NOT EXISTS clusters (
+    site_id String,
+    cluster_id String,
+    label String,
+    keywords Array(String),
+    page_count UInt32 DEFAULT 0,
+    avg_health_score Float32 DEFAULT 0.0,
+    centroid_embedding Array(Float32) CODEC(ZSTD(1)),
+    avg_tspr Float32 DEFAULT 0.0,
+    created_at DateTime DEFAULT now()
+) ENGINE = MergeTree()
+ORDER BY (site_id, cluster_id)
+SETTINGS index_granularity = 8192;
+
+-- SERP Results Table (competitor embeddings for content scoring)
+-- created_at is the fetch time; a keyword's latest created_at is its SERP snapshot
+CREATE TABLE IF NOT EXISTS serp_results (
+    keyword String,
+    page_url String CODEC(ZSTD(1)),
+    position UInt32,
+    embedding Array(Float32) CODEC(ZSTD(1)),
+    created_at DateTime DEFAULT now()
+) ENGINE = MergeTree()
+ORDER BY (keyword, position)
+SETTINGS index_granularity = 8192;
+
 -- SERP Competitors Table
 CREATE TABLE IF NOT EXISTS serp_competitors (
     keyword_id String,
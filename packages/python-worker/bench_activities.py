@@ -0,0 +1,76 @@
+"""
+Concurrent activity throughput: CPU-bound activities on the event loop
+vs in the process pool.
+
+Runs a mix of parse_html and compute_clusters calls concurrently, the
+way the Temporal worker would, and reports throughput plus the worst
+event-loop stall (how late a 10 ms ticker fired; heartbeats and I/O
+activities wait that long).
+
+Usage:
+    python bench_activities.py [--tasks 64] [--workers 4]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from src import activities
+from bench_parse import make_page
+
+async def ticker(stop: asyncio.Event, stalls: list):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(0.01)
+        stalls.append(loop.time() - started - 0.01)
+
+async def run(label: str, pages: list, embeddings: list, n_tasks: int) -> None:
+    stop, stalls = asyncio.Event(), []
+    tick = asyncio.create_task(ticker(stop, stalls))
+    started = time.perf_counter()
+
+    calls = []
+    for i in range(n_tasks):
+        if i % 4 == 3:
+            calls.append(activities.compute_clusters(embeddings))
+        else:
+            calls.append(activities.parse_html(pages[i % len(pages)], f"https://example.com/page-{i}"))
+    await asyncio.gather(*calls)
+
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    print(
+        f"{label:<24} {elapsed:8.2f}s  {n_tasks / elapsed:8.1f} activities/s  "
+        f"max loop stall {max(stalls, default=0) * 1000:8.1f} ms"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    pages = [make_page(i, 150, 60, rng) for i in range(16)]
+    embeddings = [
+        {"url": f"https://example.com/page-{i}", "embedding": [rng.random() for _ in range(384)]}
+        for i in range(500)
+    ]
+    print(f"{args.tasks} concurrent activities (3:1 parse_html:compute_clusters)")
+
+    os.environ['CPU_POOL_WORKERS'] = '0'
+    await run("event loop (no pool)", pages, embeddings, args.tasks)
+
+    os.environ['CPU_POOL_WORKERS'] = str(args.workers)
+    activities.start_process_pool()
+    # Warm the workers (imports) outside the timed run
+    await asyncio.gather(*(activities.analyze_content_depth("warm up") for _ in range(args.workers)))
+    await run(f"process pool ({args.workers})", pages, embeddings, args.tasks)
+    activities.shutdown_process_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""
+Throughput benchmark: parse_html extraction engines (BeautifulSoup vs lxml).
+
+Usage:
+    python bench_parse.py [--pages 200] [--links 150] [--paragraphs 60]
+"""
+
+import argparse
+import random
+import time
+
+from src.extract import ENGINES
+
+VOCABULARY = (
+    "seo keyword ranking content search engine optimization backlink page "
+    "crawl index audit schema snippet intent cluster topic authority link "
+    "title meta description canonical sitemap traffic query serp competitor"
+).split()
+
+def make_page(i: int, n_links: int, n_paragraphs: int, rng: random.Random) -> str:
+    words = lambda n: " ".join(rng.choice(VOCABULARY) for _ in range(n))
+    nav = "".join(
+        f'<li><a href="/{"blog" if j % 3 else "https://other.com"}/post-{j}" rel="{"nofollow" if j % 7 == 0 else ""}">{words(4)}</a></li>'
+        for j in range(n_links)
+    )
+    body = "".join(f"<p>{words(80)} <strong>{words(3)}</strong> {words(20)}</p>" for _ in range(n_paragraphs))
+    return (
+        f"<!DOCTYPE html><html><head><title>Page {i} | {words(5)}</title>"
+        f'<meta name="description" content="{words(25)}">'
+        f'<link rel="canonical" href="/page-{i}">'
+        f"<style>{'.c{color:red}' * 200}</style><script>{'var a=1;' * 500}</script></head>"
+        f"<body><nav><ul>{nav}</ul></nav><h1>{words(6)}</h1><article>{body}</article>"
+        f"<footer><!-- footer -->{words(30)}</footer></body></html>"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--links", type=int, default=150)
+    parser.add_argument("--paragraphs", type=int, default=60)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    pages = [make_page(i, args.links, args.paragraphs, rng) for i in range(args.pages)]
+    total_mb = sum(len(p) for p in pages) / 1e6
+    print(f"Parsing {args.pages} pages ({total_mb:.1f} MB)")
+
+    for name, engine in ENGINES.items():
+        started = time.perf_counter()
+        for i, page in enumerate(pages):
+            engine(page, f"https://example.com/page-{i}")
+        elapsed = time.perf_counter() - started
+        print(f"{name:<6} {elapsed:8.2f}s  {args.pages / elapsed:8.1f} pages/s  {total_mb / elapsed:6.1f} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -1,181 +1,425 @@
 import os
 import time
-import requests
-import clickhouse_connect
+import asyncio
+import contextvars
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
 from temporalio import activity
-from datetime import datetime
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-from .scoring import calculate_tspr, cluster_content, calculate_content_depth, calculate_composite_score
-from urllib.robotparser import RobotFileParser
-
-# Initialize ClickHouse client
-def get_clickhouse_client():
-    return clickhouse_connect.get_client(
-        host=os.getenv('CLICKHOUSE_HOST', 'localhost'),
-        port=int(os.getenv('CLICKHOUSE_PORT', 8123)),
-        username=os.getenv('CLICKHOUSE_USER', 'default'),
-        password=os.getenv('CLICKHOUSE_PASSWORD', ''),
-        secure=os.getenv('CLICKHOUSE_SECURE', 'False').lower() == 'true'
-    )
+from urllib.parse import urljoin
+from .scoring import (
+    calculate_tspr, cluster_content, cluster_site, recluster_content,
+    calculate_content_depth, calculate_composite_score, content_depth_batch, composite_scores
+)
+from .clickhouse_client import get_clickhouse_client
+from .fetcher import get_fetcher
+from .crawl_log import get_crawl_log_writer, conditional_headers
+from .robots import RobotsRules, get_robots_cache, origin_of
+from .frontier import Frontier
+from .extract import extract, extract_ref
+from .blob_store import get_blob_store
 
-@activity.defn
-async def fetch_robots_txt(domain_url: str) -> str:
-    activity.logger.info(f"Fetching robots.txt for: {domain_url}")
+# Process pool for CPU-bound activities (created on first use)
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def _cpu_pool_workers() -> int:
+    return int(os.getenv('CPU_POOL_WORKERS', os.cpu_count() or 1))
+
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Lazy create the process pool shared by CPU-bound activities.
+    CPU_POOL_WORKERS sizes it (default: CPU count); 0 disables it.
+    """
+    global _process_pool
+    if _process_pool is None and _cpu_pool_workers() > 0:
+        _process_pool = ProcessPoolExecutor(max_workers=_cpu_pool_workers())
+    return _process_pool
+
+def start_process_pool() -> int:
+    """Create the CPU pool at worker startup; returns its size (0 = disabled)."""
+    return _cpu_pool_workers() if _get_process_pool() is not None else 0
+
+def shutdown_process_pool() -> None:
+    """Stop the CPU pool (worker shutdown)."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+    _process_pool = None
+
+async def _run_cpu(fn, *args):
+    """
+    Run a CPU-bound function off the event loop so heartbeats and I/O
+    activities keep running; inline when the pool is disabled.
+    """
+    pool = _get_process_pool()
+    if pool is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+async def _download_robots(origin: str) -> str:
+    """robots.txt text for an origin; empty (allow all) if unavailable."""
     try:
-        parsed = urlparse(domain_url)
-        base_url = f"{parsed.scheme}://{parsed.netloc}"
-        robots_url = urljoin(base_url, "/robots.txt")
-        
-        response = requests.get(robots_url, timeout=10)
-        if response.status_code == 200:
-            return response.text
+        response = await get_fetcher().fetch(urljoin(origin, "/robots.txt"), timeout=10)
+        if response["status"] == 200:
+            return response["html"]
         return ""
     except Exception as e:
         activity.logger.warn(f"Failed to fetch robots.txt: {e}")
         return ""
 
+async def _robots_rules(origin: str) -> RobotsRules:
+    """Compiled rules for an origin, fetched at most once per cache TTL."""
+    cache = get_robots_cache()
+    rules = cache.get(origin)
+    if rules is None:
+        rules = cache.put(origin, await _download_robots(origin))
+    return rules
+
+@activity.defn
+async def fetch_robots_txt(domain_url: str) -> str:
+    activity.logger.info(f"Fetching robots.txt for: {domain_url}")
+    origin = origin_of(domain_url)
+    content = await _download_robots(origin)
+    # Warm the per-domain cache so later can_fetch calls skip the download
+    get_robots_cache().put(origin, content)
+    return content
+
 @activity.defn
-async def can_fetch(url: str, robots_content: str) -> bool:
-    if not robots_content:
+async def can_fetch(url: str, robots_content: str = None) -> bool:
+    """
+    Check a URL against robots.txt.
+    
+    Without robots_content the rules come from the per-domain cache; passed
+    text is compiled once per distinct content.
+    """
+    if robots_content is not None and not robots_content:
         return True
         
     try:
-        rp = RobotFileParser()
-        rp.parse(robots_content.splitlines())
-        return rp.can_fetch("ApexSEO-Crawler/1.0", url)
+        if robots_content is None:
+            rules = await _robots_rules(origin_of(url))
+        else:
+            rules = get_robots_cache().rules_for_content(robots_content)
+        return rules.can_fetch(url)
     except Exception as e:
         activity.logger.warn(f"Error parsing robots.txt: {e}")
         return True
 
+@activity.defn
+async def can_fetch_many(urls: list[str]) -> dict:
+    """
+    Check many URLs against robots.txt with one cached rule set per domain.
+    
+    Returns:
+        {"allowed": [urls], "disallowed": [urls],
+         "crawl_delays": {origin: seconds}, "sitemaps": {origin: [urls]}}
+    """
+    by_origin = {}
+    for url in dict.fromkeys(urls):
+        by_origin.setdefault(origin_of(url), []).append(url)
+    
+    origins = list(by_origin)
+    rule_sets = await asyncio.gather(*(_robots_rules(origin) for origin in origins))
+    
+    allowed, disallowed = [], []
+    crawl_delays, sitemaps = {}, {}
+    for origin, rules in zip(origins, rule_sets):
+        for url in by_origin[origin]:
+            (allowed if rules.can_fetch(url) else disallowed).append(url)
+        if rules.crawl_delay is not None:
+            crawl_delays[origin] = rules.crawl_delay
+        if rules.sitemaps:
+            sitemaps[origin] = rules.sitemaps
+    
+    activity.logger.info(f"robots.txt: {len(allowed)} allowed, {len(disallowed)} disallowed across {len(origins)} domains")
+    return {
+        "allowed": allowed,
+        "disallowed": disallowed,
+        "crawl_delays": crawl_delays,
+        "sitemaps": sitemaps
+    }
+
+def _inline_max_bytes() -> Optional[int]:
+    """Bodies above HTML_INLINE_MAX_BYTES (UTF-8 encoded) go by reference; unset = always inline."""
+    value = os.getenv('HTML_INLINE_MAX_BYTES', '')
+    return int(value) if value.strip() else None
+
+async def _store_body(html: str) -> Optional[str]:
+    """Put a body in the blob store when it exceeds the inline threshold."""
+    threshold = _inline_max_bytes()
+    # Characters never outnumber UTF-8 bytes, so only short bodies need encoding
+    if threshold is None or (len(html) <= threshold and len(html.encode('utf-8', errors='replace')) <= threshold):
+        return None
+    return await asyncio.to_thread(get_blob_store().put, html)
+
+def _conditional_recrawl() -> bool:
+    return os.getenv('CRAWLER_CONDITIONAL', 'true').lower() == 'true'
+
 @activity.defn
 async def fetch_html(url: str) -> dict:
+    """
+    Fetch a page, revalidating with stored ETag / Last-Modified validators.
+    A 304 comes back with empty html and "not_modified": True so workflows
+    can skip parsing, embedding and scoring; it writes no crawl log row,
+    only refreshed validators. Bodies larger than
+    HTML_INLINE_MAX_BYTES are put in the blob store and returned as
+    "body_ref" (with empty html) instead of travelling through Temporal.
+    """
     activity.logger.info(f"Fetching URL: {url}")
     
     try:
-        headers = {
-            'User-Agent': 'ApexSEO-Crawler/1.0'
-        }
-        response = requests.get(url, headers=headers, timeout=30)
+        writer = get_crawl_log_writer()
+        request_headers = None
+        if _conditional_recrawl():
+            validators = await asyncio.to_thread(writer.get_validators, [url])
+            request_headers = conditional_headers(validators.get(url)) or None
         
-        status_code = response.status_code
-        html = response.text
-        response_headers = dict(response.headers)
+        response = await get_fetcher().fetch(url, headers=request_headers)
         
-        # Persist to ClickHouse
-        try:
-            client = get_clickhouse_client()
-            
-            # Ensure table exists
-            client.command("""
-                CREATE TABLE IF NOT EXISTS raw_crawl_log (
-                    url String,
-                    html String,
-                    headers String,
-                    status UInt16,
-                    timestamp DateTime
-                ) ENGINE = MergeTree()
-                ORDER BY (timestamp, url)
-            """)
-            
-            client.insert('raw_crawl_log', 
-                [[url, html, str(response_headers), status_code, datetime.now()]], 
-                column_names=['url', 'html', 'headers', 'status', 'timestamp']
-            )
-            activity.logger.info(f"Saved {url} to ClickHouse")
-            
-        except Exception as e:
-            activity.logger.error(f"Failed to save to ClickHouse: {e}")
+        status_code = response["status"]
+        html = response["html"]
+        response_headers = response["headers"]
+        
+        # Buffered; written to ClickHouse in bulk by the crawl log writer.
+        # A 304 has no body to log, only validators to refresh
+        if status_code == 304:
+            writer.revalidated(url, response_headers)
+        else:
+            writer.add(url, html, response_headers, status_code)
         
-        return {
+        result = {
             "url": url,
             "status": status_code,
             "html": html,
             "headers": response_headers
         }
+        body_ref = await _store_body(html)
+        if body_ref:
+            result["html"] = ""
+            result["body_ref"] = body_ref
+            result["size"] = len(html)
+        if status_code == 304:
+            activity.logger.info(f"Not modified: {url}")
+            result["not_modified"] = True
+        return result
 
     except Exception as e:
         activity.logger.error(f"Failed to fetch {url}: {e}")
         raise e
 
+def _respect_crawl_delay() -> bool:
+    return os.getenv('CRAWLER_RESPECT_CRAWL_DELAY', 'true').lower() == 'true'
+
+def _make_frontier(max_in_flight: int) -> Frontier:
+    return Frontier(
+        max_in_flight=max_in_flight,
+        per_host_in_flight=int(os.getenv('CRAWLER_HOST_CONCURRENCY', 2)),
+        host_delay=float(os.getenv('CRAWLER_HOST_DELAY', 0.5))
+    )
+
+async def _apply_crawl_delays(frontier: Frontier, origins: set) -> None:
+    """Slow hosts down to their robots.txt Crawl-delay (capped)."""
+    max_delay = float(os.getenv('CRAWLER_MAX_CRAWL_DELAY', 30))
+    origins = list(origins)
+    rule_sets = await asyncio.gather(*(_robots_rules(origin) for origin in origins))
+    for origin, rules in zip(origins, rule_sets):
+        if rules.crawl_delay and rules.crawl_delay > frontier.host_delay:
+            frontier.set_crawl_delay(origin, min(rules.crawl_delay, max_delay))
+
 @activity.defn
-async def parse_html(html: str, url: str) -> dict:
-    activity.logger.info(f"Parsing HTML for: {url}")
-    try:
-        soup = BeautifulSoup(html, 'html.parser')
+async def crawl_batch(urls: list[str]) -> dict:
+    """
+    Fetch a frontier of URLs concurrently in one activity.
+    
+    Fetches share the pooled per-host connections of the fetch engine and
+    are paced per host by the crawl frontier (robots Crawl-delay honoured).
+    Raw pages go to the buffered crawl log writer, which batches inserts on
+    its own schedule; each time it has written rows from this batch, those
+    pages are checkpointed with a heartbeat; 304s and failures heartbeat
+    progress as they complete. On retry, URLs fetched successfully before
+    the last checkpoint are skipped and their results reused; failed URLs,
+    and pages whose rows the writer had to drop, are fetched again.
+    Known URLs are revalidated; a 304 result carries "not_modified": True.
+    Bodies above HTML_INLINE_MAX_BYTES get a "body_ref" for parse_html.
+    
+    Returns:
+        {"results": [{"url", "status", "size", "body_ref"?} or {"url", "status": 0, "error"}],
+         "fetched": int, "failed": int, "not_modified": int, "resumed": int,
+         "crawl_log": writer stats (queue depth, flush latency, ...)}
+    """
+    concurrency = int(os.getenv('CRAWLER_BATCH_CONCURRENCY', 16))
+    
+    checkpoint = {}
+    details = activity.info().heartbeat_details
+    if details:
+        # Failed fetches are retried, not resumed
+        checkpoint = {url: r for url, r in details[0].get("results", {}).items() if not r.get("error")}
+        activity.logger.info(f"Resuming batch with {len(checkpoint)} URLs already crawled")
+    
+    results = dict(checkpoint)
+    failures = {}
+    # Fetched pages waiting for their crawl log row to be written: (seq, result)
+    pending = []
+    loop = asyncio.get_running_loop()
+    fetcher = get_fetcher()
+    writer = get_crawl_log_writer()
+    to_crawl = [url for url in dict.fromkeys(urls) if url not in checkpoint]
+    validators = {}
+    if _conditional_recrawl() and to_crawl:
+        validators = await asyncio.to_thread(writer.get_validators, to_crawl)
+    
+    def heartbeat_progress() -> None:
+        # Only successes are checkpointed, so a retry refetches failures.
+        # A snapshot: throttled heartbeats may be sent after results change
+        activity.heartbeat({"results": dict(results)})
+    
+    def checkpoint_written(written_through: int) -> None:
+        # Rows dropped by a full writer buffer stay pending, never checkpointed
+        written = [(seq, result) for seq, result in pending
+                   if seq <= written_through and writer.is_written(seq)]
+        if not written:
+            return
+        done = {seq for seq, _ in written}
+        pending[:] = [(seq, result) for seq, result in pending if seq not in done]
+        for _, result in written:
+            results[result["url"]] = result
+        heartbeat_progress()
+    
+    # Flush callbacks must run in the activity's context to heartbeat
+    activity_context = contextvars.copy_context()
+    
+    def on_flush(written_through: int) -> None:
+        # Called from the writer's flushing thread
+        loop.call_soon_threadsafe(checkpoint_written, written_through, context=activity_context)
+    
+    frontier = _make_frontier(concurrency)
+    for url in to_crawl:
+        # Inputs are already unique; skip the probabilistic seen check
+        frontier.add(url, check_seen=False)
+    if _respect_crawl_delay():
+        await _apply_crawl_delays(frontier, {origin_of(url) for url in to_crawl})
+    
+    async def crawl(item):
+        url = item.url
+        try:
+            response = await fetcher.fetch(url, headers=conditional_headers(validators.get(url)) or None)
+        except Exception as e:
+            activity.logger.warn(f"Failed to fetch {url}: {e}")
+            failures[url] = {"url": url, "status": 0, "error": str(e)}
+            heartbeat_progress()
+            return
         
-        title = soup.title.string if soup.title else ""
-        h1 = soup.find('h1').get_text().strip() if soup.find('h1') else ""
+        if response["status"] == 304:
+            # Nothing for the crawl log to write, so checkpointed right away
+            writer.revalidated(url, response["headers"])
+            results[url] = {"url": url, "status": 304, "size": 0, "not_modified": True}
+            heartbeat_progress()
+            return
         
-        # Extract meta description
-        meta_desc = ""
-        meta_tag = soup.find('meta', attrs={'name': 'description'})
-        if meta_tag:
-            meta_desc = meta_tag.get('content', '')
-
-        # Extract canonical
-        canonical_url = ""
-        canonical_tag = soup.find('link', attrs={'rel': 'canonical'})
-        if canonical_tag:
-            canonical_url = canonical_tag.get('href', '')
-            # Resolve relative canonicals
-            canonical_url = urljoin(url, canonical_url)
-
-        # Extract links
-        links = []
-        for a_tag in soup.find_all('a', href=True):
-            href = a_tag['href']
-            text = a_tag.get_text().strip()
-            rel = a_tag.get('rel', [])
-            
-            try:
-                absolute_url = urljoin(url, href)
-                parsed_base = urlparse(url)
-                parsed_link = urlparse(absolute_url)
-                
-                is_internal = parsed_link.netloc == parsed_base.netloc
-                
-                links.append({
-                    "url": absolute_url,
-                    "text": text[:100], # Limit text length
-                    "isInternal": is_internal,
-                    "rel": " ".join(rel) if isinstance(rel, list) else str(rel)
-                })
-            except Exception:
-                continue
-
-        # Clean body text
-        # Remove scripts and styles
-        for script in soup(["script", "style"]):
-            script.decompose()
-        text = soup.get_text(separator=' ', strip=True)
-
-        return {
-            "url": url,
-            "title": title,
-            "h1": h1,
-            "metaDescription": meta_desc,
-            "canonicalUrl": canonical_url,
-            "links": links,
-            "text": text,
-            "wordCount": len(text.split())
-        }
+        seq = writer.add(url, response["html"], response["headers"], response["status"])
+        compact = {"url": url, "status": response["status"], "size": len(response["html"])}
+        body_ref = await _store_body(response["html"])
+        if body_ref:
+            compact["body_ref"] = body_ref
+        pending.append((seq, compact))
+    
+    writer.add_flush_listener(on_flush)
+    try:
+        await frontier.run(crawl)
+        # Rows the writer has not written yet go out with this batch
+        await asyncio.to_thread(writer.flush)
+    finally:
+        writer.remove_flush_listener(on_flush)
+    checkpoint_written(writer.written_through())
+    
+    # Returned even if their crawl log rows could not be written yet
+    results.update({result["url"]: result for _, result in pending})
+    # A flush callback still queued on the loop then has nothing to checkpoint
+    pending.clear()
+    results.update(failures)
+    ordered = [results[url] for url in dict.fromkeys(urls)]
+    failed = len(failures)
+    not_modified = sum(1 for r in ordered if r.get("not_modified"))
+    activity.logger.info(f"Crawled batch of {len(ordered)} URLs ({failed} failed, {not_modified} not modified)")
+    
+    return {
+        "results": ordered,
+        "fetched": len(ordered) - failed,
+        "failed": failed,
+        "not_modified": not_modified,
+        "resumed": len(checkpoint),
+        "crawl_log": writer.stats()
+    }
+
+@activity.defn
+async def parse_html(html: str, url: str, body_ref: str = None) -> dict:
+    """
+    Extract page fields. With body_ref (from fetch_html / crawl_batch) the
+    body is streamed from the blob store and html is ignored.
+    """
+    activity.logger.info(f"Parsing HTML for: {url}")
+    engine = os.getenv('PARSE_HTML_ENGINE', 'bs4').lower()
+    try:
+        if body_ref:
+            return await _run_cpu(extract_ref, body_ref, url, engine)
+        return await _run_cpu(extract, html, url, engine)
     except Exception as e:
         activity.logger.error(f"Failed to parse HTML: {e}")
         raise e
 
 @activity.defn
-async def run_tspr(project_id: str) -> dict:
-    return calculate_tspr(project_id)
+async def run_tspr(project_id: str, pages: list[dict] = None, topics: dict = None,
+                   incremental: bool = False) -> dict:
+    """
+    Topic-Sensitive PageRank for a project. topics maps a topic name to
+    seed URLs. With incremental=True, pages are the recrawled pages and the
+    run warm-starts from the persisted graph and scores; see
+    scoring.calculate_tspr for graph source and output.
+    """
+    return await _run_cpu(calculate_tspr, project_id, pages, topics, incremental)
 
 @activity.defn
 async def analyze_content_depth(text: str) -> float:
-    return calculate_content_depth(text)
+    return await _run_cpu(calculate_content_depth, text)
+
+@activity.defn
+async def compute_clusters(embeddings: list[dict] = None, site_id: str = None, warm_start: bool = False):
+    """
+    Cluster the given embeddings and return per-page assignments, or with
+    site_id, stream the site's embeddings from ClickHouse, write the
+    assignments back in bulk and return only summary statistics.
+    """
+    if site_id is not None:
+        return await _run_cpu(cluster_site, site_id, warm_start)
+    return await _run_cpu(cluster_content, embeddings or [])
 
 @activity.defn
-async def compute_clusters(embeddings: list[dict]) -> list[dict]:
-    return cluster_content(embeddings)
+async def update_clusters(embeddings: list[dict], centroids: list = None) -> dict:
+    """
+    MiniBatchKMeans clustering returning centroids; pass them back in to
+    warm-start the next run.
+    """
+    return await _run_cpu(recluster_content, embeddings, centroids)
 
 @activity.defn
 async def compute_composite_score(tspr: float, depth: float, risk: float, ux: float) -> float:
     return calculate_composite_score(tspr, depth, risk, ux)
+
+@activity.defn
+async def analyze_content_depth_batch(word_counts: list[int] = None, texts: list[str] = None) -> list[float]:
+    """
+    Content depth for many pages in one activity. Pass the wordCount values
+    from parse_html; texts are only split when counts are not available.
+    """
+    if word_counts is None:
+        return await _run_cpu(content_depth_batch, None, texts or [])
+    return content_depth_batch(word_counts)
+
+@activity.defn
+async def compute_composite_score_batch(tspr: list[float], depth: list[float],
+                                        risk: list[float] = None, ux: list[float] = None) -> list[float]:
+    """Composite scores for many pages in one activity (risk defaults to 0, ux to 100)."""
+    return composite_scores(
+        tspr, depth,
+        0 if risk is None else risk,
+        100 if ux is None else ux
+    ).tolist()
@@ -0,0 +1,194 @@
+import os
+import gzip
+import logging
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from .clickhouse_client import get_clickhouse_client
+from .crawl_log import CRAWL_BODIES_DDL, body_hash
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+class LocalBlobStore:
+    """
+    Content-addressed page bodies on local disk, gzip-compressed.
+    Files are written atomically, so concurrent puts of one body are safe.
+    """
+
+    scheme = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def check(self) -> None:
+        """Create the root and fail unless it is writable."""
+        os.makedirs(self.root, exist_ok=True)
+        if not os.access(self.root, os.W_OK):
+            raise PermissionError(f"Blob store directory is not writable: {self.root}")
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.html.gz")
+
+    def put(self, html: str) -> str:
+        """Store a body and return its reference."""
+        digest = body_hash(html)
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=5) as f:
+                    f.write(html.encode('utf-8', errors='replace'))
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        return f"{self.scheme}:{digest}"
+
+    def iter_chunks(self, digest: str, chunk_size: int = CHUNK_SIZE):
+        """Stream a stored body as text chunks."""
+        with gzip.open(self._path(digest), 'rt', encoding='utf-8', errors='replace') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+class ClickHouseBlobStore:
+    """
+    Page bodies in the crawl_bodies table (shared with dedup crawl log
+    storage). Each thread uses its own client. Puts are fire-and-forget
+    async inserts deduplicated on the body hash; bodies already written
+    by this process are skipped. Reads stream `fetch_size` characters per
+    query and wait up to `read_timeout` seconds for a body not yet flushed.
+    """
+
+    scheme = "clickhouse"
+
+    def __init__(self, client_factory, seen_hashes: int = 100000,
+                 fetch_size: int = 1024 * 1024, read_timeout: float = 5.0):
+        self.client_factory = client_factory
+        self.seen_hashes = seen_hashes
+        self.fetch_size = fetch_size
+        self.read_timeout = read_timeout
+        self._local = threading.local()
+        self._schema_ready = False
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.client_factory()
+            if not self._schema_ready:
+                client.command(CRAWL_BODIES_DDL)
+                self._schema_ready = True
+        return client
+
+    def check(self) -> None:
+        """Connect and create crawl_bodies."""
+        self._get_client()
+
+    def put(self, html: str) -> str:
+        digest = body_hash(html)
+        with self._lock:
+            seen = digest in self._seen
+        if not seen:
+            self._get_client().insert(
+                'crawl_bodies',
+                [[digest, html, len(html), datetime.now()]],
+                column_names=['body_hash', 'html', 'size', 'first_seen'],
+                settings={
+                    'async_insert': 1,
+                    'wait_for_async_insert': 0,
+                    'async_insert_deduplicate': 1,
+                    'insert_deduplication_token': digest
+                }
+            )
+            with self._lock:
+                self._seen[digest] = None
+                while len(self._seen) > self.seen_hashes:
+                    self._seen.popitem(last=False)
+        return f"{self.scheme}:{digest}"
+
+    def _read_range(self, digest: str, offset: int):
+        """Characters [offset, offset + fetch_size) of a body (1-based), or None if it is not stored."""
+        rows = self._get_client().query(
+            "SELECT substringUTF8(html, %(offset)s, %(length)s) FROM crawl_bodies "
+            "WHERE body_hash = %(hash)s LIMIT 1",
+            parameters={'hash': digest, 'offset': offset, 'length': self.fetch_size}
+        ).result_rows
+        return rows[0][0] if rows else None
+
+    def iter_chunks(self, digest: str, chunk_size: int = CHUNK_SIZE):
+        """Stream a stored body as text chunks, one range query per `fetch_size` characters."""
+        text = self._read_range(digest, 1)
+        deadline = time.monotonic() + self.read_timeout
+        while text is None and time.monotonic() < deadline:
+            # Async insert not flushed yet
+            time.sleep(0.1)
+            text = self._read_range(digest, 1)
+        if text is None:
+            raise KeyError(f"Body not found: {digest}")
+
+        offset = 1
+        while True:
+            for start in range(0, len(text), chunk_size):
+                yield text[start:start + chunk_size]
+            if len(text) < self.fetch_size:
+                return
+            offset += self.fetch_size
+            text = self._read_range(digest, offset) or ""
+
+# Shared stores per scheme (created on first use)
+_stores = {}
+
+def get_blob_store(scheme: str = None):
+    """
+    Return the process-wide blob store for a scheme (default BLOB_STORE:
+    "clickhouse", or "local" under BLOB_STORE_DIR).
+
+    Bodies are put by fetch_html / crawl_batch and read by parse_html,
+    which may run on another worker replica, so BLOB_STORE_DIR must be a
+    volume shared by all replicas; it has no default.
+    """
+    scheme = scheme or os.getenv('BLOB_STORE', 'clickhouse').lower()
+    store = _stores.get(scheme)
+    if store is None:
+        if scheme == "local":
+            root = os.getenv('BLOB_STORE_DIR', '').strip()
+            if not root:
+                raise ValueError("BLOB_STORE=local needs BLOB_STORE_DIR (a volume shared by all workers)")
+            store = LocalBlobStore(root)
+        elif scheme == "clickhouse":
+            store = ClickHouseBlobStore(get_clickhouse_client)
+        else:
+            raise ValueError(f"Unknown blob store: {scheme}")
+        _stores[scheme] = store
+    return store
+
+def check_blob_store() -> str:
+    """
+    Set up the configured blob store at worker startup, so a missing
+    BLOB_STORE_DIR or an unreachable store fails there and not mid-crawl.
+    Returns the scheme.
+    """
+    store = get_blob_store()
+    store.check()
+    return store.scheme
+
+def iter_body(ref: str, chunk_size: int = CHUNK_SIZE):
+    """Stream the body behind a reference returned by `put`."""
+    scheme, _, digest = ref.partition(':')
+    if not digest:
+        raise ValueError(f"Invalid body reference: {ref}")
+    return get_blob_store(scheme).iter_chunks(digest, chunk_size)
+
+def read_body(ref: str) -> str:
+    return "".join(iter_body(ref))
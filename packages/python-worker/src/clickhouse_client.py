@@ -0,0 +1,12 @@
+import os
+import clickhouse_connect
+
+# Initialize ClickHouse client
+def get_clickhouse_client():
+    return clickhouse_connect.get_client(
+        host=os.getenv('CLICKHOUSE_HOST', 'localhost'),
+        port=int(os.getenv('CLICKHOUSE_PORT', 8123)),
+        username=os.getenv('CLICKHOUSE_USER', 'default'),
+        password=os.getenv('CLICKHOUSE_PASSWORD', ''),
+        secure=os.getenv('CLICKHOUSE_SECURE', 'False').lower() == 'true'
+    )
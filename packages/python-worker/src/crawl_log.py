@@ -0,0 +1,521 @@
+import os
+import time
+import bisect
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .clickhouse_client import get_clickhouse_client
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['url', 'html', 'headers', 'status', 'timestamp']
+DEDUP_COLUMNS = ['url', 'body_hash', 'size', 'headers', 'status', 'timestamp']
+
+RAW_CRAWL_LOG_DDL = """
+    CREATE TABLE IF NOT EXISTS raw_crawl_log (
+        url String,
+        html String,
+        headers String,
+        status UInt16,
+        timestamp DateTime
+    ) ENGINE = MergeTree()
+    ORDER BY (timestamp, url)
+"""
+
+# Dedup storage: each unique body stored once, compressed, keyed by hash
+CRAWL_BODIES_DDL = """
+    CREATE TABLE IF NOT EXISTS crawl_bodies (
+        body_hash FixedString(32),
+        html String CODEC(ZSTD(3)),
+        size UInt32,
+        first_seen DateTime
+    ) ENGINE = ReplacingMergeTree()
+    ORDER BY body_hash
+"""
+
+CRAWL_LOG_DDL = """
+    CREATE TABLE IF NOT EXISTS crawl_log (
+        url String,
+        body_hash FixedString(32),
+        size UInt32,
+        headers Map(String, String),
+        status UInt16,
+        timestamp DateTime
+    ) ENGINE = MergeTree()
+    ORDER BY (url, timestamp)
+"""
+
+# Latest ETag / Last-Modified per URL for conditional recrawls
+CRAWL_VALIDATORS_DDL = """
+    CREATE TABLE IF NOT EXISTS crawl_validators (
+        url String,
+        etag String,
+        last_modified String,
+        updated DateTime
+    ) ENGINE = ReplacingMergeTree(updated)
+    ORDER BY url
+"""
+
+def extract_validators(headers: dict):
+    """
+    Return (etag, last_modified) from response headers, or None if the
+    response carried neither.
+    """
+    etag, last_modified = "", ""
+    for name, value in (headers or {}).items():
+        lowered = name.lower()
+        if lowered == 'etag':
+            etag = str(value)
+        elif lowered == 'last-modified':
+            last_modified = str(value)
+    return (etag, last_modified) if etag or last_modified else None
+
+def conditional_headers(validators) -> dict:
+    """Request headers revalidating a cached (etag, last_modified) pair."""
+    if not validators:
+        return {}
+    etag, last_modified = validators
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+def body_hash(html: str) -> str:
+    """Content hash of a page body (32 hex chars)."""
+    return hashlib.blake2b(html.encode('utf-8', errors='replace'), digest_size=16).hexdigest()
+
+class CrawlLogWriter:
+    """
+    Process-wide buffered writer for the crawl log.
+
+    With storage="raw" each row goes to raw_crawl_log with its full HTML.
+    With storage="dedup" bodies are content-hashed: each unique body is
+    written once to crawl_bodies (ZSTD-compressed) and crawl_log rows
+    reference it by hash, with headers as a Map column. Hashes already
+    written by this process, or found in crawl_bodies, are not resent.
+
+    ETag / Last-Modified validators seen in responses are kept per URL in
+    crawl_validators (and an in-process LRU) so recrawls can revalidate.
+    A 304 is recorded with `revalidated`, which writes no crawl log row.
+
+    Rows are appended to an in-memory columnar buffer and written as one
+    bulk insert when `batch_rows` rows or `batch_bytes` of HTML are
+    buffered, or every `flush_interval` seconds from a background thread.
+    Failed inserts are put back at the head of the buffer; once the buffer
+    holds more than `max_buffer_rows` the oldest rows are dropped.
+
+    `add` returns a row sequence number. After each successful flush the
+    flush listeners are called with `written_through()`, the highest
+    sequence number up to which every row has been written or dropped;
+    `is_written(seq)` then tells written rows from dropped ones, so
+    callers can checkpoint without forcing flushes of their own. The
+    background thread logs `stats()` every `stats_interval` seconds.
+    """
+
+    def __init__(self, client_factory, batch_rows: int = 1000,
+                 batch_bytes: int = 32 * 1024 * 1024, flush_interval: float = 5.0,
+                 max_buffer_rows: int = 50000, storage: str = "raw",
+                 seen_hashes: int = 100000, validator_cache: int = 100000,
+                 stats_interval: float = 60.0):
+        if storage not in ("raw", "dedup"):
+            raise ValueError(f"Unknown crawl log storage: {storage}")
+        self.client_factory = client_factory
+        self.storage = storage
+        self.table = 'raw_crawl_log' if storage == "raw" else 'crawl_log'
+        self.column_names = COLUMNS if storage == "raw" else DEDUP_COLUMNS
+        self.seen_hashes = seen_hashes
+        self.validator_cache = validator_cache
+        self.batch_rows = batch_rows
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.max_buffer_rows = max_buffer_rows
+        self.stats_interval = stats_interval
+        self._client = None
+        self._lookup_client = None
+        self._lookup_lock = threading.Lock()
+        self._schema_ready = False
+        self._columns = self._empty_columns()
+        self._seqs = []
+        self._in_flight = []
+        self._seq = 0
+        # Sequence ranges [first, last] of dropped rows, in order
+        self._dropped = []
+        self._listeners = []
+        self._bodies = {}
+        self._seen = OrderedDict()
+        self._validators = {}
+        self._known_validators = OrderedDict()
+        self._buffered_bytes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.bodies_written = 0
+        self.bodies_deduplicated = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    def _empty_columns(self) -> dict:
+        return {name: [] for name in self.column_names}
+
+    def ensure_schema(self) -> None:
+        """Create the crawl log tables once per process."""
+        if not self._schema_ready:
+            client = self._get_client()
+            if self.storage == "raw":
+                client.command(RAW_CRAWL_LOG_DDL)
+            else:
+                client.command(CRAWL_BODIES_DDL)
+                client.command(CRAWL_LOG_DDL)
+            client.command(CRAWL_VALIDATORS_DDL)
+            self._schema_ready = True
+
+    def start(self) -> None:
+        """Set up the schema and start the background flush thread."""
+        try:
+            self.ensure_schema()
+        except Exception as e:
+            # Retried on first flush
+            logger.error(f"Failed to set up crawl log schema: {e}")
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="crawl-log-writer", daemon=True)
+            self._thread.start()
+
+    def add(self, url: str, html: str, headers: dict, status: int) -> int:
+        """Buffer one crawl log row; returns its sequence number."""
+        if self.storage == "raw":
+            row = {'url': url, 'html': html, 'headers': str(headers), 'status': status}
+            new_bytes = len(html)
+        else:
+            digest = body_hash(html)
+            row = {
+                'url': url,
+                'body_hash': digest,
+                'size': len(html),
+                'headers': {str(k): str(v) for k, v in (headers or {}).items()},
+                'status': status
+            }
+        row['timestamp'] = datetime.now()
+        validators = extract_validators(headers) if status in (200, 304) else None
+
+        with self._lock:
+            self._record_validators(url, validators, status, row['timestamp'])
+            if self.storage == "dedup":
+                new_bytes = 0
+                if digest in self._seen or digest in self._bodies:
+                    self.bodies_deduplicated += 1
+                else:
+                    self._bodies[digest] = html
+                    new_bytes = len(html)
+            for name in self.column_names:
+                self._columns[name].append(row[name])
+            self._seq += 1
+            seq = self._seq
+            self._seqs.append(seq)
+            self._buffered_bytes += new_bytes
+            due = len(self._columns['url']) >= self.batch_rows or self._buffered_bytes >= self.batch_bytes
+        if due:
+            self._wakeup.set()
+        return seq
+
+    def revalidated(self, url: str, headers: dict) -> None:
+        """
+        Record a 304. The page is unchanged, so no crawl log row or body is
+        buffered; validators carried by the response are refreshed.
+        """
+        with self._lock:
+            self._record_validators(url, extract_validators(headers), 304, datetime.now())
+
+    def written_through(self) -> int:
+        """Highest sequence number up to which every added row has been written or dropped."""
+        with self._lock:
+            return self._written_through()
+
+    def _written_through(self) -> int:
+        oldest = [seqs[0] for seqs in (self._seqs, self._in_flight) if seqs]
+        return min(oldest) - 1 if oldest else self._seq
+
+    def is_written(self, seq: int) -> bool:
+        """Whether the row with this sequence number was written (not pending or dropped)."""
+        with self._lock:
+            if seq > self._written_through():
+                return False
+            i = bisect.bisect_right(self._dropped, [seq, float('inf')]) - 1
+            return i < 0 or self._dropped[i][1] < seq
+
+    def add_flush_listener(self, listener) -> None:
+        """Call listener(written_through) after every successful flush (from the flushing thread)."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_flush_listener(self, listener) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def flush(self) -> int:
+        """
+        Write everything buffered as one columnar insert.
+
+        Returns:
+            Number of rows written (0 when empty or on failure)
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = self._columns
+                bodies = self._bodies
+                validators = self._validators
+                batch_bytes = self._buffered_bytes
+                self._in_flight = self._seqs
+                self._seqs = []
+                self._columns = self._empty_columns()
+                self._bodies = {}
+                self._validators = {}
+                self._buffered_bytes = 0
+            n_rows = len(batch['url'])
+            if not n_rows and not validators:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self.ensure_schema()
+                client = self._get_client()
+                if bodies:
+                    self._write_bodies(client, bodies)
+                if n_rows:
+                    client.insert(
+                        self.table,
+                        [batch[name] for name in self.column_names],
+                        column_names=self.column_names,
+                        column_oriented=True
+                    )
+                if validators:
+                    urls = list(validators)
+                    client.insert(
+                        'crawl_validators',
+                        [urls] + [[validators[u][i] for u in urls] for i in range(3)],
+                        column_names=['url', 'etag', 'last_modified', 'updated'],
+                        column_oriented=True
+                    )
+            except Exception as e:
+                logger.error(f"Failed to write {n_rows} crawl log rows: {e}")
+                self.failed_flushes += 1
+                self._client = None
+                self._requeue(batch, bodies, validators, batch_bytes)
+                return 0
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._in_flight = []
+                listeners = list(self._listeners)
+            self.flushes += 1
+            self.rows_written += n_rows
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+        written = self.written_through()
+        for listener in listeners:
+            try:
+                listener(written)
+            except Exception as e:
+                logger.error(f"Crawl log flush listener failed: {e}")
+        return n_rows
+
+    def _write_bodies(self, client, bodies: dict) -> None:
+        """Insert bodies not already stored in crawl_bodies."""
+        hashes = list(bodies)
+        existing = client.query(
+            "SELECT body_hash FROM crawl_bodies WHERE body_hash IN %(hashes)s",
+            parameters={'hashes': hashes}
+        ).result_rows
+        stored = {row[0] for row in existing}
+        new = [h for h in hashes if h not in stored]
+        if new:
+            now = datetime.now()
+            client.insert(
+                'crawl_bodies',
+                [new, [bodies[h] for h in new], [len(bodies[h]) for h in new], [now] * len(new)],
+                column_names=['body_hash', 'html', 'size', 'first_seen'],
+                column_oriented=True
+            )
+        self.bodies_written += len(new)
+        self.bodies_deduplicated += len(hashes) - len(new)
+        for h in hashes:
+            self._seen[h] = None
+            self._seen.move_to_end(h)
+        while len(self._seen) > self.seen_hashes:
+            self._seen.popitem(last=False)
+
+    def _record_validators(self, url: str, validators, status: int, timestamp) -> None:
+        """Track validator changes for url (caller holds the lock)."""
+        if status not in (200, 304) or (status == 304 and validators is None):
+            # Errors say nothing about validators; a bare 304 keeps the old ones
+            return
+        previous = self._known_validators.get(url)
+        if status == 304 and previous:
+            # A 304 only refreshes the validators it carries
+            validators = (validators[0] or previous[0], validators[1] or previous[1])
+        if validators != previous and (validators or previous):
+            etag, last_modified = validators or ("", "")
+            self._validators[url] = (etag, last_modified, timestamp)
+        self._remember_validators(url, validators)
+
+    def _remember_validators(self, url: str, validators) -> None:
+        self._known_validators[url] = validators
+        self._known_validators.move_to_end(url)
+        while len(self._known_validators) > self.validator_cache:
+            self._known_validators.popitem(last=False)
+
+    def get_validators(self, urls: list) -> dict:
+        """
+        Look up the latest (etag, last_modified) for each URL.
+
+        Served from the in-process cache where possible; the rest are read
+        from crawl_validators in one query. URLs without validators are
+        omitted from the result.
+        """
+        found, missing = {}, []
+        with self._lock:
+            for url in dict.fromkeys(urls):
+                if url in self._known_validators:
+                    if self._known_validators[url]:
+                        found[url] = self._known_validators[url]
+                else:
+                    missing.append(url)
+        if not missing:
+            return found
+
+        try:
+            with self._lookup_lock:
+                if self._lookup_client is None:
+                    self._lookup_client = self.client_factory()
+                rows = self._lookup_client.query(
+                    "SELECT url, argMax(etag, updated), argMax(last_modified, updated) "
+                    "FROM crawl_validators WHERE url IN %(urls)s GROUP BY url",
+                    parameters={'urls': missing}
+                ).result_rows
+        except Exception as e:
+            logger.warning(f"Failed to load crawl validators: {e}")
+            self._lookup_client = None
+            return found
+
+        loaded = {row[0]: (row[1], row[2]) for row in rows if row[1] or row[2]}
+        with self._lock:
+            for url in missing:
+                # Buffered but unflushed updates win over what ClickHouse has
+                if url not in self._known_validators:
+                    self._remember_validators(url, loaded.get(url))
+                if self._known_validators.get(url):
+                    found[url] = self._known_validators[url]
+        return found
+
+    def _requeue(self, batch: dict, bodies: dict, validators: dict, batch_bytes: int) -> None:
+        with self._lock:
+            self._seqs = self._in_flight + self._seqs
+            self._in_flight = []
+            for name in self.column_names:
+                self._columns[name] = batch[name] + self._columns[name]
+            self._bodies = {**bodies, **self._bodies}
+            self._validators = {**validators, **self._validators}
+            self._buffered_bytes += batch_bytes
+            overflow = len(self._columns['url']) - self.max_buffer_rows
+            if overflow > 0:
+                if self.storage == "raw":
+                    self._buffered_bytes -= sum(len(h) for h in self._columns['html'][:overflow])
+                for name in self.column_names:
+                    del self._columns[name][:overflow]
+                first, last = self._seqs[0], self._seqs[overflow - 1]
+                if self._dropped and self._dropped[-1][1] == first - 1:
+                    self._dropped[-1][1] = last
+                else:
+                    self._dropped.append([first, last])
+                del self._seqs[:overflow]
+                self.rows_dropped += overflow
+                logger.error(f"Crawl log buffer full, dropped {overflow} oldest rows")
+
+    def _run(self) -> None:
+        last_stats = time.monotonic()
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self.stats_interval > 0 and time.monotonic() - last_stats >= self.stats_interval:
+                last_stats = time.monotonic()
+                logger.info(f"Crawl log writer: {self.stats()}")
+
+    def close(self) -> None:
+        """Stop the flush thread and write any remaining rows."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self._columns['url'])
+
+    def stats(self) -> dict:
+        """Queue depth and flush latency metrics."""
+        return {
+            "queue_depth": self.queue_depth(),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "bodies_written": self.bodies_written,
+            "bodies_deduplicated": self.bodies_deduplicated,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0
+        }
+
+# Shared writer (created on first use)
+_writer = None
+
+def get_crawl_log_writer() -> CrawlLogWriter:
+    """
+    Return the process-wide crawl log writer.
+    Batching comes from CRAWL_LOG_BATCH_ROWS / CRAWL_LOG_BATCH_MB /
+    CRAWL_LOG_FLUSH_SECONDS / CRAWL_LOG_MAX_BUFFER_ROWS; CRAWL_LOG_STORAGE
+    selects "raw" (default) or "dedup" storage. Stats are logged every
+    CRAWL_LOG_STATS_SECONDS (0 disables).
+    """
+    global _writer
+    if _writer is None:
+        _writer = CrawlLogWriter(
+            get_clickhouse_client,
+            batch_rows=int(os.getenv('CRAWL_LOG_BATCH_ROWS', 1000)),
+            batch_bytes=int(float(os.getenv('CRAWL_LOG_BATCH_MB', 32)) * 1024 * 1024),
+            flush_interval=float(os.getenv('CRAWL_LOG_FLUSH_SECONDS', 5)),
+            max_buffer_rows=int(os.getenv('CRAWL_LOG_MAX_BUFFER_ROWS', 50000)),
+            storage=os.getenv('CRAWL_LOG_STORAGE', 'raw').lower(),
+            validator_cache=int(os.getenv('CRAWL_VALIDATOR_CACHE', 100000)),
+            stats_interval=float(os.getenv('CRAWL_LOG_STATS_SECONDS', 60))
+        )
+    return _writer
+
+def close_crawl_log_writer() -> None:
+    """Flush and stop the shared writer (worker shutdown)."""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+    _writer = None
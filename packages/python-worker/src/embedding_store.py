@@ -0,0 +1,102 @@
+import os
+import logging
+from datetime import datetime
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# page_clusters and clusters are created by setup-clickhouse-schema.ts
+# (or clickhouse/schema.sql plus migrations/006_clusters_columns.sql for
+# older clusters tables); activities never run DDL. Latest assignment per page wins on
+# merge in page_clusters: readers take argMax(cluster_id, updated).
+
+def load_site_embeddings(client, site_id: str, block_rows: int = None) -> tuple:
+    """
+    Stream a site's rows from page_embeddings into a preallocated float32
+    matrix, one ClickHouse block (CLUSTER_STREAM_BLOCK_ROWS rows) at a time.
+
+    Returns:
+        (page_ids, matrix of shape (pages, dimension))
+
+    Raises:
+        ValueError: if the site's embeddings differ in dimension
+    """
+    block_rows = block_rows or int(os.getenv('CLUSTER_STREAM_BLOCK_ROWS', 8192))
+    params = {'site_id': site_id}
+    n_rows, min_dimension, dimension = client.query(
+        "SELECT count(), min(length(embedding)), max(length(embedding)) "
+        "FROM page_embeddings WHERE site_id = %(site_id)s",
+        parameters=params
+    ).result_rows[0]
+    if n_rows and min_dimension != dimension:
+        raise ValueError(
+            f"Embeddings for site {site_id} have mixed dimensions ({min_dimension} to {dimension}); "
+            "re-embed the site with a single model before clustering"
+        )
+    page_ids = []
+    matrix = np.empty((n_rows, dimension or 0), dtype=np.float32)
+
+    offset = 0
+    with client.query_column_block_stream(
+        "SELECT page_id, embedding FROM page_embeddings WHERE site_id = %(site_id)s",
+        parameters=params,
+        settings={'max_block_size': block_rows}
+    ) as stream:
+        for ids, embeddings in stream:
+            # Rows inserted after the count are left for the next run
+            take = min(len(ids), n_rows - offset)
+            if take <= 0:
+                break
+            matrix[offset:offset + take] = embeddings[:take]
+            page_ids.extend(ids[:take])
+            offset += take
+
+    if offset < n_rows:
+        matrix = matrix[:offset]
+    return page_ids, matrix
+
+def load_site_centroids(client, site_id: str):
+    """Centroids from the last clustering of a site (ordered by cluster_id), or None."""
+    rows = client.query(
+        "SELECT cluster_id, centroid_embedding FROM clusters "
+        "WHERE site_id = %(site_id)s AND notEmpty(centroid_embedding)",
+        parameters={'site_id': site_id}
+    ).result_rows
+    rows = [row for row in rows if len(row[1])]
+    if not rows or len({len(row[1]) for row in rows}) > 1:
+        return None
+    rows.sort(key=lambda row: (not row[0].isdigit(), int(row[0]) if row[0].isdigit() else 0, row[0]))
+    return np.asarray([row[1] for row in rows], dtype=np.float32)
+
+def write_site_clusters(client, site_id: str, page_ids: list, labels: np.ndarray,
+                        centroids: np.ndarray, batch_rows: int = None) -> int:
+    """
+    Bulk-write page assignments to page_clusters (columnar inserts of
+    CLUSTER_WRITE_BATCH_ROWS rows) and replace the site's centroid rows in
+    clusters. Keyword clusters of the site are left alone.
+    """
+    batch_rows = batch_rows or int(os.getenv('CLUSTER_WRITE_BATCH_ROWS', 100000))
+    now = datetime.now()
+    cluster_ids = [str(label) for label in labels.tolist()]
+
+    for start in range(0, len(page_ids), batch_rows):
+        end = min(start + batch_rows, len(page_ids))
+        client.insert(
+            'page_clusters',
+            [[site_id] * (end - start), page_ids[start:end], cluster_ids[start:end], [now] * (end - start)],
+            column_names=['site_id', 'page_id', 'cluster_id', 'updated'],
+            column_oriented=True
+        )
+
+    sizes = np.bincount(labels, minlength=len(centroids))
+    client.command(
+        "DELETE FROM clusters WHERE site_id = %(site_id)s AND notEmpty(centroid_embedding)",
+        parameters={'site_id': site_id}
+    )
+    client.insert(
+        'clusters',
+        [[site_id, str(i), "", int(sizes[i]), centroids[i].tolist(), now] for i in range(len(centroids))],
+        column_names=['site_id', 'cluster_id', 'label', 'page_count', 'centroid_embedding', 'created_at']
+    )
+    logger.info(f"Wrote {len(page_ids)} cluster assignments and {len(centroids)} clusters for site {site_id}")
+    return len(page_ids)
@@ -0,0 +1,225 @@
+import os
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+
+SKIP_TEXT_TAGS = frozenset(("script", "style"))
+
+def _link(base_netloc: str, page_url: str, href: str, text: str, rel: str):
+    try:
+        absolute_url = urljoin(page_url, href)
+        is_internal = urlparse(absolute_url).netloc == base_netloc
+    except Exception:
+        return None
+    return {
+        "url": absolute_url,
+        "text": text[:100], # Limit text length
+        "isInternal": is_internal,
+        "rel": rel
+    }
+
+def _result(url: str, title, h1: str, meta_desc: str, canonical_url: str, links: list, text: str) -> dict:
+    return {
+        "url": url,
+        "title": title,
+        "h1": h1,
+        "metaDescription": meta_desc,
+        "canonicalUrl": canonical_url,
+        "links": links,
+        "text": text,
+        "wordCount": len(text.split())
+    }
+
+def extract_bs4(html: str, url: str) -> dict:
+    """Reference extraction with BeautifulSoup's html.parser."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title = soup.title.string if soup.title else ""
+    if title:
+        # Plain str: a NavigableString would drag the whole tree along when pickled
+        title = str(title)
+    h1_tag = soup.find('h1')
+    h1 = h1_tag.get_text().strip() if h1_tag else ""
+
+    # Extract meta description
+    meta_desc = ""
+    meta_tag = soup.find('meta', attrs={'name': 'description'})
+    if meta_tag:
+        meta_desc = meta_tag.get('content', '')
+
+    # Extract canonical
+    canonical_url = ""
+    canonical_tag = soup.find('link', attrs={'rel': 'canonical'})
+    if canonical_tag:
+        # Resolve relative canonicals
+        canonical_url = urljoin(url, canonical_tag.get('href', ''))
+
+    # Extract links
+    base_netloc = urlparse(url).netloc
+    links = []
+    for a_tag in soup.find_all('a', href=True):
+        rel = a_tag.get('rel', [])
+        link = _link(
+            base_netloc, url, a_tag['href'], a_tag.get_text().strip(),
+            " ".join(rel) if isinstance(rel, list) else str(rel)
+        )
+        if link:
+            links.append(link)
+
+    # Clean body text
+    # Remove scripts and styles
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+
+    return _result(url, title, h1, meta_desc, canonical_url, links, text)
+
+class _ExtractTarget:
+    """
+    lxml parser target collecting every field in one pass over the
+    tokenizer events; no tree is built.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.base_netloc = urlparse(url).netloc
+        self.title = ""
+        self._title_seen = False
+        self.h1 = None
+        self.meta_desc = None
+        self.canonical_url = None
+        self.links = []
+        self.chunks = []
+        self._run = []
+        self._skip_depth = 0
+        self._title = None
+        self._h1_depth = 0
+        self._h1 = None
+        self._anchors = []
+
+    def _flush_run(self):
+        # Text between two events is one string, as in BeautifulSoup
+        if self._run:
+            chunk = "".join(self._run).strip()
+            if chunk:
+                self.chunks.append(chunk)
+            self._run = []
+
+    def start(self, tag, attrib):
+        self._flush_run()
+        if tag in SKIP_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag == 'title':
+            if not self._title_seen:
+                self._title_seen = True
+                self._title = []
+        elif tag == 'h1':
+            if self.h1 is None:
+                self._h1_depth += 1
+                if self._h1 is None:
+                    self._h1 = []
+        elif tag == 'a':
+            href = attrib.get('href')
+            self._anchors.append(None if href is None else (href, " ".join(attrib.get('rel', '').split()), []))
+        elif tag == 'meta':
+            if self.meta_desc is None and attrib.get('name') == 'description':
+                self.meta_desc = attrib.get('content', '')
+        elif tag == 'link':
+            if self.canonical_url is None:
+                rel = attrib.get('rel')
+                if rel is not None and (rel == 'canonical' or 'canonical' in rel.split()):
+                    self.canonical_url = urljoin(self.url, attrib.get('href', ''))
+
+    def end(self, tag):
+        self._flush_run()
+        if tag in SKIP_TEXT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == 'title':
+            if self._title is not None:
+                # soup.title.string: None unless the title holds a single string
+                self.title = "".join(self._title) if self._title else None
+                self._title = None
+        elif tag == 'h1':
+            if self._h1_depth:
+                self._h1_depth -= 1
+                if not self._h1_depth:
+                    self.h1 = "".join(self._h1).strip()
+        elif tag == 'a':
+            if self._anchors:
+                anchor = self._anchors.pop()
+                if anchor is not None:
+                    href, rel, text = anchor
+                    link = _link(self.base_netloc, self.url, href, "".join(text).strip(), rel)
+                    if link:
+                        self.links.append(link)
+
+    def data(self, data):
+        if self._skip_depth:
+            return
+        self._run.append(data)
+        if self._title is not None:
+            self._title.append(data)
+        if self._h1_depth:
+            self._h1.append(data)
+        for anchor in self._anchors:
+            if anchor is not None:
+                anchor[2].append(data)
+
+    def comment(self, text):
+        self._flush_run()
+
+    def close(self):
+        self._flush_run()
+        return _result(
+            self.url,
+            self.title,
+            self.h1 if self.h1 is not None else "".join(self._h1 or ()).strip(),
+            self.meta_desc or "",
+            self.canonical_url or "",
+            self.links,
+            " ".join(self.chunks)
+        )
+
+def extract_lxml(html: str, url: str) -> dict:
+    """Single-pass extraction on lxml's C tokenizer (same fields as extract_bs4)."""
+    return _extract_lxml_chunks([html], url)
+
+def _extract_lxml_chunks(chunks, url: str) -> dict:
+    from lxml import etree
+
+    target = _ExtractTarget(url)
+    parser = etree.HTMLParser(target=target, remove_comments=False, recover=True)
+    fed = False
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+            fed = True
+    if not fed:
+        parser.feed(" ")
+    return parser.close()
+
+ENGINES = {
+    "bs4": extract_bs4,
+    "lxml": extract_lxml
+}
+
+def _engine(engine: str = None) -> str:
+    engine = engine or os.getenv('PARSE_HTML_ENGINE', 'bs4').lower()
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown parse engine: {engine}")
+    return engine
+
+def extract(html: str, url: str, engine: str = None) -> dict:
+    """Extract page fields with PARSE_HTML_ENGINE ("bs4" default, or "lxml")."""
+    return ENGINES[_engine(engine)](html, url)
+
+def extract_ref(body_ref: str, url: str, engine: str = None) -> dict:
+    """
+    Extract from a body in the blob store. The lxml engine is fed the
+    body chunk by chunk; bs4 needs the whole document.
+    """
+    from .blob_store import iter_body
+
+    engine = _engine(engine)
+    if engine == "lxml":
+        return _extract_lxml_chunks(iter_body(body_ref), url)
+    return extract_bs4("".join(iter_body(body_ref)), url)
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import logging
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'ApexSEO-Crawler/1.0'
+
+def _accept_encoding() -> str:
+    # aiohttp decodes br only when a brotli binding is installed
+    try:
+        import brotli  # noqa: F401
+        return 'gzip, deflate, br'
+    except ImportError:
+        return 'gzip, deflate'
+
+class AsyncFetcher:
+    """
+    asyncio-native HTTP fetcher backed by one pooled aiohttp session.
+
+    Connections are kept alive and reused across fetches, capped globally
+    by `max_connections` and per host by `max_per_host`. Compressed
+    responses (gzip/deflate, and br when available) are decoded
+    transparently.
+    """
+
+    def __init__(self, max_connections: int = 100, max_per_host: int = 8,
+                 timeout: float = 30, keepalive_timeout: float = 30,
+                 user_agent: str = USER_AGENT):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.user_agent = user_agent
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    'User-Agent': self.user_agent,
+                    'Accept-Encoding': _accept_encoding()
+                },
+                auto_decompress=True
+            )
+        return self._session
+
+    async def fetch(self, url: str, headers: dict = None, timeout: float = None) -> dict:
+        """
+        GET a URL and return {url, status, html, headers}.
+        Network errors propagate to the caller.
+        """
+        session = self._get_session()
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        async with session.get(url, headers=headers, allow_redirects=True, **kwargs) as response:
+            html = await response.text(errors='replace')
+            return {
+                "url": url,
+                "status": response.status,
+                "html": html,
+                "headers": dict(response.headers)
+            }
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+# Shared fetcher per event loop (created on first use)
+_fetcher = None
+_fetcher_loop = None
+
+def get_fetcher() -> AsyncFetcher:
+    """
+    Return the process-wide fetcher for the running event loop.
+    Pool sizes come from CRAWLER_MAX_CONNECTIONS / CRAWLER_MAX_PER_HOST.
+    """
+    global _fetcher, _fetcher_loop
+    loop = asyncio.get_running_loop()
+    if _fetcher is None or _fetcher_loop is not loop:
+        _fetcher = AsyncFetcher(
+            max_connections=int(os.getenv('CRAWLER_MAX_CONNECTIONS', 100)),
+            max_per_host=int(os.getenv('CRAWLER_MAX_PER_HOST', 8)),
+            timeout=float(os.getenv('CRAWLER_TIMEOUT', 30))
+        )
+        _fetcher_loop = loop
+    return _fetcher
+
+async def close_fetcher() -> None:
+    """Close the shared fetcher's connection pool (worker shutdown)."""
+    global _fetcher, _fetcher_loop
+    if _fetcher is not None:
+        await _fetcher.close()
+    _fetcher = None
+    _fetcher_loop = None
@@ -0,0 +1,278 @@
+import math
+import time
+import heapq
+import asyncio
+import hashlib
+from collections import namedtuple
+from urllib.parse import urlparse
+
+FrontierItem = namedtuple('FrontierItem', ['url', 'host', 'depth', 'score'])
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter for URL-seen checks.
+
+    Sized for `capacity` items at `error_rate` false positives; about
+    1.8 MB per million URLs at 0.1%. Positions come from double hashing
+    of one blake2b digest.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> bool:
+        """Add item; returns True if it was not (probably) seen before."""
+        new = False
+        for pos in self._positions(item):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                new = True
+        self.count += new
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self) -> int:
+        return self.count
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts of `burst`.
+    A rate of 0 or less means unlimited.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, now: float = 0.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def set_rate(self, rate: float, now: float) -> None:
+        """Change the rate; tokens accrued so far are kept."""
+        self._refill(now)
+        self.rate = rate
+
+    def consume(self, now: float) -> None:
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+class _Host:
+    __slots__ = ('name', 'items', 'bucket', 'in_flight', 'scheduled')
+
+    def __init__(self, name: str, bucket: TokenBucket):
+        self.name = name
+        self.items = []
+        self.bucket = bucket
+        self.in_flight = 0
+        self.scheduled = False
+
+def host_of(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+class Frontier:
+    """
+    Crawl frontier with per-host politeness.
+
+    URLs are queued per host and ordered by `priority`: "depth" (shallow
+    first, then higher score) or "score" (higher score first, then
+    shallow). Each host has a token bucket (one request per `host_delay`
+    seconds unless robots Crawl-delay is set via `set_crawl_delay`) and at
+    most `per_host_in_flight` requests running; `max_in_flight` caps all
+    hosts together. Seen URLs are tracked in a Bloom filter.
+
+    Use `pop_ready()` / `next_ready_in()` for synchronous scheduling, or
+    `get()` / `done()` / `run()` from asyncio code.
+    """
+
+    def __init__(self, max_in_flight: int = 16, per_host_in_flight: int = 2,
+                 host_delay: float = 1.0, host_burst: int = 1, priority: str = "depth",
+                 seen_capacity: int = 1_000_000, seen_error_rate: float = 0.001,
+                 clock=time.monotonic):
+        if priority not in ("depth", "score"):
+            raise ValueError(f"Unknown frontier priority: {priority}")
+        self.max_in_flight = max_in_flight
+        self.per_host_in_flight = per_host_in_flight
+        self.host_delay = host_delay
+        self.host_burst = host_burst
+        self.priority = priority
+        self.seen = BloomFilter(seen_capacity, seen_error_rate)
+        self._clock = clock
+        self._hosts = {}
+        self._ready = []
+        self._waiting = []
+        self._seq = 0
+        self._changed = None
+        self.pending = 0
+        self.in_flight = 0
+        self.dispatched = 0
+        self.duplicates = 0
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    def _host(self, name: str) -> _Host:
+        host = self._hosts.get(name)
+        if host is None:
+            rate = 1.0 / self.host_delay if self.host_delay > 0 else 0.0
+            host = _Host(name, TokenBucket(rate, self.host_burst, self._clock()))
+            self._hosts[name] = host
+        return host
+
+    def _priority(self, depth: int, score: float) -> tuple:
+        return (depth, -score) if self.priority == "depth" else (-score, depth)
+
+    def _schedule(self, host: _Host, now: float) -> None:
+        if host.scheduled or not host.items or host.in_flight >= self.per_host_in_flight:
+            return
+        wait = host.bucket.wait_time(now)
+        if wait > 0:
+            heapq.heappush(self._waiting, (now + wait, self._next_seq(), host.name))
+        else:
+            heapq.heappush(self._ready, (host.items[0][0], self._next_seq(), host.name))
+        host.scheduled = True
+
+    def _notify(self) -> None:
+        if self._changed is not None:
+            self._changed.set()
+
+    def add(self, url: str, depth: int = 0, score: float = 0.0, check_seen: bool = True) -> bool:
+        """
+        Queue a URL unless it was seen before.
+        With check_seen=False the URL is queued regardless (and marked seen).
+        """
+        if not self.seen.add(url) and check_seen:
+            self.duplicates += 1
+            return False
+        host = self._host(host_of(url))
+        item = FrontierItem(url, host.name, depth, score)
+        heapq.heappush(host.items, (self._priority(depth, score), self._next_seq(), item))
+        self.pending += 1
+        self._schedule(host, self._clock())
+        self._notify()
+        return True
+
+    def set_crawl_delay(self, host: str, delay: float) -> None:
+        """Limit a host (scheme://netloc) to one request per `delay` seconds."""
+        self._host(host).bucket.set_rate(1.0 / delay if delay and delay > 0 else 0.0, self._clock())
+
+    def pop_ready(self):
+        """Next URL allowed to be fetched now, or None."""
+        if self.in_flight >= self.max_in_flight:
+            return None
+        now = self._clock()
+        while self._waiting and self._waiting[0][0] <= now:
+            _, _, name = heapq.heappop(self._waiting)
+            host = self._hosts[name]
+            host.scheduled = False
+            self._schedule(host, now)
+
+        while self._ready:
+            _, _, name = heapq.heappop(self._ready)
+            host = self._hosts[name]
+            host.scheduled = False
+            if host.bucket.wait_time(now) > 0:
+                self._schedule(host, now)
+                continue
+            _, _, item = heapq.heappop(host.items)
+            host.bucket.consume(now)
+            host.in_flight += 1
+            self.in_flight += 1
+            self.pending -= 1
+            self.dispatched += 1
+            self._schedule(host, now)
+            return item
+        return None
+
+    def next_ready_in(self):
+        """
+        Seconds until pop_ready() can return a URL: 0 if one is ready now,
+        None if only done() or add() can unblock the frontier.
+        """
+        if self.in_flight >= self.max_in_flight:
+            return None
+        if self._ready:
+            return 0.0
+        if self._waiting:
+            return max(0.0, self._waiting[0][0] - self._clock())
+        return None
+
+    def done(self, item: FrontierItem) -> None:
+        """Mark a dispatched URL finished, freeing its host and global slot."""
+        host = self._hosts[item.host]
+        host.in_flight -= 1
+        self.in_flight -= 1
+        self._schedule(host, self._clock())
+        self._notify()
+
+    async def get(self):
+        """Wait for the next URL; None once nothing is pending or in flight."""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        while True:
+            item = self.pop_ready()
+            if item is not None:
+                return item
+            if not self.pending and not self.in_flight:
+                return None
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=self.next_ready_in())
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, handler) -> None:
+        """
+        Crawl until the frontier is empty with `max_in_flight` workers.
+        `handler(item)` is awaited per URL and may return new URLs, queued
+        one level deeper.
+        """
+        async def worker():
+            while True:
+                item = await self.get()
+                if item is None:
+                    return
+                try:
+                    links = await handler(item)
+                    for link in links or ():
+                        self.add(link, depth=item.depth + 1)
+                finally:
+                    self.done(item)
+
+        await asyncio.gather(*(worker() for _ in range(self.max_in_flight)))
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "dispatched": self.dispatched,
+            "duplicates": self.duplicates,
+            "hosts": len(self._hosts),
+            "seen": len(self.seen)
+        }
@@ -0,0 +1,74 @@
+import os
+import logging
+from neo4j import GraphDatabase
+
+logger = logging.getLogger(__name__)
+
+def _get_driver():
+    return GraphDatabase.driver(
+        os.getenv('NEO4J_URI', 'bolt://localhost:7687'),
+        auth=(os.getenv('NEO4J_USER', 'neo4j'), os.getenv('NEO4J_PASSWORD', ''))
+    )
+
+def load_project_pages(project_id: str):
+    """
+    Yield the URL of every page of the project, so pages without links
+    are still part of the graph.
+    """
+    driver = _get_driver()
+    try:
+        with driver.session() as session:
+            result = session.run("""
+                MATCH (p:Page)-[:BELONGS_TO]->(:Project {id: $project_id})
+                RETURN p.url AS url
+            """, project_id=project_id)
+            for record in result:
+                yield record["url"]
+    finally:
+        driver.close()
+
+def load_project_edges(project_id: str):
+    """
+    Yield (source_url, target_url) for every LINKS_TO edge leaving a page
+    of the project, streamed from Neo4j.
+    """
+    driver = _get_driver()
+    try:
+        with driver.session() as session:
+            result = session.run("""
+                MATCH (s:Page)-[:BELONGS_TO]->(:Project {id: $project_id})
+                MATCH (s)-[:LINKS_TO]->(t:Page)
+                RETURN s.url AS source, t.url AS target
+            """, project_id=project_id)
+            for record in result:
+                yield record["source"], record["target"]
+    finally:
+        driver.close()
+
+def write_project_scores(project_id: str, urls: list, topic_names: list, scores,
+                         batch_size: int = None) -> int:
+    """
+    Write TSPR scores back to the project's Page nodes in UNWIND batches:
+    the first (global) column as `tspr`, other topics as `tspr_<topic>`.
+    """
+    batch_size = batch_size or int(os.getenv('TSPR_WRITE_BATCH_SIZE', 5000))
+    properties = ["tspr"] + [f"tspr_{name}" for name in topic_names[1:]]
+    driver = _get_driver()
+    written = 0
+    try:
+        with driver.session() as session:
+            for start in range(0, len(urls), batch_size):
+                rows = [
+                    {"url": urls[i], "props": dict(zip(properties, map(float, scores[i])))}
+                    for i in range(start, min(start + batch_size, len(urls)))
+                ]
+                session.run("""
+                    UNWIND $rows AS row
+                    MATCH (p:Page {url: row.url})-[:BELONGS_TO]->(:Project {id: $project_id})
+                    SET p += row.props
+                """, rows=rows, project_id=project_id)
+                written += len(rows)
+    finally:
+        driver.close()
+    logger.info(f"Wrote TSPR scores for {written} pages")
+    return written
@@ -4,14 +4,24 @@ from temporalio.client import Client
 from temporalio.worker import Worker
 from src.activities import (
     fetch_html,
+    crawl_batch,
     parse_html,
     fetch_robots_txt,
     can_fetch,
+    can_fetch_many,
     run_tspr,
     analyze_content_depth,
     compute_clusters,
-    compute_composite_score
+    update_clusters,
+    compute_composite_score,
+    analyze_content_depth_batch,
+    compute_composite_score_batch,
+    start_process_pool,
+    shutdown_process_pool
 )
+from src.fetcher import close_fetcher
+from src.crawl_log import get_crawl_log_writer, close_crawl_log_writer
+from src.blob_store import check_blob_store
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,23 +32,46 @@ async def main():
     
     client = await Client.connect(temporal_host)
 
+    # Schema setup once per worker, then background bulk flushes
+    get_crawl_log_writer().start()
+
+    # Large bodies go by reference from fetch to parse, possibly across
+    # replicas; a misconfigured store fails the worker here
+    if os.getenv('HTML_INLINE_MAX_BYTES', '').strip():
+        print(f"Blob store: {check_blob_store()}")
+
+    # CPU-bound activities (parse, depth, clusters, TSPR) run in this pool,
+    # I/O activities on the event loop
+    pool_size = start_process_pool()
+    print(f"CPU pool: {pool_size} processes" if pool_size else "CPU pool disabled")
+
     worker = Worker(
         client,
         task_queue="seo-python-worker-task-queue",
         activities=[
         fetch_html, 
+        crawl_batch,
         parse_html, 
         fetch_robots_txt, 
         can_fetch,
+        can_fetch_many,
         run_tspr,
         analyze_content_depth,
         compute_clusters,
-        compute_composite_score
+        update_clusters,
+        compute_composite_score,
+        analyze_content_depth_batch,
+        compute_composite_score_batch
     ],
     )
 
     print("Python Worker started. Listening on 'seo-python-worker-task-queue'...")
-    await worker.run()
+    try:
+        await worker.run()
+    finally:
+        await close_fetcher()
+        await asyncio.to_thread(close_crawl_log_writer)
+        shutdown_process_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+USER_AGENT_TOKEN = 'apexseo-crawler'
+
+PRODUCT_TOKEN = re.compile(r'[A-Za-z_-]+')
+
+def product_token(user_agent: str) -> str:
+    """Lowercased product token of a user agent ("ApexSEO-Crawler/1.0" -> "apexseo-crawler")."""
+    match = PRODUCT_TOKEN.match(user_agent.strip())
+    return match.group(0).lower() if match else ""
+
+def _compile_pattern(pattern: str):
+    """Compile a robots.txt path pattern (`*` wildcard, `$` end anchor)."""
+    anchored = pattern.endswith('$')
+    if anchored:
+        pattern = pattern[:-1]
+    regex = '.*'.join(re.escape(part) for part in pattern.split('*'))
+    return re.compile(regex + ('$' if anchored else ''))
+
+class RobotsRules:
+    """
+    robots.txt rules for one user agent, compiled once.
+
+    Matching follows RFC 9309: the longest matching Allow/Disallow pattern
+    wins and Allow wins ties. The group whose user-agent line equals our
+    product token (case-insensitively) is used when present, otherwise
+    the `*` group.
+    """
+
+    def __init__(self, rules: list = None, crawl_delay: float = None, sitemaps: list = None):
+        # (length, allow, compiled) sorted longest first
+        self.rules = sorted(rules or [], key=lambda r: (-r[0], not r[1]))
+        self.crawl_delay = crawl_delay
+        self.sitemaps = sitemaps or []
+
+    @classmethod
+    def parse(cls, content: str, user_agent: str = USER_AGENT_TOKEN) -> "RobotsRules":
+        token = product_token(user_agent)
+        groups = {}
+        sitemaps = []
+        agents, in_rules = [], False
+
+        for raw_line in (content or "").splitlines():
+            line = raw_line.split('#', 1)[0].strip()
+            if ':' not in line:
+                continue
+            field, value = line.split(':', 1)
+            field, value = field.strip().lower(), value.strip()
+
+            if field == 'sitemap':
+                if value:
+                    sitemaps.append(value)
+            elif field == 'user-agent':
+                if in_rules:
+                    agents, in_rules = [], False
+                agents.append('*' if value == '*' else product_token(value))
+                for agent in agents:
+                    groups.setdefault(agent, {"rules": [], "crawl_delay": None})
+            elif field in ('allow', 'disallow', 'crawl-delay') and agents:
+                in_rules = True
+                for agent in agents:
+                    group = groups[agent]
+                    if field == 'crawl-delay':
+                        try:
+                            group["crawl_delay"] = float(value)
+                        except ValueError:
+                            pass
+                    elif value:
+                        group["rules"].append((len(value), field == 'allow', _compile_pattern(value)))
+
+        if token and token in groups:
+            matched = [groups[token]]
+        else:
+            matched = [groups['*']] if '*' in groups else []
+
+        rules = [rule for g in matched for rule in g["rules"]]
+        delays = [g["crawl_delay"] for g in matched if g["crawl_delay"] is not None]
+        return cls(rules, max(delays) if delays else None, sitemaps)
+
+    def can_fetch(self, url: str) -> bool:
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        if path == '/robots.txt':
+            return True
+        for _, allow, pattern in self.rules:
+            if pattern.match(path):
+                return allow
+        return True
+
+class RobotsCache:
+    """
+    Per-domain cache of compiled robots rules with a TTL.
+
+    Keyed by origin (scheme://host[:port]). A separate small LRU keyed by
+    content hash serves callers that pass robots.txt text directly, so the
+    same text is parsed once.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600.0, max_entries: int = 10000,
+                 clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._domains = OrderedDict()
+        self._by_content = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, origin: str):
+        """Return cached RobotsRules for origin, or None on miss/expiry."""
+        with self._lock:
+            entry = self._domains.get(origin)
+            if entry is None or self._clock() >= entry[0]:
+                if entry is not None:
+                    del self._domains[origin]
+                self.misses += 1
+                return None
+            self._domains.move_to_end(origin)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, origin: str, content: str) -> RobotsRules:
+        """Compile robots.txt content and cache it for origin."""
+        rules = self.rules_for_content(content)
+        with self._lock:
+            self._domains[origin] = (self._clock() + self.ttl_seconds, rules)
+            self._domains.move_to_end(origin)
+            while len(self._domains) > self.max_entries:
+                self._domains.popitem(last=False)
+        return rules
+
+    def rules_for_content(self, content: str) -> RobotsRules:
+        """Compiled rules for raw robots.txt text, parsed once per distinct text."""
+        key = hashlib.sha1((content or "").encode('utf-8')).digest()
+        with self._lock:
+            rules = self._by_content.get(key)
+            if rules is not None:
+                self._by_content.move_to_end(key)
+                return rules
+        rules = RobotsRules.parse(content)
+        with self._lock:
+            self._by_content[key] = rules
+            while len(self._by_content) > 256:
+                self._by_content.popitem(last=False)
+        return rules
+
+    def clear(self) -> None:
+        with self._lock:
+            self._domains.clear()
+            self._by_content.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "domains": len(self._domains)}
+
+def origin_of(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+# Shared cache (created on first use)
+_robots_cache = None
+
+def get_robots_cache() -> RobotsCache:
+    """
+    Return the process-wide robots cache.
+    Sized by ROBOTS_CACHE_TTL (seconds) / ROBOTS_CACHE_MAX_DOMAINS.
+    """
+    global _robots_cache
+    if _robots_cache is None:
+        _robots_cache = RobotsCache(
+            ttl_seconds=float(os.getenv('ROBOTS_CACHE_TTL', 3600)),
+            max_entries=int(os.getenv('ROBOTS_CACHE_MAX_DOMAINS', 10000))
+        )
+    return _robots_cache
@@ -1,34 +1,413 @@
 
+import os
+import time
+from array import array
 import numpy as np
+from scipy import sparse
 from sklearn.cluster import KMeans
+from urllib.parse import urldefrag
+from .clickhouse_client import get_clickhouse_client
 import logging
 
 logger = logging.getLogger(__name__)
 
-def calculate_tspr(project_id: str) -> dict:
+class LinkGraph:
     """
-    Simulates running Topic-Sensitive PageRank on Neo4j.
-    In a real implementation, this would call the Neo4j GDS library.
-    Returns a dictionary mapping URL to TSPR score.
+    Internal link graph in compressed form.
+
+    `transition_t` is the transposed row-stochastic transition matrix as
+    CSR (row = target, column = source, value = 1 / outdegree(source)),
+    so one power-iteration step is a single sparse-dense product.
+    Duplicate links count once and self-links are dropped.
     """
+
+    def __init__(self, urls: list, sources: np.ndarray, targets: np.ndarray):
+        self.urls = urls
+        self.index = {url: i for i, url in enumerate(urls)}
+        n = len(urls)
+
+        keep = sources != targets
+        sources, targets = sources[keep], targets[keep]
+        adjacency_t = sparse.csr_matrix(
+            (np.ones(len(sources), dtype=np.float64), (targets, sources)), shape=(n, n)
+        )
+        adjacency_t.sum_duplicates()
+        adjacency_t.data[:] = 1.0
+
+        self.out_degree = np.bincount(adjacency_t.indices, minlength=n)
+        self.dangling = self.out_degree == 0
+        inv_out = np.zeros(n, dtype=np.float64)
+        inv_out[~self.dangling] = 1.0 / self.out_degree[~self.dangling]
+        adjacency_t.data *= inv_out[adjacency_t.indices]
+        self.transition_t = adjacency_t
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.urls)
+
+    @property
+    def n_edges(self) -> int:
+        return int(self.transition_t.nnz)
+
+    @classmethod
+    def from_edges(cls, edges, nodes=()) -> "LinkGraph":
+        """
+        Build from an iterable of (source_url, target_url); `nodes` adds
+        pages that may have no links.
+        """
+        index = {}
+        for url in nodes:
+            index.setdefault(url, len(index))
+        # Typed arrays: 8 bytes per endpoint instead of a Python int each
+        sources, targets = array('q'), array('q')
+        for source, target in edges:
+            sources.append(index.setdefault(source, len(index)))
+            targets.append(index.setdefault(target, len(index)))
+        return cls(list(index), np.frombuffer(sources, dtype=np.int64), np.frombuffer(targets, dtype=np.int64))
+
+    @classmethod
+    def from_pages(cls, pages: list) -> "LinkGraph":
+        """
+        Build from parse_html results ({url, links: [{url, isInternal}]}).
+        Only internal links are followed; URL fragments are ignored.
+        """
+        out_links = dict(_page_out_links(page) for page in pages)
+        edges = ((source, target) for source, targets in out_links.items() for target in targets)
+        return cls.from_edges(edges, nodes=out_links)
+
+    def edges(self) -> tuple:
+        """(sources, targets) node indices of the deduplicated links."""
+        csr = self.transition_t
+        targets = np.repeat(np.arange(self.n_nodes, dtype=np.int64), np.diff(csr.indptr))
+        return csr.indices.astype(np.int64), targets
+
+    def replace_out_links(self, out_links: dict) -> tuple:
+        """
+        Apply a recrawl: each source URL in out_links gets exactly the given
+        targets as its links; other pages keep theirs. Unknown URLs become
+        new nodes appended after the existing ones.
+
+        Returns:
+            (new LinkGraph, links added, links removed)
+        """
+        urls = list(self.urls)
+        index = dict(self.index)
+
+        def node(url):
+            i = index.get(url)
+            if i is None:
+                i = index[url] = len(urls)
+                urls.append(url)
+            return i
+
+        sources, targets = self.edges()
+        changed = np.array([node(url) for url in out_links], dtype=np.int64)
+        mask = np.isin(sources, changed)
+        old = set(zip(sources[mask].tolist(), targets[mask].tolist()))
+        new = {(node(source), node(target)) for source, links in out_links.items() for target in links}
+        new = sorted((s, t) for s, t in new if s != t)
+        delta = np.array(new, dtype=np.int64).reshape(-1, 2)
+
+        graph = LinkGraph(
+            urls,
+            np.concatenate([sources[~mask], delta[:, 0]]),
+            np.concatenate([targets[~mask], delta[:, 1]])
+        )
+        new = set(new)
+        return graph, len(new - old), len(old - new)
+
+def _page_out_links(page: dict) -> tuple:
+    """(url, internal link targets) of a parse_html result, fragments stripped."""
+    targets = [urldefrag(link["url"])[0] for link in page.get("links", ()) if link.get("isInternal")]
+    return urldefrag(page["url"])[0], targets
+
+def topic_teleport_matrix(graph: LinkGraph, topics: dict = None) -> tuple:
+    """
+    Teleport (personalization) vectors, one column per topic.
+
+    topics maps a topic name to seed URLs; the teleport mass of a topic
+    is spread evenly over its seeds present in the graph. A "global"
+    uniform column always comes first. Topics with no seeds in the
+    graph fall back to uniform.
+
+    Returns:
+        (names, matrix of shape (n_nodes, n_topics))
+    """
+    n = graph.n_nodes
+    names = ["global"] + [name for name in (topics or {}) if name != "global"]
+    teleport = np.zeros((n, len(names)), dtype=np.float64)
+    if n == 0:
+        return names, teleport
+    teleport[:, 0] = 1.0 / n
+    for column, name in enumerate(names[1:], start=1):
+        seeds = [graph.index[u] for u in dict.fromkeys(urldefrag(u)[0] for u in topics[name]) if u in graph.index]
+        if seeds:
+            teleport[seeds, column] = 1.0 / len(seeds)
+        else:
+            teleport[:, column] = 1.0 / n
+    return names, teleport
+
+def topic_sensitive_pagerank(graph: LinkGraph, teleport: np.ndarray, damping: float = 0.85,
+                             tol: float = 1e-6, max_iter: int = 100, x0: np.ndarray = None) -> tuple:
+    """
+    Power iteration for all topic columns at once.
+
+    Each step is X <- d * P^T X + V * (d * dangling_mass(X) + (1 - d)),
+    where dangling pages send their mass to the topic's teleport vector.
+    Stops when the largest per-topic L1 change is below tol.
+
+    Returns:
+        (scores of shape (n_nodes, n_topics), iterations, residual)
+    """
+    n = graph.n_nodes
+    if n == 0:
+        return np.zeros((0, teleport.shape[1])), 0, 0.0
+
+    x = teleport.copy() if x0 is None else np.array(x0, dtype=np.float64, copy=True)
+    x /= x.sum(axis=0, keepdims=True)
+    dangling = graph.dangling
+    residual = float('inf')
+    iterations = 0
+
+    for iterations in range(1, max_iter + 1):
+        dangling_mass = x[dangling].sum(axis=0)
+        x_next = damping * (graph.transition_t @ x)
+        x_next += teleport * (damping * dangling_mass + (1.0 - damping))
+        residual = float(np.abs(x_next - x).sum(axis=0).max())
+        x = x_next
+        if residual < tol:
+            break
+
+    return x, iterations, residual
+
+def calculate_tspr(project_id: str, pages: list = None, topics: dict = None,
+                   incremental: bool = False) -> dict:
+    """
+    Topic-Sensitive PageRank over a project's internal link graph.
+
+    With `pages` (parse_html results) the graph is built from their links
+    and scores are returned. Otherwise the graph is read from Neo4j (the
+    project's pages and their (:Page)-[:LINKS_TO]->(:Page) edges) and
+    scores are written back as `tspr` plus `tspr_<topic>` per topic. A
+    project without pages returns an empty "scores" map.
+
+    The graph and scores are persisted after every run (tspr_state). With
+    incremental=True and a persisted state, `pages` are the recrawled pages:
+    their links replace the stored ones, and power iteration warm-starts
+    from the previous scores instead of reloading the graph. Topics default
+    to the stored ones. Without a persisted state a full run is done.
+
+    Returns a summary dict (and "scores": {url: {topic: score}} for pages).
+    """
+    from .tspr_state import TsprState, get_tspr_state_store
+
     logger.info(f"Calculating TSPR for project {project_id}")
-    # Mock implementation: Return random scores for demo
-    # In production: driver.session().run("CALL gds.pageRank.write(...)")
-    return {"status": "success", "message": "TSPR calculated"}
+    damping = float(os.getenv('TSPR_DAMPING', 0.85))
+    tol = float(os.getenv('TSPR_TOLERANCE', 1e-6))
+    max_iter = int(os.getenv('TSPR_MAX_ITER', 100))
+    store = get_tspr_state_store()
+    state = store.load(project_id) if incremental else None
+    if incremental and state is None:
+        logger.warning(f"No stored TSPR state for project {project_id}; running in full")
+    added = removed = 0
+
+    if state is not None:
+        source = state.meta.get("source", "pages")
+        if topics is None:
+            topics = state.meta.get("topic_seeds")
+        stored = LinkGraph(
+            state.urls,
+            np.asarray(state.sources, dtype=np.int64),
+            np.asarray(state.targets, dtype=np.int64)
+        )
+        graph, added, removed = stored.replace_out_links(dict(_page_out_links(page) for page in pages or ()))
+    elif pages is not None:
+        source = "pages"
+        graph = LinkGraph.from_pages(pages)
+    else:
+        from .link_graph import load_project_edges, load_project_pages
+        source = "neo4j"
+        graph = LinkGraph.from_edges(load_project_edges(project_id), nodes=load_project_pages(project_id))
+
+    names, teleport = topic_teleport_matrix(graph, topics)
+    if graph.n_nodes == 0:
+        logger.info(f"No pages to score for project {project_id}")
+        return {
+            "status": "success", "mode": "full", "pages": 0, "links": 0,
+            "links_added": 0, "links_removed": 0, "topics": names,
+            "iterations": 0, "iterations_saved": 0, "residual": 0.0, "converged": True,
+            "scores": {}
+        }
+
+    x0 = None
+    if state is not None:
+        # Previous scores for known pages and topics; teleport mass elsewhere
+        x0 = teleport.copy()
+        for column, name in enumerate(names):
+            if name in state.topics:
+                x0[:len(state.urls), column] = state.scores[:, state.topics.index(name)]
+
+    started = time.perf_counter()
+    scores, iterations, residual = topic_sensitive_pagerank(graph, teleport, damping, tol, max_iter, x0=x0)
+    elapsed = time.perf_counter() - started
+    mode = "incremental" if state is not None else "full"
+    logger.info(
+        f"TSPR ({mode}) for {project_id}: {graph.n_nodes} pages, {graph.n_edges} links "
+        f"(+{added}/-{removed}), {len(names)} topics, {iterations} iterations ({elapsed:.2f}s)"
+    )
+
+    cold_iterations = state.meta.get("cold_iterations", iterations) if state is not None else iterations
+    sources, targets = graph.edges()
+    store.save(project_id, TsprState(graph.urls, sources, targets, names, scores, {
+        "source": source,
+        "topic_seeds": topics or {},
+        "cold_iterations": cold_iterations
+    }))
+
+    result = {
+        "status": "success",
+        "mode": mode,
+        "pages": graph.n_nodes,
+        "links": graph.n_edges,
+        "links_added": added,
+        "links_removed": removed,
+        "topics": names,
+        "iterations": iterations,
+        "iterations_saved": max(0, cold_iterations - iterations),
+        "residual": residual,
+        "converged": residual < tol
+    }
+    if source == "pages":
+        result["scores"] = {
+            url: {name: float(scores[i, j]) for j, name in enumerate(names)}
+            for i, url in enumerate(graph.urls)
+        }
+    else:
+        from .link_graph import write_project_scores
+        result["written"] = write_project_scores(project_id, graph.urls, names, scores)
+    return result
 
-def cluster_content(embeddings: list[dict]) -> list[dict]:
+def embedding_matrix(embeddings: list[dict]) -> np.ndarray:
     """
-    Clusters content based on embeddings using K-Means.
+    Stack {embedding} dicts into a preallocated float32 matrix (no float64 copy).
+
+    Raises:
+        ValueError: if the embeddings differ in dimension
+    """
+    dimension = len(embeddings[0]['embedding'])
+    matrix = np.empty((len(embeddings), dimension), dtype=np.float32)
+    for i, item in enumerate(embeddings):
+        if len(item['embedding']) != dimension:
+            raise ValueError(
+                f"Embedding for {item.get('url', f'row {i}')} has dimension {len(item['embedding'])}, "
+                f"expected {dimension}; all embeddings must come from the same model"
+            )
+        matrix[i] = item['embedding']
+    return matrix
+
+def choose_n_clusters(X: np.ndarray, max_clusters: int = None, sample_size: int = None,
+                      random_state: int = 42) -> int:
+    """
+    Pick k by silhouette score on a random sample of rows.
+
+    Candidates double from 2 up to CLUSTER_MAX_K (default 200), capped so
+    each cluster has about 10 sampled points. Each candidate is fitted
+    with MiniBatchKMeans on the sample only (CLUSTER_SAMPLE_SIZE rows,
+    default 5000).
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+
+    max_clusters = max_clusters or int(os.getenv('CLUSTER_MAX_K', 200))
+    sample_size = sample_size or int(os.getenv('CLUSTER_SAMPLE_SIZE', 5000))
+    rng = np.random.default_rng(random_state)
+    sample = X[rng.choice(len(X), sample_size, replace=False)] if len(X) > sample_size else X
+
+    candidates = []
+    k = 2
+    while k <= min(max_clusters, len(sample) // 10):
+        candidates.append(k)
+        k *= 2
+    if not candidates:
+        return min(2, len(X))
+
+    best_k, best_score = candidates[0], -1.0
+    for k in candidates:
+        labels = MiniBatchKMeans(
+            n_clusters=k, batch_size=1024, n_init=1, random_state=random_state
+        ).fit_predict(sample)
+        if len(np.unique(labels)) < 2:
+            continue
+        score = silhouette_score(sample, labels, sample_size=min(len(sample), 2000), random_state=random_state)
+        if score > best_score:
+            best_k, best_score = k, score
+    return best_k
+
+def cluster_embeddings(X: np.ndarray, n_clusters: int = None, centroids=None,
+                       random_state: int = 42) -> dict:
+    """
+    MiniBatchKMeans over a float32 embedding matrix.
+
+    With `centroids` (from a previous run) clustering starts from them and
+    keeps their k, so re-clustering after a recrawl takes a few passes.
+    Otherwise k is n_clusters, CLUSTER_K, or chosen by choose_n_clusters.
+
+    Returns:
+        {"labels", "centroids" (float32 arrays), "n_clusters", "inertia", "warm_start"}
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    X = np.asarray(X, dtype=np.float32)
+    batch_size = int(os.getenv('CLUSTER_BATCH_SIZE', 4096))
+    warm_start = centroids is not None and len(centroids) > 0
+    if warm_start:
+        init = np.asarray(centroids, dtype=np.float32)
+        if init.ndim != 2 or init.shape[1] != X.shape[1]:
+            raise ValueError(f"Centroids of shape {init.shape} do not match embeddings of dimension {X.shape[1]}")
+        n_clusters, n_init = len(init), 1
+    else:
+        n_clusters = n_clusters or int(os.getenv('CLUSTER_K', 0)) or choose_n_clusters(X, random_state=random_state)
+        init, n_init = "k-means++", 3
+    n_clusters = min(n_clusters, len(X))
+    if warm_start:
+        init = init[:n_clusters]
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=n_clusters, init=init, n_init=n_init,
+        batch_size=batch_size, random_state=random_state
+    )
+    labels = kmeans.fit_predict(X)
+    return {
+        "labels": labels,
+        "centroids": kmeans.cluster_centers_.astype(np.float32, copy=False),
+        "n_clusters": n_clusters,
+        "inertia": float(kmeans.inertia_),
+        "warm_start": warm_start
+    }
+
+def cluster_content(embeddings: list[dict], engine: str = None, centroids=None) -> list[dict]:
+    """
+    Clusters content based on embeddings.
     embeddings: list of {url: str, embedding: list[float]}
+    engine: CLUSTER_ENGINE, "kmeans" (default, full K-Means with k <= 5)
+    or "minibatch" (cluster_embeddings; float32, automatic k, warm start
+    from `centroids`).
     Returns: list of {url: str, cluster_id: int}
     """
     if not embeddings:
         return []
 
+    engine = engine or os.getenv('CLUSTER_ENGINE', 'kmeans').lower()
+    if engine == "minibatch" or centroids is not None:
+        labels = cluster_embeddings(embedding_matrix(embeddings), centroids=centroids)["labels"]
+        return [{"url": item['url'], "cluster_id": int(label)} for item, label in zip(embeddings, labels)]
+    if engine != "kmeans":
+        raise ValueError(f"Unknown cluster engine: {engine}")
+
     logger.info(f"Clustering {len(embeddings)} pages")
     
     # Extract vectors
-    X = np.array([item['embedding'] for item in embeddings])
+    X = embedding_matrix(embeddings)
     
     # Determine K (simple heuristic: sqrt(N/2) or max 5)
     n_clusters = min(5, max(2, int(len(embeddings) ** 0.5)))
@@ -45,6 +424,83 @@ def cluster_content(embeddings: list[dict]) -> list[dict]:
         
     return results
 
+def recluster_content(embeddings: list[dict], centroids: list = None) -> dict:
+    """
+    MiniBatchKMeans clustering that also returns the centroids, so the
+    next run (e.g. after a recrawl) can warm-start from them.
+    Returns: {clusters: [{url, cluster_id}], centroids: [[float]], n_clusters, inertia, warm_start}
+    """
+    if not embeddings:
+        return {"clusters": [], "centroids": centroids or [], "n_clusters": 0, "inertia": 0.0, "warm_start": False}
+
+    logger.info(f"Clustering {len(embeddings)} pages ({'warm start' if centroids else 'cold start'})")
+    result = cluster_embeddings(embedding_matrix(embeddings), centroids=centroids)
+    return {
+        "clusters": [
+            {"url": item['url'], "cluster_id": int(label)}
+            for item, label in zip(embeddings, result["labels"])
+        ],
+        "centroids": result["centroids"].tolist(),
+        "n_clusters": result["n_clusters"],
+        "inertia": result["inertia"],
+        "warm_start": result["warm_start"]
+    }
+
+def cluster_site(site_id: str, warm_start: bool = False) -> dict:
+    """
+    Cluster a site's pages straight from ClickHouse page_embeddings.
+
+    Embeddings are streamed into a float32 matrix (embedding_store), so
+    no per-page payload crosses Temporal. Assignments and centroids are
+    written back in bulk (page_clusters / clusters). With warm_start the
+    site's previous centroids seed MiniBatchKMeans.
+
+    Returns summary statistics only.
+    """
+    from .embedding_store import load_site_embeddings, load_site_centroids, write_site_clusters
+
+    client = get_clickhouse_client()
+    started = time.perf_counter()
+    page_ids, X = load_site_embeddings(client, site_id)
+    loaded = time.perf_counter()
+    if not page_ids:
+        return {"status": "empty", "site_id": site_id, "pages": 0}
+
+    centroids = load_site_centroids(client, site_id) if warm_start else None
+    if centroids is not None and centroids.shape[1] != X.shape[1]:
+        logger.warning(f"Stored centroids for site {site_id} do not match the embedding dimension; cold start")
+        centroids = None
+    result = cluster_embeddings(X, centroids=centroids)
+    clustered = time.perf_counter()
+    written = write_site_clusters(client, site_id, page_ids, result["labels"], result["centroids"])
+    finished = time.perf_counter()
+
+    sizes = np.bincount(result["labels"], minlength=result["n_clusters"])
+    logger.info(
+        f"Clustered site {site_id}: {len(page_ids)} pages into {result['n_clusters']} clusters "
+        f"(load {loaded - started:.2f}s, cluster {clustered - loaded:.2f}s, write {finished - clustered:.2f}s)"
+    )
+    return {
+        "status": "success",
+        "site_id": site_id,
+        "pages": len(page_ids),
+        "dimension": int(X.shape[1]),
+        "n_clusters": result["n_clusters"],
+        "warm_start": result["warm_start"],
+        "inertia": result["inertia"],
+        "cluster_sizes": {
+            "min": int(sizes.min()),
+            "median": float(np.median(sizes)),
+            "max": int(sizes.max())
+        },
+        "written": written,
+        "seconds": {
+            "load": round(loaded - started, 3),
+            "cluster": round(clustered - loaded, 3),
+            "write": round(finished - clustered, 3)
+        }
+    }
+
 def calculate_content_depth(text: str) -> float:
     """
     Calculates a simple content depth score based on length and entity density.
@@ -74,3 +530,31 @@ def calculate_composite_score(tspr: float, depth: float, risk: float = 0, ux: fl
     final_score = max(0, weighted_score - risk)
     
     return float(final_score)
+
+def content_depth_scores(word_counts) -> np.ndarray:
+    """
+    calculate_content_depth over an array of word counts (e.g. the
+    wordCount field of parse_html results). Pages without words score 0.
+    """
+    counts = np.asarray(word_counts, dtype=np.float64)
+    scores = 100 / (1 + np.exp(-0.002 * (counts - 500)))
+    scores[counts <= 0] = 0.0
+    return scores
+
+def content_depth_batch(word_counts: list = None, texts: list = None) -> list[float]:
+    """Depth scores from word counts, or from texts when no counts are available."""
+    if word_counts is None:
+        word_counts = np.fromiter((len(text.split()) for text in texts or ()), dtype=np.int64)
+    return content_depth_scores(word_counts).tolist()
+
+def composite_scores(tspr, depth, risk=0, ux=100) -> np.ndarray:
+    """
+    calculate_composite_score over arrays of components. Scalars broadcast,
+    so e.g. one ux value can apply to every page.
+    """
+    tspr, depth, risk, ux = np.broadcast_arrays(
+        *(np.asarray(values, dtype=np.float64) for values in (tspr, depth, risk, ux))
+    )
+    authority_score = np.minimum(100, tspr * 10)
+    weighted_score = (authority_score * 0.4) + (depth * 0.4) + (ux * 0.2)
+    return np.maximum(0, weighted_score - risk)
@@ -0,0 +1,107 @@
+import os
+import re
+import json
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+
+SAFE_ID = re.compile(r'[A-Za-z0-9_-]+')
+
+class TsprState:
+    """
+    A project's link graph and TSPR scores as last computed.
+    Arrays loaded from disk are read-only memory maps.
+    """
+
+    def __init__(self, urls: list, sources: np.ndarray, targets: np.ndarray,
+                 topics: list, scores: np.ndarray, meta: dict = None):
+        self.urls = urls
+        self.sources = sources
+        self.targets = targets
+        self.topics = topics
+        self.scores = scores
+        self.meta = meta or {}
+
+class TsprStateStore:
+    """
+    Persisted TSPR state, one directory per project:
+
+        urls.txt                 one URL per line (node order)
+        sources.npy, targets.npy int32 edge endpoints (deduplicated links)
+        scores.npy               float64 scores, shape (nodes, topics)
+        meta.json                topic names, source and last cold-start iterations
+
+    Each save writes a fresh directory and swaps it in with renames, so a
+    reader never sees a mix of old and new files.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, project_id: str) -> str:
+        # IDs that are not plain names (".", "..", separators, ...) are hashed,
+        # so a project directory always sits directly under the root
+        if not SAFE_ID.fullmatch(project_id):
+            project_id = "~" + hashlib.sha1(project_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, project_id)
+
+    def load(self, project_id: str):
+        """Return the stored TsprState for a project, or None."""
+        path = self._path(project_id)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            with open(os.path.join(path, 'urls.txt'), encoding='utf-8') as f:
+                urls = f.read().split('\n') if meta["nodes"] else []
+            sources = np.load(os.path.join(path, 'sources.npy'), mmap_mode='r')
+            targets = np.load(os.path.join(path, 'targets.npy'), mmap_mode='r')
+            scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        if len(urls) != meta["nodes"] or scores.shape != (len(urls), len(meta["topics"])):
+            return None
+        return TsprState(urls, sources, targets, meta["topics"], scores, meta)
+
+    def save(self, project_id: str, state: TsprState) -> None:
+        path = self._path(project_id)
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self.root, prefix='.tmp-')
+        try:
+            with open(os.path.join(tmp_path, 'urls.txt'), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(state.urls))
+            np.save(os.path.join(tmp_path, 'sources.npy'), np.asarray(state.sources, dtype=np.int32))
+            np.save(os.path.join(tmp_path, 'targets.npy'), np.asarray(state.targets, dtype=np.int32))
+            np.save(os.path.join(tmp_path, 'scores.npy'), np.asarray(state.scores, dtype=np.float64))
+            meta = dict(state.meta, nodes=len(state.urls), topics=list(state.topics))
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+
+            old_path = None
+            if os.path.exists(path):
+                old_path = tempfile.mkdtemp(dir=self.root, prefix='.old-')
+                os.rmdir(old_path)
+                os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            if old_path:
+                shutil.rmtree(old_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    def delete(self, project_id: str) -> None:
+        shutil.rmtree(self._path(project_id), ignore_errors=True)
+
+# Shared store (created on first use)
+_store = None
+
+def get_tspr_state_store() -> TsprStateStore:
+    """
+    Return the process-wide TSPR state store under TSPR_STATE_DIR.
+    With several worker replicas this must be a shared volume; otherwise
+    incremental runs on another replica find no state and run in full.
+    """
+    global _store
+    if _store is None:
+        _store = TsprStateStore(os.getenv('TSPR_STATE_DIR', os.path.join(tempfile.gettempdir(), 'apexseo-tspr')))
+    return _store
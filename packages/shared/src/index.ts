@@ -8,7 +8,7 @@ export * from './lib/clickhouse/repositories/ClickHouseRankRepository';
 export * from './lib/clickhouse/repositories/ClickHouseBacklinkRepository';
 export * from './lib/clickhouse/repositories/ClickHouseHealthScoreRepository';
 export * from './lib/neo4j/index';
-export { PageRepository as Neo4jPageRepository, savePageWithLinks } from './lib/neo4j/repositories/PageRepository';
+export { PageRepository as Neo4jPageRepository, savePageWithLinks, getStoredInternalLinks } from './lib/neo4j/repositories/PageRepository';
 export * from './lib/dataforseo';
 export * from './lib/embeddings';
 export * from './lib/neo4j/repositories/GraphRepository';
@@ -7,6 +7,8 @@ export interface Cluster {
     keywords: string[];
     page_count: number;
     avg_health_score: number;
+    centroid_embedding?: number[];
+    avg_tspr?: number;
 }
 
 export class ClickHouseClusterStore {
@@ -19,8 +21,11 @@ export class ClickHouseClusterStore {
                     cluster_id String,
                     label String,
                     keywords Array(String),
-                    page_count UInt32,
-                    avg_health_score Float32
+                    page_count UInt32 DEFAULT 0,
+                    avg_health_score Float32 DEFAULT 0.0,
+                    centroid_embedding Array(Float32),
+                    avg_tspr Float32 DEFAULT 0.0,
+                    created_at DateTime DEFAULT now()
                 ) ENGINE = MergeTree()
                 ORDER BY (site_id, cluster_id)
             `
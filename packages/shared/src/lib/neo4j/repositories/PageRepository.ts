@@ -235,3 +235,20 @@ export async function savePageWithLinks(projectId: string, pageData: any) {
         await session.close();
     }
 }
+
+/**
+ * Returns the URLs of the internal links stored for a page by savePageWithLinks.
+ */
+export async function getStoredInternalLinks(url: string): Promise<string[]> {
+    if (!driver) return [];
+    const session = driver.session({ database: DATABASE });
+    try {
+        const result = await session.run(`
+            MATCH (p:Page {page_id: $pageId})-[:LINKS_TO]->(target:Page)
+            RETURN DISTINCT target.url AS url
+        `, { pageId: Buffer.from(url).toString('base64') });
+        return result.records.map(r => r.get('url')).filter(Boolean);
+    } finally {
+        await session.close();
+    }
+}
@@ -0,0 +1,6 @@
+import { getStoredInternalLinks } from '@apexseo/shared';
+
+export async function getStoredLinksFromNeo4j(url: string): Promise<string[]> {
+    console.log(`Reading stored links for ${url} from Neo4j`);
+    return getStoredInternalLinks(url);
+}
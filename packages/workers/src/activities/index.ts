@@ -1,4 +1,5 @@
 export * from './db/StoreEmbeddingsActivity';
+export * from './db/GetStoredLinksActivity';
 export * from './graph/GenerateLinkSuggestionsActivity';
 export * from './analysis/CalculateContentScoreActivity';
 export * from './content-generation';
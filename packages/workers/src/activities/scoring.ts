@@ -9,7 +9,7 @@ export async function getPagesForProject(projectId: string): Promise<any[]> {
     if (!client) return [];
 
     const result = await client.query({
-        query: `SELECT url, content FROM pages WHERE site_id = {projectId:String} LIMIT 10`,
+        query: `SELECT url, word_count FROM pages WHERE site_id = {projectId:String} LIMIT 10`,
         query_params: { projectId },
         format: 'JSONEachRow'
     });
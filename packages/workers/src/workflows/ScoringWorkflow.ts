@@ -7,9 +7,11 @@ interface PythonActivities {
     run_tspr(projectId: string): Promise<any>;
     analyze_content_depth(text: string): Promise<number>;
     compute_composite_score(tspr: number, depth: number, risk: number, ux: number): Promise<number>;
+    analyze_content_depth_batch(wordCounts: number[] | null, texts?: string[]): Promise<number[]>;
+    compute_composite_score_batch(tspr: number[], depth: number[], risk?: number[], ux?: number[]): Promise<number[]>;
 }
 
-const { run_tspr, analyze_content_depth, compute_composite_score } = proxyActivities<PythonActivities>({
+const { run_tspr, analyze_content_depth_batch, compute_composite_score_batch } = proxyActivities<PythonActivities>({
     taskQueue: 'seo-python-worker-task-queue', // Python worker queue
     startToCloseTimeout: '5m',
 });
@@ -41,30 +43,29 @@ export async function ScoringWorkflow(projectId: string): Promise<string> {
     // For now, let's mock the list or assume the activity exists.
     const pages = await getPagesForProject(projectId);
 
-    for (const page of pages) {
-        // 3. Analyze Content Depth (NLP)
-        // We pass the text content. Assuming 'page' object has 'text' or we fetch it.
-        // If page doesn't have text, we might need to fetch it from ClickHouse.
-        // Let's assume `getPagesForProject` returns { url, content, ... }
-        const depthScore = await analyze_content_depth(page.content || "");
+    // 3. Analyze Content Depth (NLP) for all pages in one activity,
+    // from the stored word counts rather than the page text
+    const depthScores = await analyze_content_depth_batch(pages.map((page) => page.word_count || 0));
 
-        // 4. Compute Composite Score
-        // Mocking TSPR score for the page (in real app, we'd query Neo4j for this page's score)
-        const tsprScore = 5.0;
-        const riskScore = 0;
-        const uxScore = 85;
+    // 4. Compute Composite Scores
+    // Mocking TSPR score for the page (in real app, we'd query Neo4j for this page's score)
+    const tsprScores = pages.map(() => 5.0);
+    const riskScores = pages.map(() => 0);
+    const uxScores = pages.map(() => 85);
 
-        const compositeScore = await compute_composite_score(tsprScore, depthScore, riskScore, uxScore);
+    const compositeScores = await compute_composite_score_batch(tsprScores, depthScores, riskScores, uxScores);
 
+    for (let i = 0; i < pages.length; i++) {
+        const page = pages[i];
         // 5. Persist Score
         await saveScoreToClickHouse({
             project_id: projectId,
             url: page.url,
-            composite_score: compositeScore,
-            tspr_score: tsprScore,
-            depth_score: depthScore,
-            ux_score: uxScore,
-            risk_score: riskScore,
+            composite_score: compositeScores[i],
+            tspr_score: tsprScores[i],
+            depth_score: depthScores[i],
+            ux_score: uxScores[i],
+            risk_score: riskScores[i],
             created_at: new Date().toISOString()
         });
     }
@@ -0,0 +1,68 @@
+import { TestWorkflowEnvironment } from '@temporalio/testing';
+import { Worker } from '@temporalio/worker';
+import { describe, it, before, after } from 'node:test';
+import assert from 'assert';
+import { SiteCrawlWorkflow } from './SiteCrawlWorkflow';
+
+const START_URL = 'https://example.com/';
+const ABOUT_URL = 'https://example.com/about';
+
+describe('SiteCrawlWorkflow', () => {
+    let testEnv: TestWorkflowEnvironment;
+
+    before(async () => {
+        testEnv = await TestWorkflowEnvironment.createTimeSkipping();
+    });
+
+    after(async () => {
+        await testEnv?.teardown();
+    });
+
+    it('keeps crawling through stored links when the start page is not modified', async () => {
+        const { client, nativeConnection } = testEnv;
+        const parsed: string[] = [];
+        const written: string[] = [];
+        const checked: string[] = [];
+
+        const pythonWorker = await Worker.create({
+            connection: nativeConnection,
+            taskQueue: 'seo-python-worker-task-queue',
+            activities: {
+                can_fetch: async (url: string) => checked.push(url) > 0,
+                fetch_html: async (url: string) => url === START_URL
+                    ? { url, status: 304, html: '', not_modified: true }
+                    : { url, status: 200, html: '<html></html>' },
+                parse_html: async (_html: string, url: string) => {
+                    parsed.push(url);
+                    return { url, title: 'About', text: '', links: [] };
+                },
+            },
+        });
+
+        const worker = await Worker.create({
+            connection: nativeConnection,
+            taskQueue: 'test-queue',
+            workflowsPath: require.resolve('./SiteCrawlWorkflow'),
+            activities: {
+                getStoredLinksFromNeo4j: async (url: string) => url === START_URL ? [ABOUT_URL] : [],
+                writePageToClickHouse: async (page: any) => void written.push(page.url),
+                updateGraphInNeo4j: async () => undefined,
+            },
+        });
+
+        await pythonWorker.runUntil(worker.runUntil(async () => {
+            const result = await client.workflow.execute(SiteCrawlWorkflow, {
+                args: [{ siteId: 's1', startUrl: START_URL }],
+                taskQueue: 'test-queue',
+                workflowId: 'test-site-crawl-not-modified',
+            });
+
+            assert.strictEqual(result.pagesCrawled, 2);
+            // The unchanged start page is neither parsed nor persisted again
+            assert.deepStrictEqual(parsed, [ABOUT_URL]);
+            assert.deepStrictEqual(written, [ABOUT_URL]);
+            // robots.txt is checked per URL against the worker's cache, not passed in
+            assert.deepStrictEqual(checked, [START_URL, ABOUT_URL]);
+        }));
+    });
+});
@@ -2,7 +2,7 @@ import { proxyActivities, defineSignal, setHandler, condition, sleep } from '@te
 import * as activities from '../activities';
 
 // Node.js Activities (Persistence)
-const { writePageToClickHouse, updateGraphInNeo4j } = proxyActivities<typeof activities>({
+const { writePageToClickHouse, updateGraphInNeo4j, getStoredLinksFromNeo4j } = proxyActivities<typeof activities>({
     startToCloseTimeout: '1 minute',
     retry: {
         initialInterval: '1 second',
@@ -16,12 +16,12 @@ const { writePageToClickHouse, updateGraphInNeo4j } = proxyActivities<typeof act
 // We need to define the interface since we can't import Python types
 interface PythonActivities {
     fetch_html(url: string): Promise<any>;
-    parse_html(html: string, url: string): Promise<any>;
-    fetch_robots_txt(domain: string): Promise<string>;
-    can_fetch(url: string, robots_content: string): Promise<boolean>;
+    parse_html(html: string, url: string, body_ref?: string): Promise<any>;
+    // Rules come from the worker's per-domain robots cache
+    can_fetch(url: string): Promise<boolean>;
 }
 
-const { fetch_html, parse_html, fetch_robots_txt, can_fetch } = proxyActivities<PythonActivities>({
+const { fetch_html, parse_html, can_fetch } = proxyActivities<PythonActivities>({
     taskQueue: 'seo-python-worker-task-queue',
     startToCloseTimeout: '2 minutes',
     retry: {
@@ -54,15 +54,6 @@ export async function SiteCrawlWorkflow(input: SiteCrawlInput): Promise<SiteCraw
     setHandler(pauseSignal, () => void (isPaused = true));
     setHandler(resumeSignal, () => void (isPaused = false));
 
-    // 1. Fetch Robots.txt
-    let robotsContent = "";
-    try {
-        const domain = new URL(startUrl).origin;
-        robotsContent = await fetch_robots_txt(domain);
-    } catch (e) {
-        console.warn("Failed to fetch robots.txt, proceeding without it.");
-    }
-
     const visited = new Set<string>();
     const queue: { url: string; depth: number }[] = [{ url: startUrl, depth: 0 }];
 
@@ -75,8 +66,8 @@ export async function SiteCrawlWorkflow(input: SiteCrawlInput): Promise<SiteCraw
             continue;
         }
 
-        // 2. Check Robots.txt
-        const allowed = await can_fetch(url, robotsContent);
+        // 1-2. Fetch and check Robots.txt (cached per domain by the Python worker)
+        const allowed = await can_fetch(url);
         if (!allowed) {
             console.log(`Skipping ${url} due to robots.txt`);
             continue;
@@ -92,9 +83,17 @@ export async function SiteCrawlWorkflow(input: SiteCrawlInput): Promise<SiteCraw
             // 4. Fetch HTML (Python)
             const fetchResult = await fetch_html(url);
 
-            if (fetchResult && fetchResult.status === 200) {
+            let internalLinks: string[] = [];
+
+            if (fetchResult && fetchResult.not_modified) {
+                // 304: unchanged since the last crawl, skip parse/persist/scoring
+                // but keep crawling through the links stored on the last crawl
+                console.log(`Not modified: ${url}`);
+                internalLinks = await getStoredLinksFromNeo4j(url);
+            } else if (fetchResult && fetchResult.status === 200) {
                 // 5. Parse HTML (Python)
-                const parsedData = await parse_html(fetchResult.html, url);
+                // Large bodies come back as a blob store reference
+                const parsedData = await parse_html(fetchResult.html, url, fetchResult.body_ref);
 
                 // 6. Write to ClickHouse (Node.js)
                 // Map Python output to expected Node.js input
@@ -111,11 +110,13 @@ export async function SiteCrawlWorkflow(input: SiteCrawlInput): Promise<SiteCraw
                 // 7. Update Neo4j Graph (Node.js)
                 await updateGraphInNeo4j({ ...pageData, siteId });
 
-                // 8. Enqueue Links
-                for (const link of parsedData.links) {
-                    if (link.isInternal && !visited.has(link.url)) {
-                        queue.push({ url: link.url, depth: depth + 1 });
-                    }
+                internalLinks = pageData.internalLinks.map((l: any) => l.url);
+            }
+
+            // 8. Enqueue Links
+            for (const link of internalLinks) {
+                if (!visited.has(link)) {
+                    queue.push({ url: link, depth: depth + 1 });
                 }
             }
         } catch (error) {
@@ -1,32 +1,347 @@
 from neo4j import GraphDatabase
 from temporalio import activity
 from clickhouse_driver import Client
-from vector_utils import cosine_similarity, generate_embedding_local, calculate_centroid
+from vector_utils import (
+    cosine_similarity,
+    generate_embedding_local,
+    embed_texts,
+    calculate_centroid,
+    find_similar_pairs,
+    find_similar_pairs_ann,
+    find_similar_pairs_for_rows,
+    embedding_hash,
+    load_or_build_ann_index,
+    normalize_embeddings,
+    pair_recall,
+    plan_similarity_shards,
+    rescore_candidates,
+    similarity_shard,
+    SharedEmbeddingMatrix
+)
+from centroid_cache import CentroidCache
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+import asyncio
 import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Process pools for sharded similarity, keyed by worker count (created on first use)
+_process_pools: Dict[int, ProcessPoolExecutor] = {}
+
+# SERP centroid cache shared by all scoring activities (created on first use)
+_centroid_cache: Optional[CentroidCache] = None
+_centroid_table_ready = False
+
+def _get_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Lazy create the process pool shared by sharded runs of this size."""
+    pool = _process_pools.get(max_workers)
+    if pool is None:
+        pool = _process_pools[max_workers] = ProcessPoolExecutor(max_workers=max_workers)
+    return pool
+
+def shutdown_process_pools() -> None:
+    """Shut down all sharded similarity pools (worker exit and tests)."""
+    while _process_pools:
+        _, pool = _process_pools.popitem()
+        pool.shutdown(wait=True)
+
+def _heartbeat(*details) -> None:
+    """Heartbeat to Temporal when running inside an activity."""
+    if activity.in_activity():
+        activity.heartbeat(*details)
+
+def _heartbeat_interval() -> float:
+    return float(os.getenv('CANNIBALIZATION_HEARTBEAT_SECONDS', '5'))
+
+async def _in_thread(stage: str, fn, *args, **kwargs):
+    """
+    Run a blocking call in a worker thread, heartbeating {"stage": stage}
+    every CANNIBALIZATION_HEARTBEAT_SECONDS until it returns.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=_heartbeat_interval())
+        if done:
+            return task.result()
+        _heartbeat({"stage": stage})
+
+async def _find_pairs_sharded(embeddings: list, keywords: list, threshold: float,
+                              memory_budget_mb: float, workers: int) -> list:
+    """
+    Exact all-pairs search split into row-block shards on a process pool.
+    
+    The normalized matrix lives in shared memory; each shard returns
+    candidate indices which are merged in shard order and re-scored, so
+    the result is identical to `find_similar_pairs`. The event loop stays
+    free while shards run and are re-scored, and heartbeats progress every
+    few seconds.
+    """
+    shards = plan_similarity_shards(len(embeddings), workers * 4)
+    if not shards:
+        return []
+    
+    loop = asyncio.get_running_loop()
+    pool = _get_process_pool(workers)
+    heartbeat_interval = _heartbeat_interval()
+    
+    with SharedEmbeddingMatrix(embeddings, keywords) as shared:
+        futures = [
+            loop.run_in_executor(pool, similarity_shard,
+                                 shared.task(start, stop, threshold, memory_budget_mb))
+            for start, stop in shards
+        ]
+        pending = set(futures)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=heartbeat_interval)
+            _heartbeat({"shards_done": len(futures) - len(pending), "shards_total": len(futures)})
+        candidates = [future.result() for future in futures]
+    
+    return await _in_thread("rescore", rescore_candidates, embeddings, candidates, threshold)
+
+async def _detect_pairs(site_id: str, pages: list, threshold: float, engine: str) -> tuple:
+    """
+    Run the configured similarity engine over the fetched pages.
+    
+    Engines:
+        exact   - blocked all-pairs matrix engine (default); sharded over
+                  CANNIBALIZATION_WORKERS processes when that is > 1
+        ann     - IVF index, only each page's top-k neighbours are scored
+        compare - runs both, returns exact pairs and reports ANN recall
+        
+    CPU-bound work runs in worker threads (or the shard pool) while the
+    activity heartbeats its progress.
+        
+    Returns:
+        (pairs, stats) where pairs is a list of (i, j, similarity)
+    """
+    if engine not in ('exact', 'ann', 'compare'):
+        raise ValueError(f"Unknown CANNIBALIZATION_ENGINE: {engine}")
+    
+    embeddings = [p['embedding'] for p in pages]
+    keywords = [p['keyword'] for p in pages]
+    stats = {"engine": engine}
+    
+    exact_pairs = None
+    if engine in ('exact', 'compare'):
+        memory_budget_mb = float(os.getenv('SIMILARITY_BLOCK_MEMORY_MB', '256'))
+        workers = int(os.getenv('CANNIBALIZATION_WORKERS', '1'))
+        if workers > 1:
+            exact_pairs = await _find_pairs_sharded(
+                embeddings, keywords, threshold, memory_budget_mb, workers
+            )
+            stats["workers"] = workers
+        else:
+            exact_pairs = await _in_thread(
+                "exact",
+                find_similar_pairs,
+                embeddings,
+                keywords,
+                threshold=threshold,
+                memory_budget_mb=memory_budget_mb
+            )
+        if engine == 'exact':
+            return exact_pairs, stats
+    
+    ann_pairs = []
+    if len(pages) >= 2:
+        index = await _in_thread(
+            "ann_index",
+            lambda: load_or_build_ann_index(site_id, normalize_embeddings(embeddings))
+        )
+        ann_pairs = await _in_thread(
+            "ann",
+            find_similar_pairs_ann,
+            embeddings,
+            keywords,
+            threshold=threshold,
+            top_k=int(os.getenv('ANN_TOP_K', '20')),
+            n_probe=int(os.getenv('ANN_N_PROBE', '8')),
+            index=index
+        )
+    
+    if engine == 'ann':
+        return ann_pairs, stats
+    
+    stats.update({
+        "ann_recall": pair_recall(ann_pairs, exact_pairs),
+        "ann_pairs": len(ann_pairs),
+        "exact_pairs": len(exact_pairs)
+    })
+    logger.info(
+        f"ANN recall for site {site_id}: {stats['ann_recall']:.4f} "
+        f"({len(ann_pairs)}/{len(exact_pairs)} pairs)"
+    )
+    return exact_pairs, stats
+
+def _fetch_analyzable_pages(driver, site_id: str) -> tuple:
+    """
+    Read the site's pages that have an embedding and target keyword.
+    
+    Returns:
+        (pages, page_hashes) where page_hashes[i] is the embedding/keyword
+        hash of pages[i]
+    """
+    with driver.session() as session:
+        result = session.run("""
+            MATCH (p:Page {siteId: $site_id})
+            WHERE p.embedding IS NOT NULL 
+              AND p.targetKeyword IS NOT NULL
+            RETURN p.id as id, 
+                   p.url as url, 
+                   p.embedding as embedding, 
+                   p.targetKeyword as keyword,
+                   p.cannibalizationHash as analyzed_hash
+            ORDER BY p.url
+        """, site_id=site_id)
+        pages = list(result)
+    
+    return pages, [embedding_hash(p['embedding'], p['keyword']) for p in pages]
+
+def _delete_cannibalization(driver, site_id: str, dirty_ids: Optional[list] = None) -> set:
+    """
+    Drop the site's CANNIBALIZES edges before they are rewritten.
+    
+    With `dirty_ids` only edges touching those pages or pages no longer
+    analyzable are dropped, and the ids of both endpoints are returned so
+    their status can be refreshed; otherwise all edges go.
+    """
+    with driver.session() as session:
+        if dirty_ids is None:
+            session.run("""
+                MATCH (p:Page {siteId: $site_id})-[r:CANNIBALIZES]->()
+                DELETE r
+            """, site_id=site_id)
+            return set()
+        
+        deleted = session.run("""
+            MATCH (p:Page {siteId: $site_id})-[r:CANNIBALIZES]-(other:Page)
+            WHERE p.id IN $dirty_ids
+               OR p.embedding IS NULL
+               OR p.targetKeyword IS NULL
+            DELETE r
+            RETURN DISTINCT p.id AS id, other.id AS other_id
+        """, site_id=site_id, dirty_ids=dirty_ids)
+        touched_ids = set(dirty_ids)
+        for record in deleted:
+            touched_ids.update((record['id'], record['other_id']))
+        return touched_ids
+
+def _write_cannibalization(driver, site_id: str, rows: list, conflict_ids: set,
+                           batch_size: int, hashes: list, status_ids: set = None) -> dict:
+    """
+    Write CANNIBALIZES edges, page statuses and hashes in batched transactions.
+    
+    Edges are created with one `UNWIND $rows` statement per batch, each in
+    its own explicit transaction. On a full run page statuses come from the
+    in-memory conflict set instead of an EXISTS scan over the graph; on an
+    incremental run only `status_ids` (pages whose edges changed) are
+    re-checked. `hashes` ({id, hash} rows) record which embedding each
+    page was analyzed with.
+    
+    Returns:
+        Write throughput stats for the activity result
+    """
+    started = time.perf_counter()
+    batches = 0
+    
+    with driver.session() as session:
+        for offset in range(0, len(rows), batch_size):
+            with session.begin_transaction() as tx:
+                tx.run("""
+                    UNWIND $rows AS row
+                    MATCH (p1:Page {id: row.id1}), (p2:Page {id: row.id2})
+                    CREATE (p1)-[r:CANNIBALIZES {
+                        similarity: row.similarity,
+                        detectedAt: datetime(),
+                        keyword1: row.kw1,
+                        keyword2: row.kw2
+                    }]->(p2)
+                """, rows=rows[offset:offset + batch_size])
+                tx.commit()
+            batches += 1
+        
+        with session.begin_transaction() as tx:
+            if status_ids is None:
+                ids = list(conflict_ids)
+                tx.run("""
+                    MATCH (p:Page {siteId: $site_id})
+                    SET p.cannibalizationStatus = 'ok'
+                """, site_id=site_id)
+                for offset in range(0, len(ids), batch_size):
+                    tx.run("""
+                        UNWIND $ids AS id
+                        MATCH (p:Page {id: id})
+                        SET p.cannibalizationStatus = 'conflict'
+                    """, ids=ids[offset:offset + batch_size])
+            else:
+                ids = list(status_ids)
+                for offset in range(0, len(ids), batch_size):
+                    tx.run("""
+                        UNWIND $ids AS id
+                        MATCH (p:Page {id: id})
+                        SET p.cannibalizationStatus = CASE
+                            WHEN EXISTS((p)-[:CANNIBALIZES]-()) THEN 'conflict'
+                            ELSE 'ok'
+                        END
+                    """, ids=ids[offset:offset + batch_size])
+            
+            for offset in range(0, len(hashes), batch_size):
+                tx.run("""
+                    UNWIND $hashes AS row
+                    MATCH (p:Page {id: row.id})
+                    SET p.cannibalizationHash = row.hash
+                """, hashes=hashes[offset:offset + batch_size])
+            tx.commit()
+    
+    elapsed = time.perf_counter() - started
+    logger.info(f"Wrote {len(rows)} CANNIBALIZES relationships in {batches} batches ({elapsed:.2f}s)")
+    
+    return {
+        "relationships_written": len(rows),
+        "write_batches": batches,
+        "write_seconds": round(elapsed, 3),
+        "writes_per_second": round(len(rows) / elapsed, 1) if elapsed > 0 else 0.0
+    }
+
 @activity.defn
-async def calculate_cannibalization(site_id: str) -> dict:
+async def calculate_cannibalization(site_id: str, incremental: bool = False) -> dict:
     """
     Detect keyword cannibalization using semantic similarity.
     
     Finds pages with high content overlap (>85% similar) but
     different target keywords, indicating cannibalization.
     
+    In incremental mode only "dirty" pages (whose embedding/keyword hash
+    differs from `cannibalizationHash` stored at the last run) are compared
+    against the full set, and only edges touching them are replaced.
+    `conflicts` and `total_conflicts` then cover the rescanned pairs only.
+    
     Args:
         site_id: The site ID to analyze
+        incremental: Rescan only pages changed since the last run
         
     Returns:
         {
             "conflicts": {"page_url": ["conflicting_url_1", ...]},
             "total_conflicts": int,
             "pages_analyzed": int,
-            "threshold": float
+            "threshold": float,
+            "engine": str,
+            "ann_recall": float,  # compare mode only
+            "dirty_pages": int,  # incremental mode only
+            "relationships_written": int,
+            "write_batches": int,
+            "write_seconds": float,
+            "writes_per_second": float
         }
     """
     threshold = float(os.getenv('SIMILARITY_THRESHOLD', '0.85'))
+    engine = os.getenv('CANNIBALIZATION_ENGINE', 'exact').lower()
+    batch_size = int(os.getenv('CANNIBALIZATION_WRITE_BATCH_SIZE', '1000'))
     uri = os.getenv('NEO4J_URI')
     user = os.getenv('NEO4J_USER')
     password = os.getenv('NEO4J_PASSWORD')
@@ -35,75 +350,71 @@ async def calculate_cannibalization(site_id: str) -> dict:
     conflicts = {}
     conflict_count = 0
     
+    # Neo4j round trips and the similarity search are blocking, so they run
+    # in worker threads while the activity heartbeats
     try:
-        with driver.session() as session:
-            logger.info(f"Fetching pages for site {site_id}")
-            
-            result = session.run("""
-                MATCH (p:Page {siteId: $site_id})
-                WHERE p.embedding IS NOT NULL 
-                  AND p.targetKeyword IS NOT NULL
-                RETURN p.id as id, 
-                       p.url as url, 
-                       p.embedding as embedding, 
-                       p.targetKeyword as keyword
-                ORDER BY p.url
-            """, site_id=site_id)
-            
-            pages = list(result)
-            logger.info(f"Found {len(pages)} pages to analyze")
+        logger.info(f"Fetching pages for site {site_id}")
+        pages, page_hashes = await _in_thread("fetch", _fetch_analyzable_pages, driver, site_id)
+        logger.info(f"Found {len(pages)} pages to analyze")
+        
+        if incremental:
+            dirty = [i for i, p in enumerate(pages) if p.get('analyzed_hash') != page_hashes[i]]
+            dirty_ids = [pages[i]['id'] for i in dirty]
+            logger.info(f"Incremental run: {len(dirty)} of {len(pages)} pages changed")
             
-            session.run("""
-                MATCH (p:Page {siteId: $site_id})-[r:CANNIBALIZES]->()
-                DELETE r
-            """, site_id=site_id)
+            touched_ids = await _in_thread("delete", _delete_cannibalization, driver, site_id, dirty_ids)
             
-            for i in range(len(pages)):
-                page_conflicts = []
-                
-                for j in range(i + 1, len(pages)):
-                    p1 = pages[i]
-                    p2 = pages[j]
-                    
-                    if p1['keyword'] == p2['keyword']:
-                        continue
-                    
-                    similarity = cosine_similarity(p1['embedding'], p2['embedding'])
-                    
-                    if similarity >= threshold:
-                        conflict_count += 1
-                        page_conflicts.append(p2['url'])
-                        
-                        session.run("""
-                            MATCH (p1:Page {id: $id1}), (p2:Page {id: $id2})
-                            CREATE (p1)-[r:CANNIBALIZES {
-                                similarity: $similarity,
-                                detectedAt: datetime(),
-                                keyword1: $kw1,
-                                keyword2: $kw2
-                            }]->(p2)
-                        """, id1=p1['id'], id2=p2['id'], 
-                             similarity=similarity,
-                             kw1=p1['keyword'], kw2=p2['keyword'])
-                        
-                        logger.warning(
-                            f"Cannibalization: {p1['url']} ({p1['keyword']}) "
-                            f"<-> {p2['url']} ({p2['keyword']}) | "
-                            f"Similarity: {similarity:.2f}"
-                        )
-                
-                if page_conflicts:
-                    conflicts[p1['url']] = page_conflicts
+            pairs = await _in_thread(
+                "incremental",
+                find_similar_pairs_for_rows,
+                [p['embedding'] for p in pages],
+                [p['keyword'] for p in pages],
+                dirty,
+                threshold=threshold,
+                memory_budget_mb=float(os.getenv('SIMILARITY_BLOCK_MEMORY_MB', '256'))
+            )
+            engine_stats = {"engine": "incremental", "dirty_pages": len(dirty)}
+            hashes = [{"id": pages[i]['id'], "hash": page_hashes[i]} for i in dirty]
+        else:
+            await _in_thread("delete", _delete_cannibalization, driver, site_id)
             
-            session.run("""
-                MATCH (p:Page {siteId: $site_id})
-                SET p.cannibalizationStatus = CASE 
-                    WHEN EXISTS((p)-[:CANNIBALIZES]-()) THEN 'conflict'
-                    ELSE 'ok'
-                END
-            """, site_id=site_id)
+            pairs, engine_stats = await _detect_pairs(site_id, pages, threshold, engine)
+            touched_ids = None
+            hashes = [{"id": p['id'], "hash": h} for p, h in zip(pages, page_hashes)]
+        
+        page_conflicts = {}
+        rows = []
+        for i, j, similarity in pairs:
+            p1 = pages[i]
+            p2 = pages[j]
+            conflict_count += 1
+            page_conflicts.setdefault(i, []).append(p2['url'])
+            rows.append({
+                "id1": p1['id'],
+                "id2": p2['id'],
+                "similarity": similarity,
+                "kw1": p1['keyword'],
+                "kw2": p2['keyword']
+            })
             
-            logger.info(f"Analysis complete: {conflict_count} conflicts found")
+            logger.warning(
+                f"Cannibalization: {p1['url']} ({p1['keyword']}) "
+                f"<-> {p2['url']} ({p2['keyword']}) | "
+                f"Similarity: {similarity:.2f}"
+            )
+        
+        for i, urls in page_conflicts.items():
+            conflicts[pages[i]['url']] = urls
+        
+        conflict_ids = {row["id1"] for row in rows} | {row["id2"] for row in rows}
+        status_ids = touched_ids | conflict_ids if incremental else None
+        write_stats = await _in_thread(
+            "write",
+            _write_cannibalization,
+            driver, site_id, rows, conflict_ids, batch_size, hashes, status_ids
+        )
+        
+        logger.info(f"Analysis complete: {conflict_count} conflicts found")
     
     finally:
         driver.close()
@@ -112,9 +423,163 @@ async def calculate_cannibalization(site_id: str) -> dict:
         "conflicts": conflicts,
         "total_conflicts": conflict_count,
         "pages_analyzed": len(pages),
-        "threshold": threshold
+        "threshold": threshold,
+        **engine_stats,
+        **write_stats
     }
 
+def _get_clickhouse_client() -> Client:
+    """ClickHouse client for the SERP tables."""
+    return Client(
+        host=os.getenv('CLICKHOUSE_HOST', 'localhost'),
+        port=int(os.getenv('CLICKHOUSE_PORT', '9000')),
+        user=os.getenv('CLICKHOUSE_USER', 'default'),
+        password=os.getenv('CLICKHOUSE_PASSWORD', ''),
+        database=os.getenv('CLICKHOUSE_DATABASE', 'apexseo')
+    )
+
+def _get_centroid_cache() -> CentroidCache:
+    """Lazy create the process-wide SERP centroid cache."""
+    global _centroid_cache
+    if _centroid_cache is None:
+        _centroid_cache = CentroidCache(
+            max_entries=int(os.getenv('CENTROID_CACHE_SIZE', '1024')),
+            ttl_seconds=float(os.getenv('CENTROID_CACHE_TTL_SECONDS', '3600'))
+        )
+    return _centroid_cache
+
+def _ensure_centroid_table(ch_client: Client) -> None:
+    """Create the serp_centroids table once per process."""
+    global _centroid_table_ready
+    if _centroid_table_ready:
+        return
+    ch_client.execute("""
+        CREATE TABLE IF NOT EXISTS serp_centroids (
+            keyword String,
+            snapshot_at DateTime,
+            centroid Array(Float32),
+            competitor_count UInt32,
+            computed_at DateTime
+        ) ENGINE = ReplacingMergeTree(computed_at)
+        ORDER BY (keyword, snapshot_at)
+    """)
+    _centroid_table_ready = True
+
+def _competitor_profiles(keywords: list) -> dict:
+    """
+    Centroid of the top-10 SERP embeddings for each keyword.
+    
+    Fresh cache entries are served without querying ClickHouse. For
+    missing or expired keywords one small aggregate query reads the SERP
+    snapshot (the latest created_at of the keyword's serp_results rows);
+    an expired entry built from that snapshot is renewed as is. The rest
+    are looked up in the materialized serp_centroids table (when
+    CENTROID_CACHE_CLICKHOUSE is enabled) at the same snapshot, and only
+    then recomputed from the latest result per position, with one query
+    for all remaining keywords. A refreshed SERP is thus picked up within
+    CENTROID_CACHE_TTL_SECONDS.
+    
+    Returns:
+        {keyword: (centroid, competitor_count)} for keywords with SERP data
+    """
+    if not keywords:
+        return {}
+    
+    cache = _get_centroid_cache()
+    profiles, missing = cache.get_many(keywords)
+    if not missing:
+        return profiles
+    
+    materialize = os.getenv('CENTROID_CACHE_CLICKHOUSE', 'false').lower() == 'true'
+    ch_client = _get_clickhouse_client()
+    
+    try:
+        snapshots = dict(ch_client.execute("""
+            SELECT keyword, max(created_at) AS snapshot_at
+            FROM serp_results
+            WHERE keyword IN %(keywords)s
+            AND embedding IS NOT NULL
+            GROUP BY keyword
+        """, {'keywords': tuple(missing)}))
+        
+        # Keywords without SERP data have no profile
+        missing = [kw for kw in missing if kw in snapshots]
+        for keyword in missing:
+            entry = cache.revalidate(keyword, snapshots[keyword])
+            if entry is not None:
+                profiles[keyword] = entry
+        missing = [kw for kw in missing if kw not in profiles]
+        
+        if missing and materialize:
+            _ensure_centroid_table(ch_client)
+            stored = ch_client.execute("""
+                SELECT keyword, centroid, competitor_count
+                FROM serp_centroids FINAL
+                WHERE (keyword, snapshot_at) IN %(keys)s
+            """, {'keys': tuple((kw, snapshots[kw]) for kw in missing)})
+            
+            for keyword, centroid, count in stored:
+                centroid = list(centroid)
+                cache.put(keyword, snapshots[keyword], centroid, count)
+                profiles[keyword] = (centroid, count)
+            missing = [kw for kw in missing if kw not in profiles]
+        
+        if missing:
+            query = """
+                SELECT keyword, embedding
+                FROM (
+                    SELECT keyword, position, embedding
+                    FROM serp_results
+                    WHERE keyword IN %(keywords)s
+                    AND embedding IS NOT NULL
+                    ORDER BY keyword, position, created_at DESC
+                    LIMIT 1 BY keyword, position
+                )
+                ORDER BY keyword, position ASC
+                LIMIT 10 BY keyword
+            """
+            
+            competitors = {}
+            for keyword, embedding in ch_client.execute(query, {'keywords': tuple(missing)}):
+                competitors.setdefault(keyword, []).append(embedding)
+            
+            computed = []
+            for keyword, embeddings in competitors.items():
+                centroid = calculate_centroid(embeddings)
+                cache.put(keyword, snapshots[keyword], centroid, len(embeddings))
+                profiles[keyword] = (centroid, len(embeddings))
+                computed.append([keyword, snapshots[keyword], centroid, len(embeddings), datetime.now()])
+            
+            if materialize and computed:
+                ch_client.execute(
+                    "INSERT INTO serp_centroids "
+                    "(keyword, snapshot_at, centroid, competitor_count, computed_at) VALUES",
+                    computed
+                )
+    finally:
+        ch_client.disconnect()
+    
+    return profiles
+
+def _write_content_scores(site_id: str, rows: list) -> None:
+    """Write content scores ({url, score, comp_count} rows) with one UNWIND statement."""
+    uri = os.getenv('NEO4J_URI')
+    neo_user = os.getenv('NEO4J_USER')
+    neo_password = os.getenv('NEO4J_PASSWORD')
+    driver = GraphDatabase.driver(uri, auth=(neo_user, neo_password))
+    
+    try:
+        with driver.session() as session:
+            session.run("""
+                UNWIND $rows AS row
+                MATCH (p:Page {siteId: $site_id, url: row.url})
+                SET p.contentScore = row.score,
+                    p.contentScoreUpdatedAt = datetime(),
+                    p.competitorCount = row.comp_count
+            """, site_id=site_id, rows=rows)
+    finally:
+        driver.close()
+
 @activity.defn
 async def compute_content_score(
     content: str,
@@ -139,75 +604,124 @@ async def compute_content_score(
     """
     logger.info(f"Computing content score for {page_url} (keyword: {target_keyword})")
     
-    user_embedding = generate_embedding_local(content)
-    
-    ch_client = Client(
-        host=os.getenv('CLICKHOUSE_HOST', 'localhost'),
-        port=int(os.getenv('CLICKHOUSE_PORT', '9000')),
-        user=os.getenv('CLICKHOUSE_USER', 'default'),
-        password=os.getenv('CLICKHOUSE_PASSWORD', ''),
-        database=os.getenv('CLICKHOUSE_DATABASE', 'apexseo')
-    )
+    user_embedding = await asyncio.to_thread(generate_embedding_local, content)
     
     score = 50.0
-    competitor_embeddings = []
+    competitor_count = 0
     
-    try:
-        query = """
-            SELECT page_url, embedding 
-            FROM serp_results 
-            WHERE keyword = %(keyword)s 
-            AND embedding IS NOT NULL
-            ORDER BY position ASC 
-            LIMIT 10
-        """
+    profiles = await asyncio.to_thread(_competitor_profiles, [target_keyword])
+    
+    if target_keyword in profiles:
+        ideal_profile, competitor_count = profiles[target_keyword]
+        logger.info(f"Found {competitor_count} competitor embeddings")
         
-        results = ch_client.execute(query, {'keyword': target_keyword})
+        similarity = cosine_similarity(user_embedding, ideal_profile)
+        score = round(similarity * 100, 2)
+        logger.info(f"Content score calculated: {score}/100")
+    else:
+        logger.warning(f"No SERP data found for keyword: {target_keyword}")
+        score = 50.0
+    
+    await asyncio.to_thread(_write_content_scores, site_id, [{
+        "url": page_url,
+        "score": score,
+        "comp_count": competitor_count
+    }])
+    logger.info(f"Updated Neo4j with content score for {page_url}")
+    
+    return score
+
+@activity.defn
+async def compute_content_scores_batch(site_id: str, pages: list) -> dict:
+    """
+    Score many pages against their SERP competitors in one pass.
+    
+    Batch variant of `compute_content_score`: competitor centroids for
+    all distinct keywords come from the centroid cache or, for missing
+    and expired keywords, a snapshot query plus one more ClickHouse query;
+    page texts are embedded in one model batch and all scores are written
+    back with one UNWIND statement.
+    
+    Args:
+        site_id: Site identifier
+        pages: [{"url": str, "content": str, "target_keyword": str}, ...]
         
-        if len(results) > 0:
-            competitor_embeddings = [row[1] for row in results]
-            logger.info(f"Found {len(competitor_embeddings)} competitor embeddings")
-            
-            ideal_profile = calculate_centroid(competitor_embeddings)
-            similarity = cosine_similarity(user_embedding, ideal_profile)
-            score = round(similarity * 100, 2)
-            logger.info(f"Content score calculated: {score}/100")
+    Returns:
+        {
+            "scores": {"page_url": float},
+            "scored": int,
+            "centroid_cache": {"hits": int, "misses": int, ...}
+        }
+    """
+    if not pages:
+        return {"scores": {}, "scored": 0, "centroid_cache": _get_centroid_cache().stats()}
+    
+    keywords = sorted({p['target_keyword'] for p in pages})
+    logger.info(f"Computing content scores for {len(pages)} pages ({len(keywords)} keywords)")
+    
+    profiles = await asyncio.to_thread(_competitor_profiles, keywords)
+    user_embeddings = await asyncio.to_thread(embed_texts, [p['content'] for p in pages])
+    
+    rows = []
+    scores = {}
+    for page, user_embedding in zip(pages, user_embeddings):
+        keyword = page['target_keyword']
+        centroid, competitor_count = profiles.get(keyword, (None, 0))
+        if centroid is not None:
+            score = round(cosine_similarity(user_embedding, centroid) * 100, 2)
         else:
-             logger.warning(f"No SERP data found for keyword: {target_keyword}")
-             score = 50.0
-        
-    finally:
-        ch_client.disconnect()
-        
-
+            score = 50.0
+        scores[page['url']] = score
+        rows.append({
+            "url": page['url'],
+            "score": score,
+            "comp_count": competitor_count
+        })
+    
+    missing = [kw for kw in keywords if kw not in profiles]
+    if missing:
+        logger.warning(f"No SERP data found for {len(missing)} keywords")
     
+    await asyncio.to_thread(_write_content_scores, site_id, rows)
+    logger.info(f"Updated Neo4j with {len(rows)} content scores")
+    
+    return {"scores": scores, "scored": len(rows), "centroid_cache": _get_centroid_cache().stats()}
+
+def _fetch_site_pages(site_id: str, skip: int, limit: Optional[int]) -> list:
+    """Read one URL-ordered slice of a site's pages."""
     uri = os.getenv('NEO4J_URI')
-    neo_user = os.getenv('NEO4J_USER')
-    neo_password = os.getenv('NEO4J_PASSWORD')
-    driver = GraphDatabase.driver(uri, auth=(neo_user, neo_password))
+    user = os.getenv('NEO4J_USER')
+    password = os.getenv('NEO4J_PASSWORD')
+    driver = GraphDatabase.driver(uri, auth=(user, password))
     
     try:
         with driver.session() as session:
-            session.run("""
-                MATCH (p:Page {siteId: $site_id, url: $url})
-                SET p.contentScore = $score,
-                    p.contentScoreUpdatedAt = datetime(),
-                    p.competitorCount = $comp_count
-            """, site_id=site_id, url=page_url, score=score, 
-                 comp_count=len(competitor_embeddings))
+            result = session.run("""
+                MATCH (p:Page {siteId: $site_id})
+                RETURN p.url as url, 
+                       p.content as content, 
+                       p.targetKeyword as target_keyword
+                ORDER BY p.url
+                SKIP $skip
+            """ + ("LIMIT $limit" if limit is not None else ""),
+                site_id=site_id, skip=skip, limit=limit)
             
-            logger.info(f"Updated Neo4j with content score for {page_url}")
-    
+            return [dict(record) for record in result]
     finally:
         driver.close()
-    
-    return score
 
 @activity.defn
-async def fetch_site_pages(site_id: str) -> list:
+async def fetch_site_pages(site_id: str, skip: int = 0, limit: Optional[int] = None) -> list:
     """
     Fetch all pages for a site to enable scoring.
+    
+    `skip`/`limit` page through the site in URL order so large sites can be
+    scored in slices by child workflows.
     """
+    return await asyncio.to_thread(_fetch_site_pages, site_id, skip, limit)
+
+def _count_site_pages(site_id: str) -> int:
+    """Count a site's pages in Neo4j."""
     uri = os.getenv('NEO4J_URI')
     user = os.getenv('NEO4J_USER')
     password = os.getenv('NEO4J_PASSWORD')
@@ -215,13 +729,40 @@ async def fetch_site_pages(site_id: str) -> list:
     
     try:
         with driver.session() as session:
-            result = session.run("""
+            record = session.run("""
                 MATCH (p:Page {siteId: $site_id})
-                RETURN p.url as url, 
-                       p.content as content, 
-                       p.targetKeyword as target_keyword
-            """, site_id=site_id)
+                RETURN count(p) as total
+            """, site_id=site_id).single()
             
-            return [dict(record) for record in result]
+            return record["total"] if record else 0
     finally:
         driver.close()
+
+@activity.defn
+async def compute_content_scores_slice(site_id: str, skip: int, limit: int) -> dict:
+    """
+    Score one URL-ordered slice of a site's pages.
+    
+    The slice is read from Neo4j here rather than passed in, so page
+    content never goes through workflow history. Pages without content
+    or a target keyword are skipped.
+    
+    Returns:
+        {"scored": int, "skipped": int, "centroid_cache": {...}}
+    """
+    pages = await asyncio.to_thread(_fetch_site_pages, site_id, skip, limit)
+    scorable = [p for p in pages if p.get('content') and p.get('target_keyword')]
+    result = await compute_content_scores_batch(site_id, scorable)
+    
+    return {
+        "scored": result["scored"],
+        "skipped": len(pages) - len(scorable),
+        "centroid_cache": result["centroid_cache"]
+    }
+
+@activity.defn
+async def count_site_pages(site_id: str) -> int:
+    """
+    Count the pages of a site, so workflows can plan scoring slices.
+    """
+    return await asyncio.to_thread(_count_site_pages, site_id)
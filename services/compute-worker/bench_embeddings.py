@@ -0,0 +1,58 @@
+"""
+Throughput benchmark: single-call vs batched vs chunked local embeddings.
+
+Usage:
+    python bench_embeddings.py [--docs 200] [--words 1500] [--batch-size 32]
+"""
+
+import argparse
+import random
+import time
+
+import vector_utils
+
+VOCABULARY = (
+    "seo keyword ranking content search engine optimization backlink page "
+    "crawl index audit schema snippet intent cluster topic authority link "
+    "title meta description canonical sitemap traffic query serp competitor"
+).split()
+
+def make_documents(n_docs: int, n_words: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(VOCABULARY) for _ in range(n_words)) + f" doc-{i}"
+        for i in range(n_docs)
+    ]
+
+def run(label: str, fn, docs: list, n_words: int) -> None:
+    vector_utils.get_embedding_cache().clear()
+    started = time.perf_counter()
+    fn(docs)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:<28} {elapsed:8.2f}s  "
+        f"{len(docs) / elapsed:8.1f} docs/s  "
+        f"{len(docs) * n_words / elapsed:10.0f} words/s"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--words", type=int, default=1500)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    docs = make_documents(args.docs, args.words)
+    # Load the model outside the timed sections
+    vector_utils._get_model()
+
+    print(f"Embedding {args.docs} documents of ~{args.words} words")
+    run("single call (truncated)", lambda d: [vector_utils.generate_embedding_local(t) for t in d], docs, args.words)
+    run("batched (truncated)", lambda d: vector_utils.embed_texts(d, batch_size=args.batch_size, chunked=False), docs, args.words)
+    run("batched + chunked (mean)", lambda d: vector_utils.embed_texts(d, batch_size=args.batch_size, chunked=True), docs, args.words)
+    run("chunked per doc (weighted)", lambda d: [
+        vector_utils.embed_long_text(t, pooling="weighted", batch_size=args.batch_size) for t in d
+    ], docs, args.words)
+
+if __name__ == "__main__":
+    main()
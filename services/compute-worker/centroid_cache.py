@@ -0,0 +1,113 @@
+"""
+In-process cache of SERP competitor centroids for content scoring.
+Entries are keyed by keyword and remember the SERP snapshot they were
+built from; they are evicted LRU and expired after a TTL to bound memory
+and staleness.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+class CentroidCache:
+    """
+    LRU + TTL cache mapping keyword -> (snapshot, centroid, competitor_count).
+
+    A fresh entry is served without looking at the SERP. Once it expires it
+    is kept (until evicted) with its snapshot, the time of the keyword's
+    latest SERP results it was built from, so the caller can `revalidate`
+    it against the current snapshot instead of recomputing the centroid.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, object, List[float], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def get(self, keyword: str) -> Optional[Tuple[List[float], int]]:
+        """
+        Return (centroid, competitor_count) or None on miss/expiry.
+        """
+        with self._lock:
+            entry = self._entries.get(keyword)
+            if entry is None or self._clock() >= entry[0]:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(keyword)
+            self.hits += 1
+            return entry[2], entry[3]
+
+    def get_many(self, keywords: List[str]) -> Tuple[Dict[str, Tuple[List[float], int]], List[str]]:
+        """
+        Look up several keywords.
+
+        Returns:
+            (found, missing) where found maps keyword -> cached entry and
+            missing lists keywords that are absent or expired
+        """
+        found, missing = {}, []
+        for keyword in keywords:
+            entry = self.get(keyword)
+            if entry is None:
+                missing.append(keyword)
+            else:
+                found[keyword] = entry
+        return found, missing
+
+    def revalidate(self, keyword: str, snapshot: object) -> Optional[Tuple[List[float], int]]:
+        """
+        Renew an expired entry if it was built from `snapshot`.
+
+        Returns:
+            (centroid, competitor_count), or None if there is no entry or
+            the SERP has been refreshed since it was built
+        """
+        with self._lock:
+            entry = self._entries.get(keyword)
+            if entry is None or entry[1] != snapshot:
+                return None
+            self._entries[keyword] = (self._clock() + self.ttl_seconds, snapshot, entry[2], entry[3])
+            self._entries.move_to_end(keyword)
+            self.revalidations += 1
+            return entry[2], entry[3]
+
+    def put(self, keyword: str, snapshot: object, centroid: List[float], competitor_count: int) -> None:
+        """Store a centroid, evicting the least recently used entry if full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[keyword] = (self._clock() + self.ttl_seconds, snapshot, centroid, competitor_count)
+            self._entries.move_to_end(keyword)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all entries and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.revalidations = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters for activity results and logs."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
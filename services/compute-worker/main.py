@@ -2,8 +2,16 @@ import asyncio
 import os
 from temporalio.client import Client
 from temporalio.worker import Worker
-from activities import calculate_cannibalization, compute_content_score, fetch_site_pages
-from workflows import CannibalizationWorkflow
+from activities import (
+    calculate_cannibalization,
+    compute_content_score,
+    compute_content_scores_batch,
+    compute_content_scores_slice,
+    count_site_pages,
+    fetch_site_pages,
+    shutdown_process_pools
+)
+from workflows import CannibalizationWorkflow, ContentScoringWorkflow
 
 async def main():
     temporal_addr = os.getenv("TEMPORAL_ADDRESS", "localhost:7233")
@@ -12,12 +20,22 @@ async def main():
     worker = Worker(
         client,
         task_queue="seo-compute-queue",
-        activities=[calculate_cannibalization, compute_content_score, fetch_site_pages],
-        workflows=[CannibalizationWorkflow],
+        activities=[
+            calculate_cannibalization,
+            compute_content_score,
+            compute_content_scores_batch,
+            compute_content_scores_slice,
+            count_site_pages,
+            fetch_site_pages
+        ],
+        workflows=[CannibalizationWorkflow, ContentScoringWorkflow],
     )
 
     print(f"Starting Python Compute Worker on {temporal_addr}...")
-    await worker.run()
+    try:
+        await worker.run()
+    finally:
+        shutdown_process_pools()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -4,11 +4,22 @@ Handles embedding generation and similarity calculations.
 """
 
 import numpy as np
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 import openai
 from openai import AsyncOpenAI
 import os
+import hashlib
+import re
+import itertools
+import logging
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict, deque
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
 
 # Initialize model once (global)
 _model: Optional[SentenceTransformer] = None
@@ -20,6 +31,234 @@ def _get_model() -> SentenceTransformer:
         _model = SentenceTransformer('all-MiniLM-L6-v2')
     return _model
 
+EMBEDDING_DIM = 384
+
+class EmbeddingCache:
+    """
+    Content-hash LRU cache of float32 embeddings with a byte budget.
+    
+    Keys are SHA-1 digests of the cleaned text, so identical boilerplate
+    shared by many pages is embedded once.
+    """
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+    
+    def put(self, key: bytes, embedding: np.ndarray) -> None:
+        if embedding.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = embedding
+            self._bytes += embedding.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Lazy create the process-wide embedding cache (EMBEDDING_CACHE_MB)."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        max_mb = float(os.getenv('EMBEDDING_CACHE_MB', '64'))
+        _embedding_cache = EmbeddingCache(int(max_mb * 1024 * 1024))
+    return _embedding_cache
+
+def embed_texts(texts: List[str], batch_size: Optional[int] = None,
+                chunked: Optional[bool] = None) -> np.ndarray:
+    """
+    Embed many texts with the local model, deduplicated and cached.
+    
+    Texts are cleaned, hashed and looked up in the embedding cache;
+    the remaining unique texts are sorted by length (so each batch pads
+    to similar lengths) and encoded `batch_size` at a time. In chunked
+    mode, texts longer than one window go through `embed_long_text`
+    instead of being truncated by the model.
+    
+    Args:
+        texts: Input texts to embed
+        batch_size: Texts per model call (default EMBEDDING_BATCH_SIZE or 32)
+        chunked: Pool overlapping windows for long texts (default EMBEDDING_CHUNKED)
+        
+    Returns:
+        (len(texts), 384) float32 array; empty texts map to zero rows
+    """
+    if batch_size is None:
+        batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))
+    if chunked is None:
+        chunked = os.getenv('EMBEDDING_CHUNKED', 'false').lower() == 'true'
+    
+    result = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    cache = get_embedding_cache()
+    # Chunked and truncated embeddings of the same text must not collide
+    key_prefix = b"chunked:" if chunked else b""
+    
+    # clean text slightly, then group identical texts by content hash
+    pending = {}
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            continue
+        clean_text = text.replace("\n", " ").strip()
+        key = hashlib.sha1(key_prefix + clean_text.encode("utf-8")).digest()
+        if key in pending:
+            pending[key][1].append(i)
+            continue
+        cached = cache.get(key)
+        if cached is not None:
+            result[i] = cached
+        else:
+            pending[key] = (clean_text, [i])
+    
+    if chunked:
+        window_words = int(os.getenv('EMBEDDING_CHUNK_WORDS', '180'))
+        for key in list(pending):
+            clean_text, rows = pending[key]
+            words = itertools.islice(re.finditer(r"\S+", clean_text), window_words + 1)
+            if sum(1 for _ in words) > window_words:
+                embedding = embed_long_text(clean_text, window_words=window_words, batch_size=batch_size)
+                cache.put(key, embedding)
+                result[rows] = embedding
+                del pending[key]
+    
+    if not pending:
+        return result
+    
+    model = _get_model()
+    ordered = sorted(pending.items(), key=lambda item: len(item[1][0]), reverse=True)
+    for start in range(0, len(ordered), batch_size):
+        batch = ordered[start:start + batch_size]
+        encoded = model.encode(
+            [clean_text for _, (clean_text, _) in batch],
+            batch_size=batch_size,
+            convert_to_numpy=True
+        ).astype(np.float32, copy=False)
+        for (key, (_, rows)), embedding in zip(batch, encoded):
+            embedding = embedding.copy()
+            cache.put(key, embedding)
+            result[rows] = embedding
+    
+    return result
+
+def iter_text_windows(text: str, window_words: int, overlap_words: int) -> Iterator[Tuple[str, int]]:
+    """
+    Lazily split text into overlapping word windows.
+    
+    Words are scanned with a regex iterator, so the full word list of a
+    very large document is never materialized.
+    
+    Yields:
+        (window_text, word_count)
+    """
+    step = max(1, window_words - overlap_words)
+    window = deque(maxlen=window_words)
+    pending = 0
+    emitted = False
+    
+    for match in re.finditer(r"\S+", text):
+        window.append(match.group(0))
+        pending += 1
+        if len(window) == window_words and (not emitted or pending >= step):
+            yield " ".join(window), len(window)
+            pending = 0
+            emitted = True
+    
+    if not emitted and window:
+        yield " ".join(window), len(window)
+    elif pending > 0:
+        # Partial tail window: the unseen words plus the usual overlap
+        tail = list(window)[-(pending + overlap_words):]
+        yield " ".join(tail), len(tail)
+
+def embed_long_text(
+    text: str,
+    window_words: Optional[int] = None,
+    overlap_words: Optional[int] = None,
+    pooling: str = "mean",
+    batch_size: Optional[int] = None
+) -> np.ndarray:
+    """
+    Embed a document longer than the model's token limit.
+    
+    The text is split into overlapping word windows which are encoded
+    `batch_size` at a time and pooled into a running sum, so memory stays
+    O(batch_size x 384) regardless of document length.
+    
+    Args:
+        text: Input text to embed
+        window_words: Words per window (default EMBEDDING_CHUNK_WORDS or 180)
+        overlap_words: Words shared by consecutive windows (default EMBEDDING_CHUNK_OVERLAP or 30)
+        pooling: "mean" (every window counts once) or "weighted" (by word count)
+        batch_size: Windows per model call (default EMBEDDING_BATCH_SIZE or 32)
+        
+    Returns:
+        384-dim float32 vector (zeros for empty text)
+    """
+    if pooling not in ("mean", "weighted"):
+        raise ValueError(f"Unknown pooling: {pooling}")
+    if window_words is None:
+        window_words = int(os.getenv('EMBEDDING_CHUNK_WORDS', '180'))
+    if overlap_words is None:
+        overlap_words = int(os.getenv('EMBEDDING_CHUNK_OVERLAP', '30'))
+    if batch_size is None:
+        batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))
+    
+    total = np.zeros(EMBEDDING_DIM, dtype=np.float64)
+    total_weight = 0.0
+    model = None
+    
+    windows = iter_text_windows(text.replace("\n", " "), window_words, overlap_words)
+    while True:
+        batch = list(itertools.islice(windows, batch_size))
+        if not batch:
+            break
+        if model is None:
+            model = _get_model()
+        encoded = model.encode([chunk for chunk, _ in batch], batch_size=batch_size, convert_to_numpy=True)
+        if pooling == "weighted":
+            weights = np.array([count for _, count in batch], dtype=np.float64)
+        else:
+            weights = np.ones(len(batch), dtype=np.float64)
+        total += weights @ encoded
+        total_weight += weights.sum()
+    
+    if total_weight == 0:
+        return np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    return (total / total_weight).astype(np.float32)
+
 def generate_embedding_local(text: str) -> List[float]:
     """
     Generate embedding using local sentence-transformers model.
@@ -32,13 +271,9 @@ def generate_embedding_local(text: str) -> List[float]:
     """
     if not text or not text.strip():
         # Return zero vector of dimension 384
-        return [0.0] * 384
-        
-    model = _get_model()
-    # clean text slightly
-    clean_text = text.replace("\n", " ").strip()
-    embedding = model.encode(clean_text)
-    return embedding.tolist()
+        return [0.0] * EMBEDDING_DIM
+    
+    return embed_texts([text])[0].tolist()
 
 async def generate_embedding_openai(text: str, api_key: str) -> List[float]:
     """
@@ -78,7 +313,7 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     Returns:
         float between 0.0 and 1.0
     """
-    if not vec1 or not vec2:
+    if len(vec1) == 0 or len(vec2) == 0:
         return 0.0
         
     v1 = np.array(vec1)
@@ -149,3 +384,520 @@ def batch_similarity_search(query_embedding: List[float], candidate_embeddings:
     # Find indices > threshold
     indices = np.where(similarities > threshold)[0]
     return indices.tolist()
+
+def normalize_embeddings(embeddings: List[List[float]]) -> np.ndarray:
+    """
+    Stack embeddings into an L2-normalized float32 matrix.
+    
+    Args:
+        embeddings: List of embedding vectors (empty vectors allowed)
+        
+    Returns:
+        (N, D) float32 matrix; empty or zero-norm rows stay all-zero
+    """
+    dim = next((len(vec) for vec in embeddings if vec), 0)
+    matrix = np.zeros((len(embeddings), dim), dtype=np.float32)
+    
+    for i, vec in enumerate(embeddings):
+        if vec:
+            matrix[i] = vec
+    
+    norms = np.linalg.norm(matrix, axis=1)
+    safe_norms = np.where(norms == 0, 1, norms).astype(np.float32)
+    matrix /= safe_norms[:, np.newaxis]
+    return matrix
+
+def block_rows_for_budget(n_rows: int, memory_budget_mb: float) -> int:
+    """
+    Number of rows per similarity tile that fits in the RAM budget.
+    
+    Each tile holds an (rows, N) float32 similarity block plus two
+    boolean masks of the same shape, so ~6 bytes per cell.
+    
+    Args:
+        n_rows: Total number of rows (N)
+        memory_budget_mb: Budget for a single tile in megabytes
+        
+    Returns:
+        Rows per tile (at least 1)
+    """
+    if n_rows == 0:
+        return 1
+    bytes_per_row = n_rows * 6
+    return max(1, int(memory_budget_mb * 1024 * 1024 // bytes_per_row))
+
+def find_similar_pairs(
+    embeddings: List[List[float]],
+    keywords: List[str],
+    threshold: float = 0.85,
+    memory_budget_mb: float = 256.0
+) -> List[Tuple[int, int, float]]:
+    """
+    Find all pairs (i < j) with different keywords and similarity >= threshold.
+    
+    Normalizes every embedding once into a float32 matrix and computes
+    similarities in row tiles sized to `memory_budget_mb`. Candidates are
+    picked in float32 with a small tolerance and then re-scored with
+    `cosine_similarity`, so the result is identical to the pairwise loop.
+    
+    Args:
+        embeddings: List of embedding vectors
+        keywords: Target keyword per embedding (same order)
+        threshold: Minimum similarity score (default 0.85)
+        memory_budget_mb: RAM budget for one similarity tile
+        
+    Returns:
+        List of (i, j, similarity) sorted by i then j
+    """
+    n = len(embeddings)
+    if n < 2:
+        return []
+    
+    matrix = normalize_embeddings(embeddings)
+    keyword_index = {}
+    keyword_codes = np.array([keyword_index.setdefault(kw, len(keyword_index)) for kw in keywords])
+    block_rows = block_rows_for_budget(n, memory_budget_mb)
+    candidate_threshold = threshold - 1e-4
+    
+    pairs = []
+    for start in range(0, n - 1, block_rows):
+        stop = min(start + block_rows, n)
+        
+        # Only columns >= start can hold upper-triangle pairs for this tile
+        sims = matrix[start:stop] @ matrix[start:].T
+        mask = sims >= candidate_threshold
+        mask &= keyword_codes[start:stop, np.newaxis] != keyword_codes[np.newaxis, start:]
+        mask &= np.arange(start, stop)[:, np.newaxis] < np.arange(start, n)[np.newaxis, :]
+        
+        rows, cols = np.nonzero(mask)
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            i, j = start + r, start + c
+            similarity = cosine_similarity(embeddings[i], embeddings[j])
+            if similarity >= threshold:
+                pairs.append((i, j, similarity))
+    
+    return pairs
+
+def find_similar_pairs_for_rows(
+    embeddings: List[List[float]],
+    keywords: List[str],
+    rows: List[int],
+    threshold: float = 0.85,
+    memory_budget_mb: float = 256.0
+) -> List[Tuple[int, int, float]]:
+    """
+    Like `find_similar_pairs`, but only for pairs touching `rows`.
+    
+    Each listed row is compared against the full set, so the cost is
+    O(len(rows) x N) instead of O(N^2). Used to rescan pages whose
+    embedding changed since the last run.
+    
+    Args:
+        embeddings: List of embedding vectors
+        keywords: Target keyword per embedding (same order)
+        rows: Indices of the rows to rescan
+        threshold: Minimum similarity score (default 0.85)
+        memory_budget_mb: RAM budget for one similarity tile
+        
+    Returns:
+        List of (i, j, similarity) with i < j, sorted by i then j
+    """
+    n = len(embeddings)
+    rows = np.unique(np.asarray(rows, dtype=np.int64))
+    if n < 2 or rows.size == 0:
+        return []
+    
+    matrix = normalize_embeddings(embeddings)
+    keyword_index = {}
+    keyword_codes = np.array([keyword_index.setdefault(kw, len(keyword_index)) for kw in keywords])
+    is_row = np.zeros(n, dtype=bool)
+    is_row[rows] = True
+    block_rows = block_rows_for_budget(n, memory_budget_mb)
+    candidate_threshold = threshold - 1e-4
+    
+    candidates = set()
+    for start in range(0, rows.size, block_rows):
+        block = rows[start:start + block_rows]
+        
+        sims = matrix[block] @ matrix.T
+        mask = sims >= candidate_threshold
+        mask &= keyword_codes[block, np.newaxis] != keyword_codes[np.newaxis, :]
+        # Row-vs-row pairs would be found twice; keep them from the lower row only
+        mask &= ~is_row[np.newaxis, :] | (block[:, np.newaxis] < np.arange(n)[np.newaxis, :])
+        mask[np.arange(block.size), block] = False
+        
+        r, c = np.nonzero(mask)
+        for i, j in zip(block[r].tolist(), c.tolist()):
+            candidates.add((min(i, j), max(i, j)))
+    
+    pairs = []
+    for i, j in sorted(candidates):
+        similarity = cosine_similarity(embeddings[i], embeddings[j])
+        if similarity >= threshold:
+            pairs.append((i, j, similarity))
+    return pairs
+
+def plan_similarity_shards(n_rows: int, n_shards: int) -> List[Tuple[int, int]]:
+    """
+    Split the upper triangle of an N x N pair space into row-block shards.
+    
+    Row i owns N - i - 1 pairs, so boundaries are placed where the
+    cumulative pair count crosses equal fractions of the total.
+    
+    Args:
+        n_rows: Number of rows (N)
+        n_shards: Desired number of shards
+        
+    Returns:
+        List of (start, stop) row ranges covering [0, N - 1)
+    """
+    if n_rows < 2:
+        return []
+    pair_counts = np.arange(n_rows - 1, 0, -1, dtype=np.int64)
+    cumulative = np.cumsum(pair_counts)
+    targets = cumulative[-1] * np.arange(1, n_shards) / n_shards
+    cuts = np.unique(np.searchsorted(cumulative, targets, side="left") + 1)
+    bounds = [0] + [int(c) for c in cuts if 0 < c < n_rows - 1] + [n_rows - 1]
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+class SharedEmbeddingMatrix:
+    """
+    Normalized embeddings and keyword codes placed in shared memory.
+    
+    Shard workers attach by name instead of receiving a pickled copy of
+    the matrix with every task. Use as a context manager so the segments
+    are unlinked when the parent is done.
+    """
+    
+    def __init__(self, embeddings: List[List[float]], keywords: List[str]):
+        matrix = normalize_embeddings(embeddings)
+        keyword_index = {}
+        codes = np.array([keyword_index.setdefault(kw, len(keyword_index)) for kw in keywords],
+                         dtype=np.int64)
+        
+        self._matrix_shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        self._codes_shm = shared_memory.SharedMemory(create=True, size=max(codes.nbytes, 1))
+        np.ndarray(matrix.shape, dtype=np.float32, buffer=self._matrix_shm.buf)[:] = matrix
+        np.ndarray(codes.shape, dtype=np.int64, buffer=self._codes_shm.buf)[:] = codes
+        self.shape = matrix.shape
+    
+    def task(self, start: int, stop: int, threshold: float, memory_budget_mb: float) -> tuple:
+        """Picklable task description for `similarity_shard`."""
+        return (self._matrix_shm.name, self._codes_shm.name, self.shape,
+                start, stop, threshold, memory_budget_mb)
+    
+    def close(self) -> None:
+        for shm in (self._matrix_shm, self._codes_shm):
+            shm.close()
+            shm.unlink()
+    
+    def __enter__(self) -> "SharedEmbeddingMatrix":
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def similarity_shard(task: tuple) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Process-pool entry point: candidate pairs for one row-block shard.
+    
+    Attaches to the shared matrix, tiles rows [start, stop) against all
+    later columns like `find_similar_pairs`, and returns candidate (i, j)
+    index arrays in row-major order. Candidates are re-scored exactly by
+    the caller.
+    """
+    matrix_name, codes_name, shape, start, stop, threshold, memory_budget_mb = task
+    matrix_shm = shared_memory.SharedMemory(name=matrix_name)
+    codes_shm = shared_memory.SharedMemory(name=codes_name)
+    try:
+        matrix = np.ndarray(shape, dtype=np.float32, buffer=matrix_shm.buf)
+        codes = np.ndarray((shape[0],), dtype=np.int64, buffer=codes_shm.buf)
+        n = shape[0]
+        block_rows = block_rows_for_budget(n, memory_budget_mb)
+        candidate_threshold = threshold - 1e-4
+        
+        rows_out, cols_out = [], []
+        for block_start in range(start, stop, block_rows):
+            block_stop = min(block_start + block_rows, stop)
+            sims = matrix[block_start:block_stop] @ matrix[block_start:].T
+            mask = sims >= candidate_threshold
+            mask &= codes[block_start:block_stop, np.newaxis] != codes[np.newaxis, block_start:]
+            mask &= np.arange(block_start, block_stop)[:, np.newaxis] < np.arange(block_start, n)[np.newaxis, :]
+            r, c = np.nonzero(mask)
+            rows_out.append(r + block_start)
+            cols_out.append(c + block_start)
+        
+        if not rows_out:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(rows_out), np.concatenate(cols_out)
+    finally:
+        matrix_shm.close()
+        codes_shm.close()
+
+def rescore_candidates(
+    embeddings: List[List[float]],
+    candidates: List[Tuple[np.ndarray, np.ndarray]],
+    threshold: float
+) -> List[Tuple[int, int, float]]:
+    """
+    Merge shard candidates (in shard order) and keep exact matches.
+    
+    Args:
+        embeddings: Original embedding vectors
+        candidates: (rows, cols) arrays per shard, ordered by shard
+        threshold: Minimum similarity score
+        
+    Returns:
+        List of (i, j, similarity) sorted by i then j
+    """
+    pairs = []
+    for rows, cols in candidates:
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            similarity = cosine_similarity(embeddings[i], embeddings[j])
+            if similarity >= threshold:
+                pairs.append((i, j, similarity))
+    return pairs
+
+class IVFIndex:
+    """
+    In-process inverted-file (IVF) index over normalized embeddings.
+    
+    A spherical k-means quantizer splits the vectors into `n_lists`
+    cells; a query only scores the vectors in its `n_probe` closest cells.
+    Inverted lists are stored CSR-style (ids sorted by cell + offsets) so
+    the whole index is three arrays and can be saved with `np.savez`.
+    """
+    
+    def __init__(self, matrix: np.ndarray, centroids: np.ndarray,
+                 list_ids: np.ndarray, list_offsets: np.ndarray,
+                 fingerprint: str = ""):
+        self.matrix = matrix
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.fingerprint = fingerprint
+    
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: Optional[int] = None,
+              n_iter: int = 10, seed: int = 42) -> "IVFIndex":
+        """
+        Train the quantizer and fill the inverted lists.
+        
+        Args:
+            matrix: (N, D) float32 matrix from `normalize_embeddings`
+            n_lists: Number of cells (default ~sqrt(N))
+            n_iter: K-means iterations on the training sample
+            seed: RNG seed so rebuilds are reproducible
+            
+        Returns:
+            IVFIndex
+        """
+        n = matrix.shape[0]
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+        
+        rng = np.random.default_rng(seed)
+        sample = matrix
+        if n > n_lists * 256:
+            sample = matrix[rng.choice(n, n_lists * 256, replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+        
+        for _ in range(n_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            # Keep the previous centroid for empty cells
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, np.newaxis]
+        
+        labels = np.concatenate([
+            np.argmax(matrix[s:s + 4096] @ centroids.T, axis=1)
+            for s in range(0, n, 4096)
+        ]) if n else np.zeros(0, dtype=np.int64)
+        list_ids = np.argsort(labels, kind="stable")
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_lists), out=list_offsets[1:])
+        
+        return cls(matrix, centroids, list_ids, list_offsets, matrix_fingerprint(matrix))
+    
+    def search(self, queries: np.ndarray, k: int, n_probe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k inner-product search.
+        
+        Args:
+            queries: (Q, D) float32 normalized query matrix
+            k: Neighbours per query
+            n_probe: Cells scanned per query
+            
+        Returns:
+            (indices, similarities), both (Q, k); missing slots are -1 / -inf
+        """
+        n_probe = max(1, min(n_probe, self.centroids.shape[0]))
+        indices = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        sims = np.full((queries.shape[0], k), -np.inf, dtype=np.float32)
+        
+        cell_scores = queries @ self.centroids.T
+        probes = np.argpartition(-cell_scores, n_probe - 1, axis=1)[:, :n_probe]
+        
+        # Score cell by cell: every query probing a cell is compared with
+        # that cell's members in one matmul, keeping a per-cell top-k.
+        hit_queries, hit_ids, hit_sims = [], [], []
+        for c in range(self.centroids.shape[0]):
+            members = self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]]
+            probing = np.nonzero((probes == c).any(axis=1))[0]
+            if members.size == 0 or probing.size == 0:
+                continue
+            scores = queries[probing] @ self.matrix[members].T
+            top = min(k, members.size)
+            best = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+            hit_queries.append(np.repeat(probing, top))
+            hit_ids.append(members[best].ravel())
+            hit_sims.append(np.take_along_axis(scores, best, axis=1).ravel())
+        
+        if not hit_queries:
+            return indices, sims
+        
+        hit_queries = np.concatenate(hit_queries)
+        hit_ids = np.concatenate(hit_ids)
+        hit_sims = np.concatenate(hit_sims)
+        
+        # Merge per-cell candidates: sort by query, then score desc, then id
+        order = np.lexsort((hit_ids, -hit_sims, hit_queries))
+        hit_queries, hit_ids, hit_sims = hit_queries[order], hit_ids[order], hit_sims[order]
+        starts = np.searchsorted(hit_queries, hit_queries, side="left")
+        rank = np.arange(hit_queries.size) - starts
+        keep = rank < k
+        indices[hit_queries[keep], rank[keep]] = hit_ids[keep]
+        sims[hit_queries[keep], rank[keep]] = hit_sims[keep]
+        
+        return indices, sims
+    
+    def save(self, path: str) -> None:
+        """
+        Persist the index arrays to `path` (.npz). Written to a temporary
+        file and renamed into place, so readers never see a partial index.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, matrix=self.matrix, centroids=self.centroids,
+                         list_ids=self.list_ids, list_offsets=self.list_offsets,
+                         fingerprint=np.array(self.fingerprint))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        """Load an index written by `save`."""
+        with np.load(path) as data:
+            return cls(data["matrix"], data["centroids"], data["list_ids"],
+                       data["list_offsets"], str(data["fingerprint"]))
+
+def matrix_fingerprint(matrix: np.ndarray) -> str:
+    """Content hash of an embedding matrix, used to detect stale indexes."""
+    digest = hashlib.sha1(np.ascontiguousarray(matrix).tobytes())
+    digest.update(str(matrix.shape).encode())
+    return digest.hexdigest()
+
+def embedding_hash(embedding: List[float], keyword: str = "") -> str:
+    """Content hash of one page embedding (and its keyword) for change tracking."""
+    digest = hashlib.sha1(np.asarray(embedding, dtype=np.float64).tobytes())
+    digest.update(keyword.encode("utf-8"))
+    return digest.hexdigest()
+
+def load_or_build_ann_index(site_id: str, matrix: np.ndarray,
+                            index_dir: Optional[str] = None) -> IVFIndex:
+    """
+    Load the persisted index for a site, rebuilding it if stale or missing.
+    
+    Args:
+        site_id: Site the index belongs to
+        matrix: Current normalized embedding matrix for the site
+        index_dir: Directory for index files (default ANN_INDEX_DIR env)
+        
+    Returns:
+        IVFIndex matching `matrix`
+    """
+    index_dir = index_dir or os.getenv('ANN_INDEX_DIR', '/tmp/apexseo-ann')
+    safe_site_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in site_id)
+    path = os.path.join(index_dir, f"{safe_site_id}.npz")
+    fingerprint = matrix_fingerprint(matrix)
+    
+    if os.path.exists(path):
+        try:
+            index = IVFIndex.load(path)
+            if index.fingerprint == fingerprint:
+                return index
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            logger.warning(f"Discarding unreadable ANN index {path}: {e}")
+    
+    index = IVFIndex.build(matrix)
+    os.makedirs(index_dir, exist_ok=True)
+    index.save(path)
+    return index
+
+def find_similar_pairs_ann(
+    embeddings: List[List[float]],
+    keywords: List[str],
+    threshold: float = 0.85,
+    top_k: int = 20,
+    n_probe: int = 8,
+    index: Optional[IVFIndex] = None
+) -> List[Tuple[int, int, float]]:
+    """
+    Approximate `find_similar_pairs` using each page's top-k ANN neighbours.
+    
+    Only neighbours returned by the index are scored, so pairs outside a
+    page's top-k (or outside its probed cells) can be missed. Reported
+    similarities are exact `cosine_similarity` values.
+    
+    Args:
+        embeddings: List of embedding vectors
+        keywords: Target keyword per embedding (same order)
+        threshold: Minimum similarity score (default 0.85)
+        top_k: Neighbours scored per page
+        n_probe: IVF cells scanned per page
+        index: Prebuilt index over the same embeddings (built if None)
+        
+    Returns:
+        List of (i, j, similarity) with i < j, sorted by i then j
+    """
+    n = len(embeddings)
+    if n < 2:
+        return []
+    
+    if index is None:
+        index = IVFIndex.build(normalize_embeddings(embeddings))
+    
+    # +1 because every page is its own nearest neighbour
+    neighbours, sims = index.search(index.matrix, top_k + 1, n_probe)
+    candidate_threshold = threshold - 1e-4
+    
+    candidates = set()
+    for i in range(n):
+        for j, sim in zip(neighbours[i].tolist(), sims[i].tolist()):
+            if j < 0 or j == i or sim < candidate_threshold:
+                continue
+            if keywords[i] == keywords[j]:
+                continue
+            candidates.add((min(i, j), max(i, j)))
+    
+    pairs = []
+    for i, j in sorted(candidates):
+        similarity = cosine_similarity(embeddings[i], embeddings[j])
+        if similarity >= threshold:
+            pairs.append((i, j, similarity))
+    return pairs
+
+def pair_recall(approx_pairs: List[Tuple[int, int, float]],
+                exact_pairs: List[Tuple[int, int, float]]) -> float:
+    """Fraction of exact (i, j) pairs that the approximate search found."""
+    if not exact_pairs:
+        return 1.0
+    found = {(i, j) for i, j, _ in approx_pairs}
+    return sum(1 for i, j, _ in exact_pairs if (i, j) in found) / len(exact_pairs)
@@ -1,38 +1,173 @@
+import asyncio
 from datetime import timedelta
 from temporalio import workflow
+from temporalio.common import RetryPolicy
+from temporalio.exceptions import ActivityError, ChildWorkflowError
 
 # Import activity definitions
 with workflow.unsafe.imports_passed_through():
-    from activities import calculate_cannibalization, compute_content_score, fetch_site_pages
+    from activities import (
+        calculate_cannibalization,
+        compute_content_scores_slice,
+        count_site_pages
+    )
+
+DEFAULT_MAX_IN_FLIGHT = 50
+DEFAULT_PAGES_PER_CHILD = 1000
+DEFAULT_MAX_CHILDREN = 4
+DEFAULT_SCORE_BATCH_SIZE = 100
+# Sharded analysis of a large site runs long but heartbeats every few seconds
+CANNIBALIZATION_TIMEOUT = timedelta(hours=2)
+CANNIBALIZATION_HEARTBEAT_TIMEOUT = timedelta(minutes=2)
+
+async def _score_range(site_id: str, skip: int, limit: int, max_in_flight: int,
+                       batch_size: int = DEFAULT_SCORE_BATCH_SIZE) -> dict:
+    """
+    Fan out content scoring over pages [skip, skip + limit) in URL order,
+    `batch_size` pages per compute_content_scores_slice activity and at
+    most `max_in_flight` activities running at once. Activities read their
+    own pages, so only offsets go through workflow history. Failures are
+    collected per batch, not raised.
+    """
+    semaphore = asyncio.Semaphore(max_in_flight)
+    failed = []
+    
+    async def score(offset: int, count: int) -> dict:
+        async with semaphore:
+            try:
+                return await workflow.execute_activity(
+                    compute_content_scores_slice,
+                    args=[site_id, offset, count],
+                    start_to_close_timeout=timedelta(minutes=10),
+                    # Bounded retries so one bad batch surfaces as a failure
+                    retry_policy=RetryPolicy(maximum_attempts=3)
+                )
+            except ActivityError as e:
+                failed.append({
+                    "slice": {"skip": offset, "limit": count},
+                    "error": str(e.cause or e)
+                })
+                return {"scored": 0, "skipped": 0}
+    
+    step = max(1, batch_size)
+    end = skip + limit
+    results = await asyncio.gather(*(
+        score(offset, min(step, end - offset)) for offset in range(skip, end, step)
+    ))
+    
+    return {
+        "scored": sum(r["scored"] for r in results),
+        "skipped": sum(r["skipped"] for r in results),
+        "failed": failed
+    }
+
+async def _score_slices(site_id: str, total_pages: int, pages_per_child: int,
+                        max_children: int, max_in_flight: int, score_batch_size: int) -> dict:
+    """
+    Score a large site with one ContentScoringWorkflow child per slice of
+    `pages_per_child` pages, at most `max_children` running at once. A
+    failed child is collected as a failure for its slice, not raised.
+    """
+    child_semaphore = asyncio.Semaphore(max_children)
+    failed_slices = []
+    
+    async def score_slice(skip: int) -> dict:
+        limit = min(pages_per_child, total_pages - skip)
+        async with child_semaphore:
+            try:
+                return await workflow.execute_child_workflow(
+                    ContentScoringWorkflow.run,
+                    {
+                        "siteId": site_id,
+                        "skip": skip,
+                        "limit": limit,
+                        "maxInFlight": max_in_flight,
+                        "scoreBatchSize": score_batch_size
+                    },
+                    id=f"{workflow.info().workflow_id}-scoring-{skip}"
+                )
+            except ChildWorkflowError as e:
+                failed_slices.append({
+                    "slice": {"skip": skip, "limit": limit},
+                    "error": str(e.cause or e)
+                })
+                return {"scored": 0, "skipped": 0, "failed": []}
+    
+    slices = await asyncio.gather(*(
+        score_slice(skip) for skip in range(0, total_pages, pages_per_child)
+    ))
+    return {
+        "scored": sum(s["scored"] for s in slices),
+        "skipped": sum(s["skipped"] for s in slices),
+        "failed": [f for s in slices for f in s["failed"]] + failed_slices
+    }
+
+@workflow.defn
+class ContentScoringWorkflow:
+    """Scores one URL-ordered slice ({"skip", "limit"}) of a site's pages."""
+    
+    @workflow.run
+    async def run(self, input: dict) -> dict:
+        return await _score_range(
+            input["siteId"],
+            input.get("skip", 0),
+            input["limit"],
+            input.get("maxInFlight", DEFAULT_MAX_IN_FLIGHT),
+            input.get("scoreBatchSize", DEFAULT_SCORE_BATCH_SIZE)
+        )
 
 @workflow.defn
 class CannibalizationWorkflow:
+    """
+    Cannibalization analysis followed by content scoring of every page.
+    
+    Returns a summary dict rather than a bare status string:
+        {"status": "Analysis and Scoring Complete", "scored": int,
+         "skipped": int, "failed": [{"slice": {"skip", "limit"}, "error"}]}
+    """
+    
     @workflow.run
-    async def run(self, input: dict):
+    async def run(self, input: dict) -> dict:
         site_id = input["siteId"]
+        max_in_flight = input.get("maxInFlight", DEFAULT_MAX_IN_FLIGHT)
+        pages_per_child = input.get("pagesPerChild", DEFAULT_PAGES_PER_CHILD)
+        score_batch_size = input.get("scoreBatchSize", DEFAULT_SCORE_BATCH_SIZE)
         
         # 1. Run Cannibalization Analysis
         await workflow.execute_activity(
             calculate_cannibalization,
-            site_id,
-            start_to_close_timeout=timedelta(minutes=5)
+            args=[site_id, input.get("incremental", False)],
+            start_to_close_timeout=CANNIBALIZATION_TIMEOUT,
+            heartbeat_timeout=CANNIBALIZATION_HEARTBEAT_TIMEOUT
         )
         
         # 2. Run Content Scoring
-        # First fetch pages that need scoring
-        pages = await workflow.execute_activity(
-            fetch_site_pages,
+        total_pages = await workflow.execute_activity(
+            count_site_pages,
             site_id,
             start_to_close_timeout=timedelta(minutes=1)
         )
         
-        # Score each page (sequentially for simplicity, or gather for parallel)
-        for page in pages:
-            if page.get('content') and page.get('target_keyword'):
-                await workflow.execute_activity(
-                    compute_content_score,
-                    args=[page['content'], page['target_keyword'], site_id, page['url']],
-                    start_to_close_timeout=timedelta(minutes=2)
-                )
+        if total_pages <= pages_per_child:
+            # Small site: fan out directly from this workflow
+            scoring = await _score_range(site_id, 0, total_pages, max_in_flight, score_batch_size)
+        else:
+            # Large site: one child workflow per slice keeps each history bounded
+            scoring = await _score_slices(
+                site_id,
+                total_pages,
+                pages_per_child,
+                input.get("maxChildren", DEFAULT_MAX_CHILDREN),
+                max_in_flight,
+                score_batch_size
+            )
+        
+        workflow.logger.info(
+            f"Scored {scoring['scored']} pages for {site_id}, "
+            f"{len(scoring['failed'])} failed"
+        )
         
-        return "Analysis and Scoring Complete"
+        return {
+            "status": "Analysis and Scoring Complete",
+            **scoring
+        }
@@ -2,6 +2,9 @@ import pytest
 import numpy as np
 from unittest.mock import Mock, patch, MagicMock
 import asyncio
+import time
+from datetime import datetime
+from temporalio.testing import ActivityEnvironment
 
 # Import functions to test
 import sys
@@ -12,12 +15,48 @@ from vector_utils import (
     generate_embedding_local,
     cosine_similarity,
     calculate_centroid,
-    batch_similarity_search
+    batch_similarity_search,
+    normalize_embeddings,
+    find_similar_pairs,
+    find_similar_pairs_for_rows,
+    find_similar_pairs_ann,
+    embedding_hash,
+    plan_similarity_shards,
+    load_or_build_ann_index,
+    pair_recall,
+    IVFIndex,
+    embed_texts,
+    embed_long_text,
+    get_embedding_cache
 )
 from activities import (
     calculate_cannibalization,
-    compute_content_score
+    compute_content_score,
+    compute_content_scores_batch,
+    compute_content_scores_slice,
+    shutdown_process_pools,
+    _get_centroid_cache,
+    _get_process_pool
 )
+from centroid_cache import CentroidCache
+
+SERP_SNAPSHOT = datetime(2024, 1, 1)
+
+def serp_results(rows):
+    """
+    ClickHouse execute() stand-in serving serp_results queries from
+    (keyword, embedding, created_at) rows.
+    """
+    def execute(sql, params=None):
+        keywords = (params or {}).get('keywords', ())
+        if "max(created_at)" in sql:
+            snapshots = {}
+            for keyword, _, created_at in rows:
+                if keyword in keywords:
+                    snapshots[keyword] = max(snapshots.get(keyword, created_at), created_at)
+            return list(snapshots.items())
+        return [(keyword, embedding) for keyword, embedding, _ in rows if keyword in keywords]
+    return execute
 
 # Test fixtures
 @pytest.fixture
@@ -43,6 +82,13 @@ def mock_clickhouse_client():
     with patch('activities.Client') as mock_client:
         yield mock_client
 
+@pytest.fixture(autouse=True)
+def clear_centroid_cache():
+    """Keep cached SERP centroids from leaking between tests."""
+    _get_centroid_cache().clear()
+    yield
+    _get_centroid_cache().clear()
+
 class TestVectorUtils:
     """Test suite for vector utility functions."""
     
@@ -157,6 +203,217 @@ class TestVectorUtils:
         
         assert abs(sim1 - sim2) < 0.0001, "Cosine similarity must be symmetric"
 
+class TestBatchEmbedding:
+    """Test suite for the batched, cached embedding pipeline."""
+    
+    @pytest.fixture
+    def fake_model(self):
+        """Model stub whose embedding encodes the text length."""
+        model = MagicMock()
+        model.encode.side_effect = lambda batch, **kwargs: np.array(
+            [[float(len(text))] + [0.0] * 383 for text in batch], dtype=np.float64
+        )
+        get_embedding_cache().clear()
+        with patch('vector_utils._get_model', return_value=model):
+            yield model
+        get_embedding_cache().clear()
+    
+    def test_returns_float32_matrix_with_zero_rows_for_empty(self, fake_model):
+        """Output is a float32 array aligned with the input order."""
+        result = embed_texts(["abc", "", "a\nb"])
+        
+        assert result.dtype == np.float32
+        assert result.shape == (3, 384)
+        assert result[0, 0] == 3.0
+        assert not result[1].any()
+        assert result[2, 0] == 3.0  # newline cleaned to a space
+    
+    def test_identical_texts_embedded_once_and_cached(self, fake_model):
+        """Duplicates within and across calls hit the content-hash cache."""
+        embed_texts(["boilerplate", "boilerplate", "unique page"])
+        embed_texts(["boilerplate"])
+        
+        encoded = [text for call in fake_model.encode.call_args_list for text in call.args[0]]
+        assert sorted(encoded) == ["boilerplate", "unique page"]
+        assert get_embedding_cache().stats()["hits"] == 1
+    
+    def test_batches_sorted_by_length(self, fake_model):
+        """Unique texts are encoded longest first in batch_size chunks."""
+        embed_texts(["a", "abcd", "ab", "abc", "abcde"], batch_size=2)
+        
+        batches = [call.args[0] for call in fake_model.encode.call_args_list]
+        assert batches == [["abcde", "abcd"], ["abc", "ab"], ["a"]]
+    
+    def test_long_text_windows_pooled_in_bounded_batches(self, fake_model):
+        """Windows are encoded batch by batch and mean-pooled."""
+        text = " ".join(["w"] * 10)  # windows of 4 with overlap 1 -> 3 windows of 7 chars
+        
+        pooled = embed_long_text(text, window_words=4, overlap_words=1, batch_size=2)
+        
+        assert pooled.dtype == np.float32
+        assert pooled[0] == 7.0
+        assert [len(call.args[0]) for call in fake_model.encode.call_args_list] == [2, 1]
+    
+    def test_weighted_pooling_uses_window_word_counts(self, fake_model):
+        """Weighted pooling favours longer windows over the partial tail."""
+        text = " ".join(["w"] * 5)  # "w w w w" (4 words, 7 chars) + tail "w" (1 word, 1 char)
+        
+        mean = embed_long_text(text, window_words=4, overlap_words=0, pooling="mean")
+        weighted = embed_long_text(text, window_words=4, overlap_words=0, pooling="weighted")
+        
+        assert mean[0] == pytest.approx(4.0)
+        assert weighted[0] == pytest.approx((7.0 * 4 + 1.0) / 5)
+        with pytest.raises(ValueError):
+            embed_long_text(text, pooling="max")
+    
+    def test_chunked_mode_only_splits_long_texts(self, fake_model, monkeypatch):
+        """Short texts stay in the batch path; long ones are pooled."""
+        monkeypatch.setenv('EMBEDDING_CHUNK_WORDS', '4')
+        monkeypatch.setenv('EMBEDDING_CHUNK_OVERLAP', '0')
+        
+        result = embed_texts(["a b", "a b c d e f g h"], chunked=True)
+        
+        encoded = [text for call in fake_model.encode.call_args_list for text in call.args[0]]
+        assert sorted(encoded) == ["a b", "a b c d", "e f g h"]
+        assert result[1, 0] == 7.0
+
+class TestSimilarityEngine:
+    """Test suite for the blocked all-pairs similarity engine."""
+    
+    @staticmethod
+    def _pairwise_reference(embeddings, keywords, threshold):
+        pairs = []
+        for i in range(len(embeddings)):
+            for j in range(i + 1, len(embeddings)):
+                if keywords[i] == keywords[j]:
+                    continue
+                similarity = cosine_similarity(embeddings[i], embeddings[j])
+                if similarity >= threshold:
+                    pairs.append((i, j, similarity))
+        return pairs
+    
+    def test_normalized_matrix_is_float32_unit_rows(self):
+        """Rows should be unit length and zero vectors should stay zero."""
+        matrix = normalize_embeddings([[3.0, 4.0], [0.0, 0.0], []])
+        
+        assert matrix.dtype == np.float32
+        np.testing.assert_array_almost_equal(matrix[0], [0.6, 0.8])
+        np.testing.assert_array_equal(matrix[1], [0.0, 0.0])
+        np.testing.assert_array_equal(matrix[2], [0.0, 0.0])
+    
+    def test_matches_pairwise_loop_across_tiles(self):
+        """Tiled engine must return exactly the pairs of the O(N^2) loop."""
+        rng = np.random.default_rng(7)
+        base = rng.normal(size=(8, 16))
+        embeddings = (base[rng.integers(0, 8, 120)] + rng.normal(scale=0.2, size=(120, 16))).tolist()
+        keywords = [f"kw-{k}" for k in rng.integers(0, 5, 120)]
+        
+        expected = self._pairwise_reference(embeddings, keywords, 0.85)
+        # Tiny budget forces many single-row tiles
+        result = find_similar_pairs(embeddings, keywords, threshold=0.85, memory_budget_mb=0.001)
+        
+        assert len(expected) > 0
+        assert result == expected
+        assert find_similar_pairs(embeddings, keywords, threshold=0.85) == expected
+    
+    def test_row_rescan_matches_full_pairs_touching_rows(self):
+        """Rescanning dirty rows yields exactly the full-run pairs that touch them."""
+        rng = np.random.default_rng(3)
+        base = rng.normal(size=(5, 16))
+        embeddings = (base[rng.integers(0, 5, 80)] + rng.normal(scale=0.2, size=(80, 16))).tolist()
+        keywords = [f"kw-{k}" for k in rng.integers(0, 4, 80)]
+        dirty = [3, 10, 11, 42, 79]
+        
+        full = find_similar_pairs(embeddings, keywords, threshold=0.85)
+        expected = [pair for pair in full if pair[0] in dirty or pair[1] in dirty]
+        result = find_similar_pairs_for_rows(embeddings, keywords, dirty, threshold=0.85,
+                                             memory_budget_mb=0.001)
+        
+        assert len(expected) > 0
+        assert result == expected
+    
+    def test_shard_plan_covers_upper_triangle(self):
+        """Shards are contiguous, ordered and cover every row with pairs."""
+        shards = plan_similarity_shards(1000, 8)
+        
+        assert shards[0][0] == 0
+        assert shards[-1][1] == 999
+        assert all(a[1] == b[0] for a, b in zip(shards, shards[1:]))
+        # Later shards hold fewer pairs per row, so they span more rows
+        assert (shards[-1][1] - shards[-1][0]) > (shards[0][1] - shards[0][0])
+    
+    def test_same_keyword_pairs_are_masked(self):
+        """Identical vectors sharing a keyword should not be reported."""
+        embeddings = [[1.0, 0.0], [1.0, 0.0], [1.0, 0.0]]
+        keywords = ["a", "a", "b"]
+        
+        result = find_similar_pairs(embeddings, keywords, threshold=0.85)
+        
+        assert [(i, j) for i, j, _ in result] == [(0, 2), (1, 2)]
+
+class TestANNIndex:
+    """Test suite for the IVF approximate nearest-neighbour index."""
+    
+    @pytest.fixture
+    def clustered_pages(self):
+        rng = np.random.default_rng(11)
+        base = rng.normal(size=(6, 32))
+        embeddings = (base[rng.integers(0, 6, 200)] + rng.normal(scale=0.15, size=(200, 32))).tolist()
+        keywords = [f"kw-{k}" for k in rng.integers(0, 10, 200)]
+        return embeddings, keywords
+    
+    def test_full_probe_matches_exact_engine(self, clustered_pages):
+        """Probing every cell with a large k should recover every exact pair."""
+        embeddings, keywords = clustered_pages
+        index = IVFIndex.build(normalize_embeddings(embeddings), n_lists=8)
+        
+        exact = find_similar_pairs(embeddings, keywords, threshold=0.85)
+        approx = find_similar_pairs_ann(embeddings, keywords, threshold=0.85,
+                                        top_k=200, n_probe=8, index=index)
+        
+        assert approx == exact
+        assert pair_recall(approx, exact) == 1.0
+    
+    def test_ann_pairs_are_subset_of_exact(self, clustered_pages):
+        """A narrow search may miss pairs but must never invent them."""
+        embeddings, keywords = clustered_pages
+        
+        exact = find_similar_pairs(embeddings, keywords, threshold=0.85)
+        approx = find_similar_pairs_ann(embeddings, keywords, threshold=0.85, top_k=3, n_probe=1)
+        
+        assert set(approx) <= set(exact)
+        assert 0.0 <= pair_recall(approx, exact) <= 1.0
+    
+    def test_index_persisted_and_rebuilt_when_stale(self, clustered_pages, tmp_path):
+        """Saved index is reused for the same matrix and rebuilt when it changes."""
+        embeddings, _ = clustered_pages
+        matrix = normalize_embeddings(embeddings)
+        
+        first = load_or_build_ann_index("site/1", matrix, index_dir=str(tmp_path))
+        reloaded = load_or_build_ann_index("site/1", matrix, index_dir=str(tmp_path))
+        rebuilt = load_or_build_ann_index("site/1", matrix[:150], index_dir=str(tmp_path))
+        
+        assert (tmp_path / "site_1.npz").exists()
+        assert reloaded.fingerprint == first.fingerprint
+        np.testing.assert_array_equal(reloaded.list_ids, first.list_ids)
+        assert rebuilt.matrix.shape[0] == 150
+        assert [p.name for p in tmp_path.iterdir()] == ["site_1.npz"]
+    
+    @pytest.mark.parametrize("keep_bytes", [0, 100, -100])
+    def test_truncated_index_is_rebuilt(self, clustered_pages, tmp_path, keep_bytes):
+        """A partially written index file is discarded, not fatal."""
+        embeddings, _ = clustered_pages
+        matrix = normalize_embeddings(embeddings)
+        first = load_or_build_ann_index("site-1", matrix, index_dir=str(tmp_path))
+        path = tmp_path / "site-1.npz"
+        data = path.read_bytes()
+        path.write_bytes(data[:keep_bytes] if keep_bytes else b"")
+        
+        rebuilt = load_or_build_ann_index("site-1", matrix, index_dir=str(tmp_path))
+        
+        assert rebuilt.fingerprint == first.fingerprint
+        assert path.read_bytes() != b""
+
 class TestCannibalizationActivity:
     """Test suite for calculate_cannibalization activity."""
     
@@ -248,6 +505,167 @@ class TestCannibalizationActivity:
         # Should not flag as cannibalization (same keyword is intentional)
         assert result['total_conflicts'] == 0
     
+    @pytest.mark.asyncio
+    async def test_relationships_written_in_unwind_batches(self, mock_neo4j_driver, monkeypatch):
+        """Conflicts are written with batched UNWIND statements in transactions."""
+        mock_driver, mock_session = mock_neo4j_driver
+        monkeypatch.setenv('CANNIBALIZATION_WRITE_BATCH_SIZE', '2')
+        
+        mock_pages = [
+            {'id': f'page{n}', 'url': f'https://example.com/page{n}',
+             'embedding': [1.0, 0.01 * n, 0.0], 'keyword': f'kw {n}'}
+            for n in range(3)
+        ]
+        mock_session.run.return_value = iter(mock_pages)
+        mock_tx = mock_session.begin_transaction.return_value.__enter__.return_value
+        
+        result = await calculate_cannibalization('test-site-123')
+        
+        unwind_batches = [
+            c.kwargs['rows'] for c in mock_tx.run.call_args_list if 'rows' in c.kwargs
+        ]
+        assert result['total_conflicts'] == 3
+        assert result['relationships_written'] == 3
+        assert result['write_batches'] == 2
+        assert [len(batch) for batch in unwind_batches] == [2, 1]
+        assert not any('EXISTS' in c.args[0] for c in mock_session.run.call_args_list)
+    
+    @pytest.mark.asyncio
+    async def test_incremental_mode_rescans_only_changed_pages(self, mock_neo4j_driver):
+        """Pages whose stored hash matches are not rescanned against each other."""
+        mock_driver, mock_session = mock_neo4j_driver
+        
+        mock_pages = [
+            {'id': f'page{n}', 'url': f'https://example.com/page{n}',
+             'embedding': [1.0, 0.01 * n, 0.0], 'keyword': f'kw {n}'}
+            for n in range(3)
+        ]
+        for page in mock_pages[:2]:
+            page['analyzed_hash'] = embedding_hash(page['embedding'], page['keyword'])
+        mock_session.run.return_value = iter(mock_pages)
+        
+        result = await calculate_cannibalization('test-site-123', incremental=True)
+        
+        assert result['engine'] == 'incremental'
+        assert result['dirty_pages'] == 1
+        assert result['conflicts'] == {
+            'https://example.com/page0': ['https://example.com/page2'],
+            'https://example.com/page1': ['https://example.com/page2']
+        }
+    
+    @pytest.mark.asyncio
+    async def test_sharded_engine_matches_single_process(self, mock_neo4j_driver, monkeypatch):
+        """Process-pool shards must merge into the single-process result."""
+        mock_driver, mock_session = mock_neo4j_driver
+        rng = np.random.default_rng(5)
+        base = rng.normal(size=(4, 16))
+        mock_pages = [
+            {'id': f'page{n}', 'url': f'https://example.com/page{n:03d}',
+             'embedding': (base[n % 4] + rng.normal(scale=0.2, size=16)).tolist(),
+             'keyword': f'kw {n % 7}'}
+            for n in range(150)
+        ]
+        
+        mock_session.run.return_value = iter(mock_pages)
+        single = await calculate_cannibalization('test-site-123')
+        
+        monkeypatch.setenv('CANNIBALIZATION_WORKERS', '2')
+        mock_session.run.return_value = iter(mock_pages)
+        try:
+            sharded = await calculate_cannibalization('test-site-123')
+        finally:
+            shutdown_process_pools()
+        
+        assert sharded['workers'] == 2
+        assert single['total_conflicts'] > 0
+        assert sharded['conflicts'] == single['conflicts']
+        assert list(sharded['conflicts']) == list(single['conflicts'])
+    
+    def test_process_pool_keyed_by_size(self):
+        """A later run with a different worker count gets a pool of that size."""
+        try:
+            assert _get_process_pool(2) is _get_process_pool(2)
+            assert _get_process_pool(3)._max_workers == 3
+            assert _get_process_pool(2)._max_workers == 2
+        finally:
+            shutdown_process_pools()
+    
+    @pytest.mark.asyncio
+    async def test_blocking_work_runs_off_event_loop(self, mock_neo4j_driver):
+        """Similarity search and Neo4j calls must not stall other coroutines."""
+        mock_driver, mock_session = mock_neo4j_driver
+        mock_session.run.return_value = iter([
+            {'id': 'page1', 'url': 'https://example.com/page1',
+             'embedding': [1.0, 0.0, 0.0], 'keyword': 'seo tools'}
+        ])
+        
+        def slow_pairs(*args, **kwargs):
+            time.sleep(0.3)
+            return []
+        
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        
+        task = asyncio.create_task(ticker())
+        try:
+            with patch('activities.find_similar_pairs', slow_pairs):
+                await calculate_cannibalization('test-site-123')
+        finally:
+            task.cancel()
+        
+        assert ticks >= 10
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("engine,search", [("exact", "find_similar_pairs"), ("ann", "find_similar_pairs_ann")])
+    async def test_long_engine_runs_heartbeat(self, mock_neo4j_driver, monkeypatch, engine, search):
+        """Single-process exact and ANN searches heartbeat while they run."""
+        mock_driver, mock_session = mock_neo4j_driver
+        monkeypatch.setenv('CANNIBALIZATION_ENGINE', engine)
+        monkeypatch.setenv('CANNIBALIZATION_HEARTBEAT_SECONDS', '0.02')
+        mock_session.run.return_value = iter([
+            {'id': f'page{n}', 'url': f'https://example.com/page{n}',
+             'embedding': [1.0, float(n), 0.0], 'keyword': f'kw {n}'}
+            for n in range(2)
+        ])
+        
+        def slow_pairs(*args, **kwargs):
+            time.sleep(0.2)
+            return []
+        
+        env = ActivityEnvironment()
+        heartbeats = []
+        env.on_heartbeat = lambda *details: heartbeats.append(details[0])
+        with patch(f'activities.{search}', slow_pairs), \
+             patch('activities.load_or_build_ann_index', MagicMock()):
+            await env.run(calculate_cannibalization, 'test-site-123')
+        
+        assert {"stage": engine} in heartbeats
+    
+    @pytest.mark.asyncio
+    async def test_compare_mode_reports_ann_recall(self, mock_neo4j_driver, monkeypatch, tmp_path):
+        """Compare mode returns exact conflicts plus the ANN recall."""
+        mock_driver, mock_session = mock_neo4j_driver
+        monkeypatch.setenv('CANNIBALIZATION_ENGINE', 'compare')
+        monkeypatch.setenv('ANN_INDEX_DIR', str(tmp_path))
+        
+        mock_pages = [
+            {'id': 'page1', 'url': 'https://example.com/page1',
+             'embedding': [1.0, 0.0, 0.0], 'keyword': 'seo tools'},
+            {'id': 'page2', 'url': 'https://example.com/page2',
+             'embedding': [0.95, 0.05, 0.0], 'keyword': 'keyword research'}
+        ]
+        mock_session.run.return_value = iter(mock_pages)
+        
+        result = await calculate_cannibalization('test-site-123')
+        
+        assert result['engine'] == 'compare'
+        assert result['conflicts'] == {'https://example.com/page1': ['https://example.com/page2']}
+        assert result['ann_recall'] == 1.0
+    
     @pytest.mark.asyncio
     async def test_empty_site_handling(self, mock_neo4j_driver):
         """Test handling of site with no pages."""
@@ -276,12 +694,12 @@ class TestContentScoreActivity:
         
         # Mock ClickHouse results - competitor embeddings
         mock_serp_results = [
-            ('https://competitor1.com', [1.0, 0.0, 0.0]),
-            ('https://competitor2.com', [0.9, 0.1, 0.0]),
-            ('https://competitor3.com', [0.95, 0.05, 0.0]),
+            ('seo tools', [1.0, 0.0, 0.0], SERP_SNAPSHOT),
+            ('seo tools', [0.9, 0.1, 0.0], SERP_SNAPSHOT),
+            ('seo tools', [0.95, 0.05, 0.0], SERP_SNAPSHOT),
         ]
         
-        mock_ch.return_value.execute.return_value = mock_serp_results
+        mock_ch.return_value.execute.side_effect = serp_results(mock_serp_results)
         
         # Call function with similar content
         score = await compute_content_score(
@@ -305,7 +723,7 @@ class TestContentScoreActivity:
         mock_gen_embed.return_value = [1.0, 0.0, 0.0]
         
         # Mock empty ClickHouse results
-        mock_ch.return_value.execute.return_value = []
+        mock_ch.return_value.execute.side_effect = serp_results([])
         
         score = await compute_content_score(
             content="Test content",
@@ -325,9 +743,9 @@ class TestContentScoreActivity:
         
         mock_gen_embed.return_value = [1.0, 0.0, 0.0]
         
-        mock_ch.return_value.execute.return_value = [
-            ('https://comp.com', [1.0, 0.0, 0.0])
-        ]
+        mock_ch.return_value.execute.side_effect = serp_results([
+            ('test', [1.0, 0.0, 0.0], SERP_SNAPSHOT)
+        ])
         
         score = await compute_content_score(
             content="Test content",
@@ -338,3 +756,193 @@ class TestContentScoreActivity:
         
         # Verify Neo4j session.run was called
         assert mock_session.run.called, "Neo4j update query should be called"
+
+class TestContentScoreBatchActivity:
+    """Test suite for compute_content_scores_batch activity."""
+    
+    @pytest.mark.asyncio
+    @patch('activities.embed_texts')
+    async def test_batch_uses_one_query_and_one_write(self, mock_gen_embed, mock_clickhouse_client, mock_neo4j_driver):
+        """All keywords share one snapshot query, one SERP query and one UNWIND write."""
+        mock_ch = mock_clickhouse_client
+        mock_driver, mock_session = mock_neo4j_driver
+        
+        mock_gen_embed.return_value = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 0.0, 0.0]], dtype=np.float32)
+        mock_ch.return_value.execute.side_effect = serp_results([
+            ('seo tools', [1.0, 0.0, 0.0], SERP_SNAPSHOT),
+            ('seo tools', [0.9, 0.1, 0.0], SERP_SNAPSHOT),
+        ])
+        pages = [
+            {'url': 'https://example.com/a', 'content': 'a', 'target_keyword': 'seo tools'},
+            {'url': 'https://example.com/b', 'content': 'b', 'target_keyword': 'seo tools'},
+            {'url': 'https://example.com/c', 'content': 'c', 'target_keyword': 'no serp'},
+        ]
+        
+        result = await compute_content_scores_batch('site-1', pages)
+        
+        assert mock_ch.call_count == 1
+        calls = mock_ch.return_value.execute.call_args_list
+        assert len(calls) == 2
+        assert calls[0].args[1] == {'keywords': ('no serp', 'seo tools')}
+        # Only keywords with SERP data are fetched
+        assert calls[1].args[1] == {'keywords': ('seo tools',)}
+        mock_gen_embed.assert_called_once_with(['a', 'b', 'c'])
+        
+        assert result['scored'] == 3
+        assert result['scores']['https://example.com/a'] > result['scores']['https://example.com/b']
+        assert result['scores']['https://example.com/c'] == 50.0
+        
+        assert mock_session.run.call_count == 1
+        assert len(mock_session.run.call_args.kwargs['rows']) == 3
+    
+    @pytest.mark.asyncio
+    @patch('activities.embed_texts')
+    async def test_slice_reads_its_own_pages(self, mock_gen_embed, mock_clickhouse_client, mock_neo4j_driver):
+        """A slice is fetched by offset inside the activity; unscorable pages are skipped."""
+        mock_ch = mock_clickhouse_client
+        mock_driver, mock_session = mock_neo4j_driver
+        
+        mock_gen_embed.return_value = np.array([[1.0, 0.0, 0.0]], dtype=np.float32)
+        mock_ch.return_value.execute.side_effect = serp_results([
+            ('seo tools', [1.0, 0.0, 0.0], SERP_SNAPSHOT),
+        ])
+        mock_session.run.side_effect = [
+            [
+                {'url': 'https://example.com/a', 'content': 'a', 'target_keyword': 'seo tools'},
+                {'url': 'https://example.com/b', 'content': 'b', 'target_keyword': None},
+            ],
+            MagicMock(),
+        ]
+        
+        result = await compute_content_scores_slice('site-1', 20, 2)
+        
+        fetch = mock_session.run.call_args_list[0]
+        assert fetch.kwargs['skip'] == 20 and fetch.kwargs['limit'] == 2
+        assert result['scored'] == 1
+        assert result['skipped'] == 1
+        assert 'centroid_cache' in result
+    
+    @pytest.mark.asyncio
+    @patch('activities.embed_texts')
+    async def test_cached_keywords_skip_serp_query(self, mock_gen_embed, mock_clickhouse_client, mock_neo4j_driver):
+        """A warm repeat batch is served from the cache without querying ClickHouse."""
+        mock_ch = mock_clickhouse_client
+        mock_gen_embed.return_value = np.array([[1.0, 0.0, 0.0]], dtype=np.float32)
+        mock_ch.return_value.execute.side_effect = serp_results([('seo tools', [1.0, 0.0, 0.0], SERP_SNAPSHOT)])
+        pages = [{'url': 'https://example.com/a', 'content': 'a', 'target_keyword': 'seo tools'}]
+        
+        first = await compute_content_scores_batch('site-1', pages)
+        queries = mock_ch.return_value.execute.call_count
+        second = await compute_content_scores_batch('site-1', pages)
+        
+        assert mock_ch.return_value.execute.call_count == queries
+        assert mock_ch.call_count == 1
+        assert second['scores'] == first['scores']
+        assert second['centroid_cache']['hits'] == 1
+        assert second['centroid_cache']['misses'] == 1
+    
+    @pytest.mark.asyncio
+    @patch('activities.embed_texts')
+    async def test_expired_entry_revalidated_against_snapshot(self, mock_gen_embed, mock_clickhouse_client, mock_neo4j_driver, monkeypatch):
+        """After the TTL an unchanged SERP only costs the snapshot query; a refreshed one is recomputed."""
+        now = [0.0]
+        monkeypatch.setattr('activities._centroid_cache', CentroidCache(ttl_seconds=60, clock=lambda: now[0]))
+        mock_ch = mock_clickhouse_client
+        mock_gen_embed.return_value = np.array([[1.0, 0.0, 0.0]], dtype=np.float32)
+        pages = [{'url': 'https://example.com/a', 'content': 'a', 'target_keyword': 'seo tools'}]
+        
+        mock_ch.return_value.execute.side_effect = serp_results([('seo tools', [1.0, 0.0, 0.0], SERP_SNAPSHOT)])
+        first = await compute_content_scores_batch('site-1', pages)
+        
+        now[0] = 61.0
+        mock_ch.return_value.execute.reset_mock()
+        renewed = await compute_content_scores_batch('site-1', pages)
+        calls = mock_ch.return_value.execute.call_args_list
+        assert len(calls) == 1 and "max(created_at)" in calls[0].args[0]
+        assert renewed['scores'] == first['scores']
+        assert renewed['centroid_cache']['revalidations'] == 1
+        
+        # A refreshed SERP is served from the cache until the entry expires
+        mock_ch.return_value.execute.side_effect = serp_results([('seo tools', [0.0, 1.0, 0.0], datetime(2024, 1, 2))])
+        cached = await compute_content_scores_batch('site-1', pages)
+        now[0] = 122.0
+        refreshed = await compute_content_scores_batch('site-1', pages)
+        
+        assert cached['scores'] == first['scores']
+        assert first['scores']['https://example.com/a'] > refreshed['scores']['https://example.com/a']
+    
+    @pytest.mark.asyncio
+    @patch('activities.embed_texts')
+    async def test_materialized_centroids_match_snapshot(self, mock_gen_embed, mock_clickhouse_client, mock_neo4j_driver, monkeypatch):
+        """serp_centroids is written and read at the same snapshot."""
+        monkeypatch.setenv('CENTROID_CACHE_CLICKHOUSE', 'true')
+        monkeypatch.setattr('activities._centroid_table_ready', True)
+        mock_ch = mock_clickhouse_client
+        mock_gen_embed.return_value = np.array([[1.0, 0.0, 0.0]], dtype=np.float32)
+        pages = [{'url': 'https://example.com/a', 'content': 'a', 'target_keyword': 'seo tools'}]
+        rows = [
+            ('seo tools', [1.0, 0.0, 0.0], datetime(2024, 1, 1)),
+            ('seo tools', [0.9, 0.1, 0.0], datetime(2024, 1, 3)),
+        ]
+        serp = serp_results(rows)
+        centroids = []
+        
+        def execute(sql, params=None):
+            if sql.startswith("INSERT INTO serp_centroids"):
+                centroids.extend(params)
+                return None
+            if "FROM serp_centroids" in sql:
+                keys = set(params['keys'])
+                return [(kw, centroid, count) for kw, snapshot, centroid, count, _ in centroids if (kw, snapshot) in keys]
+            return serp(sql, params)
+        
+        mock_ch.return_value.execute.side_effect = execute
+        first = await compute_content_scores_batch('site-1', pages)
+        _get_centroid_cache().clear()
+        second = await compute_content_scores_batch('site-1', pages)
+        
+        assert [c[1] for c in centroids] == [datetime(2024, 1, 3)]
+        assert second['scores'] == first['scores']
+        # Served from serp_centroids, not recomputed
+        assert len(centroids) == 1
+
+class TestCentroidCache:
+    """Test suite for the LRU + TTL centroid cache."""
+    
+    def test_entries_expire_after_ttl(self):
+        """Entries older than the TTL count as misses."""
+        now = [0.0]
+        cache = CentroidCache(max_entries=10, ttl_seconds=60, clock=lambda: now[0])
+        cache.put('seo', SERP_SNAPSHOT, [1.0, 0.0], 3)
+        
+        assert cache.get('seo') == ([1.0, 0.0], 3)
+        now[0] = 61.0
+        assert cache.get('seo') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+    
+    def test_least_recently_used_entry_evicted(self):
+        """When full, the least recently read keyword is dropped."""
+        cache = CentroidCache(max_entries=2)
+        cache.put('a', SERP_SNAPSHOT, [1.0], 1)
+        cache.put('b', SERP_SNAPSHOT, [1.0], 1)
+        cache.get('a')
+        cache.put('c', SERP_SNAPSHOT, [1.0], 1)
+        
+        found, missing = cache.get_many(['a', 'b', 'c'])
+        
+        assert sorted(found) == ['a', 'c']
+        assert missing == ['b']
+        assert cache.stats()['evictions'] == 1
+    
+    def test_revalidate_only_renews_same_snapshot(self):
+        """An expired entry is renewed for the SERP snapshot it was built from only."""
+        now = [0.0]
+        cache = CentroidCache(max_entries=10, ttl_seconds=60, clock=lambda: now[0])
+        cache.put('seo', SERP_SNAPSHOT, [1.0], 1)
+        now[0] = 61.0
+        
+        assert cache.revalidate('seo', datetime(2024, 1, 2)) is None
+        assert cache.revalidate('seo', SERP_SNAPSHOT) == ([1.0], 1)
+        assert cache.get('seo') == ([1.0], 1)
+        assert cache.revalidate('other', SERP_SNAPSHOT) is None
@@ -0,0 +1,836 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import gzip
+import threading
+import time
+from unittest.mock import patch, MagicMock
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from temporalio.testing import ActivityEnvironment
+
+# Import functions to test
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'packages', 'python-worker'))
+
+from src.fetcher import AsyncFetcher, close_fetcher
+from src import crawl_log
+from src.crawl_log import CrawlLogWriter
+from src.robots import RobotsRules, get_robots_cache
+from src.frontier import BloomFilter, Frontier, TokenBucket
+from src import blob_store, activities
+from src.blob_store import LocalBlobStore, ClickHouseBlobStore, read_body
+from src.extract import extract_bs4
+from src.activities import fetch_html, fetch_robots_txt, crawl_batch, can_fetch, can_fetch_many, parse_html
+
+PAGE_HTML = "<html><head><title>Stub</title></head><body><h1>Hello</h1></body></html>"
+
+ROBOTS_TXT = """User-agent: *
+Disallow: /private
+Crawl-delay: 2
+Sitemap: https://example.com/sitemap.xml
+"""
+
+class StubSite:
+    """Local HTTP server recording connections and concurrency."""
+
+    def __init__(self):
+        self.peers = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.conditional_requests = []
+        self.robots_requests = 0
+
+    async def page(self, request):
+        self.peers.append(request.transport.get_extra_info('peername'))
+        return web.Response(text=PAGE_HTML, content_type='text/html')
+
+    async def gzipped(self, request):
+        body = gzip.compress(PAGE_HTML.encode('utf-8'))
+        return web.Response(body=body, headers={
+            'Content-Type': 'text/html; charset=utf-8',
+            'Content-Encoding': 'gzip'
+        })
+
+    async def slow(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.2)
+            return web.Response(text=PAGE_HTML, content_type='text/html')
+        finally:
+            self.in_flight -= 1
+
+    async def etag(self, request):
+        self.conditional_requests.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304, headers={'ETag': '"v1"'})
+        return web.Response(text=PAGE_HTML, content_type='text/html', headers={
+            'ETag': '"v1"',
+            'Last-Modified': 'Wed, 01 Oct 2025 00:00:00 GMT'
+        })
+
+    async def robots(self, request):
+        self.robots_requests += 1
+        return web.Response(text=ROBOTS_TXT)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/page', self.page)
+        app.router.add_get('/gzipped', self.gzipped)
+        app.router.add_get('/slow', self.slow)
+        app.router.add_get('/etag', self.etag)
+        app.router.add_get('/robots.txt', self.robots)
+        return app
+
+@pytest_asyncio.fixture
+async def stub_site():
+    """Run the stub site on a random local port."""
+    site = StubSite()
+    server = TestServer(site.app())
+    await server.start_server()
+    site.url = str(server.make_url('')).rstrip('/')
+    yield site
+    await server.close()
+    await close_fetcher()
+
+@pytest.fixture(autouse=True)
+def crawl_log_writer(monkeypatch):
+    """Install a shared crawl log writer backed by a mock ClickHouse client."""
+    # No politeness pacing unless a test asks for it
+    monkeypatch.setenv('CRAWLER_HOST_DELAY', '0')
+    monkeypatch.setenv('CRAWLER_RESPECT_CRAWL_DELAY', 'false')
+    client = MagicMock()
+    writer = CrawlLogWriter(lambda: client, flush_interval=60)
+    writer.client = client
+    crawl_log._writer = writer
+    yield writer
+    crawl_log._writer = None
+    get_robots_cache().clear()
+
+class TestAsyncFetcher:
+    """Test suite for the pooled asyncio fetch engine."""
+
+    @pytest.mark.asyncio
+    async def test_gzip_body_is_decoded(self, stub_site):
+        """Compressed transfer encoding is decoded transparently."""
+        fetcher = AsyncFetcher()
+        try:
+            result = await fetcher.fetch(f"{stub_site.url}/gzipped")
+        finally:
+            await fetcher.close()
+
+        assert result['status'] == 200
+        assert result['html'] == PAGE_HTML
+        assert result['headers']['Content-Encoding'] == 'gzip'
+
+    @pytest.mark.asyncio
+    async def test_connections_are_kept_alive(self, stub_site):
+        """Sequential fetches to one host reuse a single pooled connection."""
+        fetcher = AsyncFetcher()
+        try:
+            for _ in range(5):
+                await fetcher.fetch(f"{stub_site.url}/page")
+        finally:
+            await fetcher.close()
+
+        assert len(stub_site.peers) == 5
+        assert len(set(stub_site.peers)) == 1
+
+    @pytest.mark.asyncio
+    async def test_per_host_limit_caps_concurrency(self, stub_site):
+        """No more than max_per_host requests hit one host at a time."""
+        fetcher = AsyncFetcher(max_per_host=2)
+        try:
+            results = await asyncio.gather(*(
+                fetcher.fetch(f"{stub_site.url}/slow") for _ in range(6)
+            ))
+        finally:
+            await fetcher.close()
+
+        assert all(r['status'] == 200 for r in results)
+        assert stub_site.max_in_flight == 2
+
+class TestFetchActivities:
+    """Test suite for fetch activities running on the shared engine."""
+
+    @pytest.mark.asyncio
+    async def test_fetch_html_runs_concurrently(self, stub_site, crawl_log_writer):
+        """Several fetch_html calls overlap instead of blocking the loop."""
+        started = asyncio.get_running_loop().time()
+        results = await asyncio.gather(*(
+            fetch_html(f"{stub_site.url}/slow") for _ in range(4)
+        ))
+        elapsed = asyncio.get_running_loop().time() - started
+
+        assert [r['html'] for r in results] == [PAGE_HTML] * 4
+        assert stub_site.max_in_flight == 4
+        assert elapsed < 0.6
+        # Rows are buffered, not inserted per page
+        assert crawl_log_writer.queue_depth() == 4
+        crawl_log_writer.client.insert.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_recrawl_sends_validators_and_reports_not_modified(self, stub_site, crawl_log_writer):
+        """A second fetch revalidates and a 304 is reported as not modified."""
+        first = await fetch_html(f"{stub_site.url}/etag")
+        second = await fetch_html(f"{stub_site.url}/etag")
+
+        assert first['status'] == 200 and 'not_modified' not in first
+        assert second['status'] == 304
+        assert second['not_modified'] is True
+        assert second['html'] == ""
+        assert stub_site.conditional_requests == [None, '"v1"']
+
+        # Validators are persisted with the next flush; the 304 logs no row
+        crawl_log_writer.flush()
+        inserts = {c.args[0]: c.args[1] for c in crawl_log_writer.client.insert.call_args_list}
+        assert inserts['crawl_validators'][:3] == [
+            [f"{stub_site.url}/etag"], ['"v1"'], ['Wed, 01 Oct 2025 00:00:00 GMT']
+        ]
+        assert inserts['raw_crawl_log'][0] == [f"{stub_site.url}/etag"]
+
+    @pytest.mark.asyncio
+    async def test_validators_are_loaded_from_clickhouse(self, stub_site, crawl_log_writer):
+        """Validators from an earlier worker run are read back from crawl_validators."""
+        url = f"{stub_site.url}/etag"
+        crawl_log_writer.client.query.return_value.result_rows = [(url, '"v1"', '')]
+
+        with patch('src.activities.activity', mock_activity_context()):
+            result = await crawl_batch([url])
+
+        assert result['not_modified'] == 1
+        assert result['results'][0]['not_modified'] is True
+        assert stub_site.conditional_requests == ['"v1"']
+        assert crawl_log_writer.queue_depth() == 0
+
+    @pytest.mark.asyncio
+    async def test_fetch_robots_txt(self, stub_site):
+        """robots.txt is fetched from the site root."""
+        robots = await fetch_robots_txt(f"{stub_site.url}/some/page")
+
+        assert "Disallow: /private" in robots
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def mock_activity_context(heartbeat_details=()):
+    """Stand-in for temporalio.activity outside a running activity."""
+    ctx = MagicMock()
+    ctx.info.return_value.heartbeat_details = heartbeat_details
+    return ctx
+
+class TestCrawlBatch:
+    """Test suite for the batch crawl activity."""
+
+    @pytest.mark.asyncio
+    async def test_batch_returns_compact_results(self, stub_site, crawl_log_writer, monkeypatch):
+        """Results keep input order, omit HTML and checkpoint after each writer flush."""
+        monkeypatch.setenv('CRAWLER_BATCH_CONCURRENCY', '1')
+        crawl_log_writer.batch_rows = 2
+        crawl_log_writer.start()
+        urls = [f"{stub_site.url}/page?i={i}" for i in range(5)] + ["http://127.0.0.1:1/down"]
+        inserted = []
+
+        def heartbeat(details):
+            # Every checkpointed page already has its crawl log row written
+            assert set(details['results']) <= set(inserted)
+
+        crawl_log_writer.client.insert.side_effect = lambda table, data, **kw: inserted.extend(data[0])
+        with patch('src.activities.activity', mock_activity_context()) as ctx:
+            ctx.heartbeat.side_effect = heartbeat
+            result = await crawl_batch(urls)
+        crawl_log_writer.close()
+
+        assert [r['url'] for r in result['results']] == urls
+        assert all('html' not in r for r in result['results'])
+        assert result['results'][0] == {"url": urls[0], "status": 200, "size": len(PAGE_HTML)}
+        assert result['results'][-1]['status'] == 0 and result['results'][-1]['error']
+        assert (result['fetched'], result['failed'], result['resumed']) == (5, 1, 0)
+        assert result['crawl_log']['rows_written'] == 5
+        assert result['crawl_log']['queue_depth'] == 0
+        # Pages are saved in the writer's own bulk inserts, one checkpoint per insert
+        inserts = crawl_log_writer.client.insert.call_args_list
+        assert 2 <= len(inserts) < 5
+        assert sum(len(c.args[1][0]) for c in inserts) == 5
+        # One checkpoint per insert, plus a progress heartbeat for the failed URL
+        assert ctx.heartbeat.call_count == len(inserts) + 1
+        # The failed URL is left out of the checkpoint so a retry refetches it
+        checkpoint = ctx.heartbeat.call_args.args[0]['results']
+        assert set(checkpoint) == set(urls[:5])
+
+    @pytest.mark.asyncio
+    async def test_writer_checkpoints_reach_temporal(self, stub_site, crawl_log_writer, monkeypatch):
+        """Checkpoints scheduled from the writer thread heartbeat in the activity's context."""
+        monkeypatch.setenv('CRAWLER_BATCH_CONCURRENCY', '1')
+        crawl_log_writer.batch_rows = 2
+        crawl_log_writer.start()
+        urls = [f"{stub_site.url}/slow?i={i}" for i in range(4)]
+        env = ActivityEnvironment()
+        heartbeats = []
+        env.on_heartbeat = lambda *details: heartbeats.append(details[0])
+
+        result = await env.run(crawl_batch, urls)
+        crawl_log_writer.close()
+
+        assert result['fetched'] == 4
+        # The first writer flush checkpoints mid-batch, the last covers every page
+        assert len(heartbeats) >= 2
+        assert set(heartbeats[0]['results']) == set(urls[:2])
+        assert set(heartbeats[-1]['results']) == set(urls)
+
+    @pytest.mark.asyncio
+    async def test_not_modified_and_failed_urls_heartbeat(self, stub_site, crawl_log_writer):
+        """A batch of only 304s and failures still reports progress."""
+        url = f"{stub_site.url}/etag"
+        down = "http://127.0.0.1:1/down"
+        crawl_log_writer.add(url, PAGE_HTML, {'ETag': '"v1"'}, 200)
+        crawl_log_writer.flush()
+        env = ActivityEnvironment()
+        heartbeats = []
+        env.on_heartbeat = lambda *details: heartbeats.append(details[0])
+
+        result = await env.run(crawl_batch, [url, down])
+
+        assert (result['not_modified'], result['failed']) == (1, 1)
+        assert len(heartbeats) == 2
+        assert heartbeats[-1]['results'] == {url: {"url": url, "status": 304, "size": 0, "not_modified": True}}
+
+    @pytest.mark.asyncio
+    async def test_batch_does_not_checkpoint_dropped_rows(self, stub_site, crawl_log_writer, monkeypatch):
+        """A page whose crawl log row was dropped is returned but left out of checkpoints."""
+        monkeypatch.setenv('CRAWLER_BATCH_CONCURRENCY', '1')
+        urls = [f"{stub_site.url}/slow?i={i}" for i in range(3)]
+        crawl_log_writer.batch_rows = 2
+        crawl_log_writer.max_buffer_rows = 1
+        # The background flush of the first two rows fails and drops the oldest
+        crawl_log_writer.client.insert.side_effect = [RuntimeError("down"), None]
+        crawl_log_writer.start()
+
+        with patch('src.activities.activity', mock_activity_context()) as ctx:
+            result = await crawl_batch(urls)
+        crawl_log_writer.close()
+
+        assert [r['status'] for r in result['results']] == [200, 200, 200]
+        assert result['crawl_log']['rows_dropped'] == 1
+        checkpoint = ctx.heartbeat.call_args.args[0]['results']
+        assert set(checkpoint) == set(urls[1:])
+
+    @pytest.mark.asyncio
+    async def test_batch_resumes_from_checkpoint(self, stub_site):
+        """A retried batch skips URLs recorded in the last heartbeat."""
+        urls = [f"{stub_site.url}/page?i={i}" for i in range(4)]
+        checkpoint = {url: {"url": url, "status": 200, "size": 1} for url in urls[:3]}
+
+        with patch('src.activities.activity', mock_activity_context(({"results": checkpoint},))):
+            result = await crawl_batch(urls)
+
+        assert len(stub_site.peers) == 1
+        assert result['resumed'] == 3
+        assert result['results'][:3] == list(checkpoint.values())
+        assert result['results'][3]['size'] == len(PAGE_HTML)
+
+    @pytest.mark.asyncio
+    async def test_batch_retries_failures_from_checkpoint(self, stub_site):
+        """Failed URLs recorded in a checkpoint are fetched again on retry."""
+        urls = [f"{stub_site.url}/page?i={i}" for i in range(2)]
+        checkpoint = {
+            urls[0]: {"url": urls[0], "status": 200, "size": 1},
+            urls[1]: {"url": urls[1], "status": 0, "error": "timeout"}
+        }
+
+        with patch('src.activities.activity', mock_activity_context(({"results": checkpoint},))):
+            result = await crawl_batch(urls)
+
+        assert result['resumed'] == 1
+        assert result['failed'] == 0
+        assert result['results'][1] == {"url": urls[1], "status": 200, "size": len(PAGE_HTML)}
+
+class TestCrawlLogWriter:
+    """Test suite for the buffered raw_crawl_log writer."""
+
+    def test_written_through_and_flush_listeners(self, crawl_log_writer):
+        """The watermark only passes rows once written; failed flushes hold it back."""
+        calls = []
+        crawl_log_writer.add_flush_listener(calls.append)
+        first = crawl_log_writer.add("https://example.com/1", PAGE_HTML, {}, 200)
+        second = crawl_log_writer.add("https://example.com/2", PAGE_HTML, {}, 200)
+        assert crawl_log_writer.written_through() == first - 1
+
+        crawl_log_writer.client.insert.side_effect = RuntimeError("down")
+        assert crawl_log_writer.flush() == 0
+        assert crawl_log_writer.written_through() == first - 1
+        assert calls == []
+
+        crawl_log_writer.client.insert.side_effect = None
+        assert crawl_log_writer.flush() == 2
+        assert calls == [second]
+        crawl_log_writer.remove_flush_listener(calls.append)
+        crawl_log_writer.add("https://example.com/3", PAGE_HTML, {}, 200)
+        crawl_log_writer.flush()
+        assert calls == [second]
+
+    def test_dropped_rows_are_not_written(self):
+        """Rows dropped from a full buffer pass the watermark but never count as written."""
+        client = MagicMock()
+        writer = CrawlLogWriter(lambda: client, max_buffer_rows=2)
+        client.insert.side_effect = RuntimeError("down")
+        seqs = [writer.add(f"https://example.com/{i}", PAGE_HTML, {}, 200) for i in range(3)]
+        assert writer.flush() == 0
+        assert writer.stats()['rows_dropped'] == 1
+
+        client.insert.side_effect = None
+        assert writer.flush() == 2
+        assert writer.written_through() == seqs[-1]
+        assert [writer.is_written(seq) for seq in seqs] == [False, True, True]
+
+    def test_flush_is_one_columnar_insert(self, crawl_log_writer):
+        """Buffered rows are written column-oriented with DDL run once."""
+        for i in range(3):
+            crawl_log_writer.add(f"https://example.com/{i}", PAGE_HTML, {"Server": "x"}, 200)
+        assert crawl_log_writer.flush() == 3
+        crawl_log_writer.add("https://example.com/3", PAGE_HTML, {}, 404)
+        assert crawl_log_writer.flush() == 1
+
+        client = crawl_log_writer.client
+        assert client.command.call_count == 2
+        assert client.insert.call_count == 2
+        table, columns = client.insert.call_args_list[0].args
+        assert table == 'raw_crawl_log'
+        assert columns[0] == [f"https://example.com/{i}" for i in range(3)]
+        assert columns[3] == [200, 200, 200]
+        assert client.insert.call_args_list[0].kwargs['column_oriented'] is True
+
+        stats = crawl_log_writer.stats()
+        assert stats['queue_depth'] == 0
+        assert stats['rows_written'] == 4
+        assert stats['flushes'] == 2
+
+    def test_failed_flush_requeues_rows(self, crawl_log_writer):
+        """Rows survive a failed insert and are written on the next flush."""
+        crawl_log_writer.client.insert.side_effect = [Exception("down"), None]
+        crawl_log_writer.add("https://example.com/a", PAGE_HTML, {}, 200)
+
+        assert crawl_log_writer.flush() == 0
+        assert crawl_log_writer.queue_depth() == 1
+        assert crawl_log_writer.flush() == 1
+        assert crawl_log_writer.stats()['failed_flushes'] == 1
+
+    def test_batch_size_wakes_background_flush(self):
+        """Reaching batch_rows triggers a flush without waiting for the timer."""
+        client = MagicMock()
+        writer = CrawlLogWriter(lambda: client, batch_rows=2, flush_interval=60)
+        writer.start()
+        try:
+            writer.add("https://example.com/a", PAGE_HTML, {}, 200)
+            writer.add("https://example.com/b", PAGE_HTML, {}, 200)
+            for _ in range(100):
+                if writer.rows_written == 2:
+                    break
+                time.sleep(0.01)
+            assert writer.rows_written == 2
+            writer.add("https://example.com/c", PAGE_HTML, {}, 200)
+        finally:
+            writer.close()
+
+        # Shutdown flushes the remainder
+        assert writer.rows_written == 3
+        assert writer.queue_depth() == 0
+
+    def test_dedup_storage_writes_each_body_once(self):
+        """Identical bodies are stored once and rows reference them by hash."""
+        client = MagicMock()
+        other_html = "<html><body>Other</body></html>"
+        known_html = "<html><body>Known</body></html>"
+        client.query.return_value.result_rows = [(crawl_log.body_hash(known_html),)]
+        writer = CrawlLogWriter(lambda: client, storage="dedup")
+
+        writer.add("https://example.com/a", PAGE_HTML, {"ETag": "x"}, 200)
+        writer.add("https://example.com/b", PAGE_HTML, {}, 200)
+        writer.add("https://example.com/c", other_html, {}, 200)
+        writer.add("https://example.com/d", known_html, {}, 200)
+        assert writer.flush() == 4
+        # Recrawl of an already written body sends no body at all
+        writer.add("https://example.com/a", PAGE_HTML, {}, 200)
+        assert writer.flush() == 1
+
+        assert client.command.call_count == 3
+        body_inserts = [c for c in client.insert.call_args_list if c.args[0] == 'crawl_bodies']
+        log_inserts = [c for c in client.insert.call_args_list if c.args[0] == 'crawl_log']
+        assert len(body_inserts) == 1
+        hashes, bodies = body_inserts[0].args[1][:2]
+        assert bodies == [PAGE_HTML, other_html]
+        assert hashes == [crawl_log.body_hash(PAGE_HTML), crawl_log.body_hash(other_html)]
+
+        columns = dict(zip(log_inserts[0].kwargs['column_names'], log_inserts[0].args[1]))
+        assert 'html' not in columns
+        assert columns['body_hash'][0] == columns['body_hash'][1]
+        assert columns['headers'][0] == {"ETag": "x"}
+        assert columns['size'][2] == len(other_html)
+        assert len(log_inserts) == 2
+
+        stats = writer.stats()
+        assert stats['bodies_written'] == 2
+        assert stats['bodies_deduplicated'] == 3
+
+    def test_not_modified_writes_no_row_or_body(self):
+        """A 304 refreshes validators without a crawl log row or an empty body."""
+        client = MagicMock()
+        writer = CrawlLogWriter(lambda: client, storage="dedup")
+
+        writer.revalidated("https://example.com/a", {"ETag": '"v2"'})
+        assert writer.queue_depth() == 0
+        assert writer.flush() == 0
+
+        inserts = {c.args[0]: c.args[1] for c in client.insert.call_args_list}
+        assert set(inserts) == {'crawl_validators'}
+        assert inserts['crawl_validators'][:2] == [["https://example.com/a"], ['"v2"']]
+
+class TestRobots:
+    """Test suite for the compiled robots matcher and per-domain cache."""
+
+    def test_longest_match_wins(self):
+        """Allow/Disallow precedence follows RFC 9309 with wildcards."""
+        rules = RobotsRules.parse("""
+User-agent: *
+Disallow: /shop
+Allow: /shop/public
+Disallow: /*.pdf$
+Disallow: /*?session=
+""")
+        assert rules.can_fetch("https://example.com/") is True
+        assert rules.can_fetch("https://example.com/shop/cart") is False
+        assert rules.can_fetch("https://example.com/shop/public/item") is True
+        assert rules.can_fetch("https://example.com/docs/guide.pdf") is False
+        assert rules.can_fetch("https://example.com/docs/guide.pdf?x=1") is True
+        assert rules.can_fetch("https://example.com/page?session=abc") is False
+
+    def test_agent_group_delay_and_sitemaps(self):
+        """Our own group overrides `*`, with its crawl delay and global sitemaps."""
+        rules = RobotsRules.parse("""
+Sitemap: https://example.com/a.xml
+User-agent: *
+Disallow: /
+
+User-agent: Googlebot
+User-agent: ApexSEO-Crawler
+Disallow: /admin
+Crawl-delay: 1.5
+Sitemap: https://example.com/b.xml
+""")
+        assert rules.can_fetch("https://example.com/blog") is True
+        assert rules.can_fetch("https://example.com/admin/login") is False
+        assert rules.crawl_delay == 1.5
+        assert rules.sitemaps == ["https://example.com/a.xml", "https://example.com/b.xml"]
+
+    def test_agent_group_matches_product_token(self):
+        """Groups match our product token exactly and case-insensitively, not by substring."""
+        content = """
+User-agent: apexseo
+User-agent: crawler
+Disallow: /
+
+User-agent: *
+Disallow: /private
+"""
+        rules = RobotsRules.parse(content)
+        assert rules.can_fetch("https://example.com/blog") is True
+        assert rules.can_fetch("https://example.com/private/x") is False
+
+        content += """
+User-agent: APEXSEO-Crawler
+Disallow: /drafts
+"""
+        for user_agent in ("apexseo-crawler", "ApexSEO-Crawler/1.0"):
+            rules = RobotsRules.parse(content, user_agent)
+            assert rules.can_fetch("https://example.com/private/x") is True
+            assert rules.can_fetch("https://example.com/drafts/y") is False
+
+    @pytest.mark.asyncio
+    async def test_can_fetch_many_fetches_robots_once(self, stub_site):
+        """A batch of URLs on one domain costs a single robots.txt fetch."""
+        urls = [f"{stub_site.url}/page?i={i}" for i in range(50)] + [f"{stub_site.url}/private/x"]
+
+        result = await can_fetch_many(urls)
+        assert await can_fetch(f"{stub_site.url}/private/y") is False
+
+        assert stub_site.robots_requests == 1
+        assert result['disallowed'] == [f"{stub_site.url}/private/x"]
+        assert len(result['allowed']) == 50
+        assert result['crawl_delays'] == {stub_site.url: 2.0}
+        assert result['sitemaps'] == {stub_site.url: ["https://example.com/sitemap.xml"]}
+
+    @pytest.mark.asyncio
+    async def test_can_fetch_with_content_is_parsed_once(self):
+        """Passing the same robots.txt text reuses the compiled rules."""
+        with patch.object(RobotsRules, 'parse', wraps=RobotsRules.parse) as parse:
+            for i in range(10):
+                assert await can_fetch(f"https://example.com/p{i}", ROBOTS_TXT) is True
+            assert await can_fetch("https://example.com/private", ROBOTS_TXT) is False
+        assert parse.call_count == 1
+        assert await can_fetch("https://example.com/private", "") is True
+
+class TestFrontier:
+    """Test suite for the crawl frontier and politeness scheduler."""
+
+    def test_bloom_filter_dedup(self):
+        """No false negatives and a false-positive rate near the target."""
+        seen = BloomFilter(capacity=10000, error_rate=0.01)
+        urls = [f"https://example.com/page/{i}" for i in range(10000)]
+        assert sum(seen.add(url) for url in urls) > 9900
+        assert not any(seen.add(url) for url in urls)
+        assert all(url in seen for url in urls)
+
+        false_positives = sum(f"https://other.com/{i}" in seen for i in range(10000))
+        assert false_positives < 300
+        assert len(seen._bits) < 15000
+
+    def test_host_token_bucket_and_crawl_delay(self):
+        """Each host is paced by its own bucket; Crawl-delay slows one host."""
+        clock = FakeClock()
+        frontier = Frontier(max_in_flight=10, per_host_in_flight=10, host_delay=1.0, clock=clock)
+        for i in range(3):
+            frontier.add(f"https://a.com/{i}")
+            frontier.add(f"https://b.com/{i}")
+        frontier.set_crawl_delay("https://b.com", 5.0)
+
+        first = [frontier.pop_ready(), frontier.pop_ready()]
+        assert {item.host for item in first} == {"https://a.com", "https://b.com"}
+        assert frontier.pop_ready() is None
+        assert frontier.next_ready_in() == pytest.approx(1.0)
+
+        clock.now = 1.0
+        assert frontier.pop_ready().host == "https://a.com"
+        assert frontier.pop_ready() is None
+        clock.now = 5.0
+        assert {frontier.pop_ready().host, frontier.pop_ready().host} == {"https://a.com", "https://b.com"}
+
+    def test_token_bucket_set_rate(self):
+        """Changing the rate keeps tokens accrued at the old rate."""
+        bucket = TokenBucket(rate=1.0, burst=2, now=0.0)
+        bucket.consume(0.0)
+        bucket.consume(0.0)
+        bucket.set_rate(0.1, now=0.5)
+
+        assert bucket.tokens == pytest.approx(0.5)
+        assert bucket.wait_time(0.5) == pytest.approx(5.0)
+        bucket.set_rate(0, now=0.5)
+        assert bucket.wait_time(0.5) == 0.0
+
+    def test_priority_and_caps(self):
+        """Shallow / high-score URLs go first; per-host and global caps hold."""
+        frontier = Frontier(max_in_flight=3, per_host_in_flight=2, host_delay=0)
+        frontier.add("https://a.com/deep", depth=2)
+        frontier.add("https://a.com/low", depth=1, score=0.1)
+        frontier.add("https://a.com/high", depth=1, score=0.9)
+        frontier.add("https://b.com/x")
+        frontier.add("https://c.com/x")
+        assert frontier.add("https://a.com/high") is False
+
+        first = frontier.pop_ready()
+        second = frontier.pop_ready()
+        third = frontier.pop_ready()
+        assert first.url in ("https://b.com/x", "https://c.com/x")
+        assert [i.url for i in (first, second, third) if i.host == "https://a.com"] == ["https://a.com/high"]
+        # Global cap reached
+        assert frontier.pop_ready() is None
+
+        frontier.done(first)
+        assert frontier.pop_ready().url == "https://a.com/low"
+        # a.com now has two in flight
+        frontier.done([i for i in (second, third) if i.host != "https://a.com"][0])
+        assert frontier.pop_ready() is None
+        assert frontier.stats()['duplicates'] == 1
+
+    def test_score_priority(self):
+        """priority="score" ranks by link score before depth."""
+        frontier = Frontier(max_in_flight=1, host_delay=0, priority="score")
+        frontier.add("https://a.com/shallow", depth=0, score=0.2)
+        frontier.add("https://a.com/scored", depth=3, score=0.8)
+        assert frontier.pop_ready().url == "https://a.com/scored"
+
+    @pytest.mark.asyncio
+    async def test_run_follows_discovered_links(self):
+        """run() drains the frontier, queueing links one level deeper."""
+        frontier = Frontier(max_in_flight=4, host_delay=0)
+        frontier.add("https://a.com/")
+        visited = []
+
+        async def handler(item):
+            visited.append((item.url, item.depth))
+            await asyncio.sleep(0)
+            if item.depth < 2:
+                return [f"{item.url}{n}/" for n in range(2)] + ["https://a.com/"]
+            return []
+
+        await frontier.run(handler)
+
+        assert len(visited) == 7
+        assert max(depth for _, depth in visited) == 2
+        assert frontier.stats()['pending'] == 0 and frontier.stats()['in_flight'] == 0
+
+    @pytest.mark.asyncio
+    async def test_crawl_batch_honours_crawl_delay(self, stub_site, monkeypatch):
+        """crawl_batch paces a host by its robots Crawl-delay."""
+        monkeypatch.setenv('CRAWLER_RESPECT_CRAWL_DELAY', 'true')
+        monkeypatch.setenv('CRAWLER_MAX_CRAWL_DELAY', '0.2')
+        urls = [f"{stub_site.url}/page?i={i}" for i in range(3)]
+
+        started = asyncio.get_running_loop().time()
+        with patch('src.activities.activity', mock_activity_context()):
+            result = await crawl_batch(urls)
+        elapsed = asyncio.get_running_loop().time() - started
+
+        assert result['fetched'] == 3
+        assert stub_site.robots_requests == 1
+        assert elapsed >= 0.35
+
+class TestBodyReferences:
+    """Test suite for passing page bodies by reference through the blob store."""
+
+    @pytest.fixture
+    def local_store(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('BLOB_STORE', 'local')
+        monkeypatch.setenv('BLOB_STORE_DIR', str(tmp_path))
+        monkeypatch.setenv('CPU_POOL_WORKERS', '0')
+        activities.shutdown_process_pool()
+        blob_store._stores.clear()
+        yield tmp_path
+        blob_store._stores.clear()
+
+    def test_local_store_is_content_addressed(self, tmp_path):
+        store = LocalBlobStore(str(tmp_path))
+        ref = store.put(PAGE_HTML * 1000)
+
+        assert store.put(PAGE_HTML * 1000) == ref
+        assert ref.startswith("local:")
+        assert len(list(tmp_path.rglob("*.html.gz"))) == 1
+        chunks = list(store.iter_chunks(ref.split(":", 1)[1], chunk_size=4096))
+        assert len(chunks) > 1
+        assert "".join(chunks) == PAGE_HTML * 1000
+
+    @pytest.mark.asyncio
+    async def test_large_body_goes_by_reference(self, stub_site, local_store, monkeypatch):
+        """Above the threshold fetch returns a body_ref that parse_html reads."""
+        monkeypatch.setenv('HTML_INLINE_MAX_BYTES', '10')
+        monkeypatch.setenv('PARSE_HTML_ENGINE', 'lxml')
+        url = f"{stub_site.url}/page"
+
+        fetched = await fetch_html(url)
+        assert fetched['html'] == ""
+        assert fetched['size'] == len(PAGE_HTML)
+        assert read_body(fetched['body_ref']) == PAGE_HTML
+
+        parsed = await parse_html(fetched['html'], url, fetched['body_ref'])
+        assert parsed == extract_bs4(PAGE_HTML, url)
+
+        monkeypatch.setenv('PARSE_HTML_ENGINE', 'bs4')
+        assert await parse_html("", url, fetched['body_ref']) == parsed
+
+    @pytest.mark.asyncio
+    async def test_small_or_unconfigured_stays_inline(self, stub_site, local_store, monkeypatch):
+        url = f"{stub_site.url}/page"
+        assert (await fetch_html(url))['html'] == PAGE_HTML
+
+        monkeypatch.setenv('HTML_INLINE_MAX_BYTES', str(len(PAGE_HTML)))
+        result = await fetch_html(url)
+        assert result['html'] == PAGE_HTML
+        assert 'body_ref' not in result
+
+    @pytest.mark.asyncio
+    async def test_threshold_counts_utf8_bytes(self, stub_site, local_store, monkeypatch):
+        """A body under the threshold in characters but over it in bytes goes by reference."""
+        html = "<p>" + "é" * 10 + "</p>"
+        monkeypatch.setenv('HTML_INLINE_MAX_BYTES', str(len(html)))
+        assert await activities._store_body(html) is not None
+        monkeypatch.setenv('HTML_INLINE_MAX_BYTES', str(len(html.encode('utf-8'))))
+        assert await activities._store_body(html) is None
+
+    def test_store_is_checked_at_startup(self, tmp_path, monkeypatch):
+        """Local storage needs an explicit shared directory; ClickHouse is the default."""
+        blob_store._stores.clear()
+        monkeypatch.delenv('BLOB_STORE', raising=False)
+        client = MagicMock()
+        monkeypatch.setattr(blob_store, 'get_clickhouse_client', lambda: client)
+        assert blob_store.check_blob_store() == "clickhouse"
+        client.command.assert_called_once_with(crawl_log.CRAWL_BODIES_DDL)
+
+        blob_store._stores.clear()
+        monkeypatch.setenv('BLOB_STORE', 'local')
+        monkeypatch.delenv('BLOB_STORE_DIR', raising=False)
+        with pytest.raises(ValueError, match="BLOB_STORE_DIR"):
+            blob_store.check_blob_store()
+
+        monkeypatch.setenv('BLOB_STORE_DIR', str(tmp_path / "blobs"))
+        assert blob_store.check_blob_store() == "local"
+        assert (tmp_path / "blobs").is_dir()
+        blob_store._stores.clear()
+
+    def test_clickhouse_store_uses_async_inserts(self):
+        client = MagicMock()
+        client.query.return_value.result_rows = [(PAGE_HTML,)]
+        store = ClickHouseBlobStore(lambda: client)
+
+        ref = store.put(PAGE_HTML)
+        assert store.put(PAGE_HTML) == ref
+
+        assert client.insert.call_count == 1
+        assert client.insert.call_args.args[0] == 'crawl_bodies'
+        settings = client.insert.call_args.kwargs['settings']
+        assert (settings['async_insert'], settings['wait_for_async_insert']) == (1, 0)
+        assert settings['insert_deduplication_token'] == ref.split(":", 1)[1]
+        assert "".join(store.iter_chunks(ref.split(":", 1)[1])) == PAGE_HTML
+
+    def test_clickhouse_store_streams_ranges(self):
+        """Bodies are read fetch_size characters per query, waiting for an unflushed insert."""
+        body = "é" * 25
+        client = MagicMock()
+        reads = []
+
+        def query(sql, parameters):
+            reads.append(parameters['offset'])
+            if len(reads) == 1:
+                # Not flushed yet
+                return MagicMock(result_rows=[])
+            start = parameters['offset'] - 1
+            return MagicMock(result_rows=[(body[start:start + parameters['length']],)])
+
+        client.query.side_effect = query
+        store = ClickHouseBlobStore(lambda: client, fetch_size=10, read_timeout=5)
+
+        chunks = list(store.iter_chunks("digest", chunk_size=4))
+
+        assert "".join(chunks) == body
+        assert max(len(c) for c in chunks) == 4
+        assert reads == [1, 1, 11, 21]
+
+    def test_clickhouse_store_missing_body(self):
+        client = MagicMock()
+        client.query.return_value.result_rows = []
+        store = ClickHouseBlobStore(lambda: client, read_timeout=0)
+
+        with pytest.raises(KeyError):
+            list(store.iter_chunks("digest"))
+
+    def test_clickhouse_store_client_per_thread(self):
+        """Concurrent puts do not share (or wait on) one client."""
+        clients = []
+
+        def factory():
+            clients.append(MagicMock())
+            return clients[-1]
+
+        store = ClickHouseBlobStore(factory)
+        threads = [threading.Thread(target=store.put, args=(f"<p>{i}</p>",)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(clients) == 3
+        assert all(c.insert.call_count == 1 for c in clients)
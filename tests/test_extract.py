@@ -0,0 +1,105 @@
+import pytest
+import random
+
+# Import functions to test
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'packages', 'python-worker'))
+
+from src.extract import extract, extract_bs4, extract_lxml
+from src import activities
+from src.activities import parse_html
+from bench_parse import make_page
+
+PAGE_URL = "https://example.com/blog/page"
+
+# Edge cases where a tree builder and a tokenizer could disagree
+SAMPLES = {
+    "full_page": """<!DOCTYPE html><html><head><title>Hello &amp; welcome</title>
+<meta name="description" content="A page"><link rel="canonical" href="/canon">
+<style>body{color:red}</style><script>var x = "<b>";</script></head>
+<body><h1>  Main <em>heading</em> </h1><p>Some text<!-- c -->more text</p>
+<a href="/a" rel="nofollow noopener">Link A</a><a href="https://other.com/x">Ext</a>
+<a name="anchor">No href</a><a href="">Empty</a><p>Caf&eacute; &nbsp; done</p></body></html>""",
+    "fragment": "<h1>Only</h1><p>Text <a href='b.html'>relative link</a> tail</p>",
+    "empty": "",
+    "repeated_title_and_h1": "<title>A</title><title>B</title><h1>x</h1><h1>y</h1>",
+    "nested_link_markup": "<div><a href='/n'><span>one</span> <b>two</b></a></div><noscript>ns</noscript>",
+    "unclosed_tags": "<html><body><p>para<p>para2<a href='/x'>x<div>inside</div>",
+    "multi_valued_rel": '<link rel="alternate canonical" href="https://e.com/c">'
+                        '<meta name="Description" content="no"><meta name="description">',
+    "whitespace": "<p>\n  lots   of \n whitespace  </p>\n\n<p>next</p>",
+    "invalid_link": '<a href="http://[::1">bad</a><a href="/ok">ok</a>',
+    "table": "<table><tr><td>a</td><td>b</td></tr></table>text after",
+    "long_anchor_text": f"<a href='/long'>{'word ' * 60}</a>",
+}
+
+class TestExtractParity:
+    """The lxml engine must return exactly what the BeautifulSoup engine does."""
+
+    @pytest.mark.parametrize("name", sorted(SAMPLES))
+    def test_edge_cases(self, name):
+        html = SAMPLES[name]
+        assert extract_lxml(html, PAGE_URL) == extract_bs4(html, PAGE_URL)
+
+    def test_generated_pages(self):
+        rng = random.Random(7)
+        for i in range(5):
+            html = make_page(i, n_links=40, n_paragraphs=10, rng=rng)
+            assert extract_lxml(html, PAGE_URL) == extract_bs4(html, PAGE_URL)
+
+    def test_fields(self):
+        result = extract_lxml(SAMPLES["full_page"], PAGE_URL)
+
+        assert result["title"] == "Hello & welcome"
+        assert result["h1"] == "Main heading"
+        assert result["metaDescription"] == "A page"
+        assert result["canonicalUrl"] == "https://example.com/canon"
+        assert [l["url"] for l in result["links"]] == [
+            "https://example.com/a", "https://other.com/x", PAGE_URL
+        ]
+        assert result["links"][0]["rel"] == "nofollow noopener"
+        assert result["links"][1]["isInternal"] is False
+        assert "var x" not in result["text"] and "color:red" not in result["text"]
+
+class TestParseEngineSelection:
+    """parse_html routes through the configured engine."""
+
+    def test_unknown_engine(self):
+        with pytest.raises(ValueError):
+            extract("<p>x</p>", PAGE_URL, engine="regex")
+
+    @pytest.mark.asyncio
+    async def test_parse_html_uses_env_engine(self, monkeypatch):
+        monkeypatch.setenv('PARSE_HTML_ENGINE', 'lxml')
+        result = await parse_html(SAMPLES["fragment"], PAGE_URL)
+
+        assert result == extract_bs4(SAMPLES["fragment"], PAGE_URL)
+        assert result["links"][0]["url"] == "https://example.com/blog/b.html"
+
+class TestCpuPool:
+    """CPU-bound activities run in the process pool when configured."""
+
+    @pytest.fixture
+    def pool(self, monkeypatch):
+        monkeypatch.setenv('CPU_POOL_WORKERS', '1')
+        activities.shutdown_process_pool()
+        yield activities.start_process_pool()
+        activities.shutdown_process_pool()
+
+    @pytest.mark.asyncio
+    async def test_parse_html_in_pool(self, pool):
+        """Results cross the process boundary intact (plain str fields)."""
+        assert pool == 1
+        result = await parse_html(SAMPLES["full_page"], PAGE_URL)
+
+        assert result == extract_bs4(SAMPLES["full_page"], PAGE_URL)
+        assert type(result["title"]) is str
+
+    @pytest.mark.asyncio
+    async def test_pool_disabled_runs_inline(self, monkeypatch):
+        monkeypatch.setenv('CPU_POOL_WORKERS', '0')
+        activities.shutdown_process_pool()
+
+        assert activities.start_process_pool() == 0
+        assert await activities.analyze_content_depth("word " * 500) == pytest.approx(50.0)
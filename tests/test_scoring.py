@@ -0,0 +1,545 @@
+import pytest
+import time
+from contextlib import contextmanager
+import numpy as np
+from unittest.mock import MagicMock
+
+# Import functions to test
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'packages', 'python-worker'))
+
+from src import activities, scoring, tspr_state, link_graph
+from src.scoring import (
+    LinkGraph, topic_teleport_matrix, topic_sensitive_pagerank, calculate_tspr,
+    embedding_matrix, choose_n_clusters, cluster_embeddings, cluster_content,
+    calculate_content_depth, calculate_composite_score, content_depth_scores, composite_scores
+)
+from src.tspr_state import TsprStateStore
+from src.embedding_store import load_site_embeddings
+
+SITE = "https://example.com"
+
+# a -> b, c; b -> c; c -> a; d -> c; e has no out-links (dangling)
+EDGES = [("a", "b"), ("a", "c"), ("b", "c"), ("c", "a"), ("d", "c"), ("d", "e"), ("a", "a"), ("a", "b")]
+
+def dense_reference(graph: LinkGraph, teleport: np.ndarray, damping: float = 0.85) -> np.ndarray:
+    """Closed-form PageRank: solve (I - d * M) x = (1 - d) v with dangling rows redirected to v."""
+    n = graph.n_nodes
+    transition = graph.transition_t.toarray()
+    columns = []
+    for v in teleport.T:
+        m = transition + np.outer(v, graph.dangling.astype(float))
+        columns.append(np.linalg.solve(np.eye(n) - damping * m, (1 - damping) * v))
+    return np.column_stack(columns)
+
+@pytest.fixture(autouse=True)
+def state_store(tmp_path, monkeypatch):
+    """Persist TSPR state under a per-test directory."""
+    store = TsprStateStore(str(tmp_path / "tspr"))
+    monkeypatch.setattr(tspr_state, "_store", store)
+    return store
+
+def page(url: str, *links: str) -> dict:
+    return {
+        "url": f"{SITE}/{url}",
+        "links": [{"url": f"{SITE}/{link}", "isInternal": True} for link in links]
+    }
+
+class TestLinkGraph:
+    def test_csr_is_column_stochastic(self):
+        graph = LinkGraph.from_edges(EDGES)
+
+        assert graph.n_nodes == 5
+        # Duplicate a -> b and self-link a -> a are dropped
+        assert graph.n_edges == 6
+        column_sums = np.asarray(graph.transition_t.sum(axis=0)).ravel()
+        assert column_sums[graph.dangling] == pytest.approx(0.0)
+        assert column_sums[~graph.dangling] == pytest.approx(1.0)
+        assert [graph.urls[i] for i in np.flatnonzero(graph.dangling)] == ["e"]
+
+    def test_from_pages_follows_internal_links_only(self):
+        pages = [
+            {"url": f"{SITE}/a", "links": [
+                {"url": f"{SITE}/b#section", "isInternal": True},
+                {"url": "https://other.com/x", "isInternal": False}
+            ]},
+            page("b")
+        ]
+        graph = LinkGraph.from_pages(pages)
+
+        assert graph.urls == [f"{SITE}/a", f"{SITE}/b"]
+        assert graph.n_edges == 1
+
+    def test_replace_out_links(self):
+        graph = LinkGraph.from_edges(EDGES)
+
+        updated, added, removed = graph.replace_out_links({"a": ["c", "f", "a"], "e": ["a"]})
+
+        assert (added, removed) == (2, 1)
+        assert updated.urls == graph.urls + ["f"]
+        links = {(updated.urls[s], updated.urls[t]) for s, t in zip(*updated.edges())}
+        assert links == {("a", "c"), ("a", "f"), ("b", "c"), ("c", "a"), ("d", "c"), ("d", "e"), ("e", "a")}
+        assert not updated.dangling[updated.index["e"]]
+        assert updated.dangling[updated.index["f"]]
+
+class TestTopicSensitivePageRank:
+    def test_matches_linear_solve(self):
+        graph = LinkGraph.from_edges(EDGES)
+        names, teleport = topic_teleport_matrix(graph, {"x": ["a"], "y": ["d", "e"]})
+
+        scores, iterations, residual = topic_sensitive_pagerank(graph, teleport, tol=1e-12, max_iter=500)
+
+        assert names == ["global", "x", "y"]
+        assert residual < 1e-12
+        assert scores.sum(axis=0) == pytest.approx(np.ones(3))
+        np.testing.assert_allclose(scores, dense_reference(graph, teleport), atol=1e-10)
+
+    def test_topics_solved_jointly_match_separate_runs(self):
+        graph = LinkGraph.from_edges(EDGES)
+        _, teleport = topic_teleport_matrix(graph, {"x": ["b"], "y": ["e"]})
+
+        joint, _, _ = topic_sensitive_pagerank(graph, teleport, tol=1e-12, max_iter=500)
+        for column in range(teleport.shape[1]):
+            single, _, _ = topic_sensitive_pagerank(graph, teleport[:, [column]], tol=1e-12, max_iter=500)
+            np.testing.assert_allclose(joint[:, column], single[:, 0], atol=1e-12)
+
+    def test_seeds_are_boosted_and_missing_seeds_fall_back(self):
+        graph = LinkGraph.from_edges(EDGES)
+        names, teleport = topic_teleport_matrix(graph, {"x": ["d"], "none": ["missing"]})
+
+        scores, _, _ = topic_sensitive_pagerank(graph, teleport)
+        d = graph.index["d"]
+
+        assert scores[d, names.index("x")] > 3 * scores[d, names.index("global")]
+        np.testing.assert_allclose(scores[:, names.index("none")], scores[:, 0])
+
+    def test_stops_at_max_iter(self):
+        graph = LinkGraph.from_edges(EDGES)
+        _, teleport = topic_teleport_matrix(graph)
+
+        _, iterations, residual = topic_sensitive_pagerank(graph, teleport, tol=0.0, max_iter=3)
+
+        assert iterations == 3
+        assert residual > 0
+
+    def test_large_graph(self):
+        """200k pages / 2M links with two topics converges in one sparse solve."""
+        rng = np.random.default_rng(7)
+        n, m = 200_000, 2_000_000
+        urls = [str(i) for i in range(n)]
+        graph = LinkGraph(urls, rng.integers(0, n, m), rng.integers(0, n, m))
+        _, teleport = topic_teleport_matrix(graph, {"t1": urls[:100], "t2": urls[-100:]})
+
+        started = time.perf_counter()
+        scores, iterations, residual = topic_sensitive_pagerank(graph, teleport)
+        elapsed = time.perf_counter() - started
+
+        assert residual < 1e-6
+        assert scores.sum(axis=0) == pytest.approx(np.ones(3))
+        assert elapsed < 30
+
+class TestCalculateTspr:
+    def test_pages_return_scores(self):
+        pages = [page("home", "about", "blog"), page("about", "home"), page("blog", "post"), page("post")]
+
+        result = calculate_tspr("p1", pages=pages, topics={"blog": [f"{SITE}/blog"]})
+
+        assert result["status"] == "success"
+        assert result["pages"] == 4 and result["links"] == 4
+        assert result["topics"] == ["global", "blog"]
+        assert result["converged"]
+        scores = result["scores"]
+        assert sum(s["global"] for s in scores.values()) == pytest.approx(1.0)
+        assert scores[f"{SITE}/blog"]["blog"] > scores[f"{SITE}/blog"]["global"]
+
+    def test_tolerance_from_env(self, monkeypatch):
+        monkeypatch.setenv('TSPR_MAX_ITER', '2')
+        monkeypatch.setenv('TSPR_TOLERANCE', '0')
+
+        result = calculate_tspr("p1", pages=[page("a", "b"), page("b", "a", "c"), page("c")])
+
+        assert result["iterations"] == 2
+        assert not result["converged"]
+
+    @pytest.mark.asyncio
+    async def test_run_tspr_activity(self, monkeypatch):
+        monkeypatch.setenv('CPU_POOL_WORKERS', '0')
+        activities.shutdown_process_pool()
+
+        result = await activities.run_tspr("p1", [page("a", "b"), page("b", "a")])
+
+        assert result["scores"][f"{SITE}/a"]["global"] == pytest.approx(0.5)
+
+def neo4j_project(monkeypatch, urls: list, edges: list) -> MagicMock:
+    """Serve a project's pages and LINKS_TO edges from a mock Neo4j session."""
+    session = MagicMock()
+
+    def run(query, **params):
+        if "LINKS_TO" in query:
+            return [{"source": s, "target": t} for s, t in edges]
+        if "RETURN p.url" in query:
+            return [{"url": url} for url in urls]
+        return MagicMock()
+
+    session.run.side_effect = run
+    driver = MagicMock()
+    driver.session.return_value.__enter__.return_value = session
+    monkeypatch.setattr(link_graph, "_get_driver", lambda: driver)
+    return session
+
+class TestNeo4jTspr:
+    def test_empty_project_returns_empty_scores(self, monkeypatch):
+        session = neo4j_project(monkeypatch, [], [])
+
+        result = calculate_tspr("p1")
+
+        assert result["status"] == "success"
+        assert result["pages"] == 0
+        assert result["scores"] == {}
+        # Nothing to write back
+        assert not any("SET" in c.args[0] for c in session.run.call_args_list)
+
+    def test_unlinked_pages_scored_and_writes_scoped_to_project(self, monkeypatch):
+        session = neo4j_project(monkeypatch, ["a", "b", "lonely"], [("a", "b"), ("b", "a")])
+
+        result = calculate_tspr("p1")
+
+        assert (result["pages"], result["links"], result["written"]) == (3, 2, 3)
+        write = next(c for c in session.run.call_args_list if "SET" in c.args[0])
+        assert "BELONGS_TO" in write.args[0]
+        assert write.kwargs["project_id"] == "p1"
+        assert {row["url"] for row in write.kwargs["rows"]} == {"a", "b", "lonely"}
+
+SITE_PAGES = [
+    page("home", "about", "blog", "shop"),
+    page("about", "home"),
+    page("blog", "post1", "post2", "home"),
+    page("post1", "blog", "post2"),
+    page("post2", "blog"),
+    page("shop", "item1", "item2"),
+    page("item1", "shop"),
+    page("item2")
+]
+
+class TestIncrementalTspr:
+    @pytest.mark.parametrize("project_id", ["..", ".", "a/../..", "/abs", ""])
+    def test_unsafe_project_ids_stay_under_root(self, state_store, project_id):
+        path = state_store._path(project_id)
+
+        assert os.path.dirname(path) == state_store.root
+        assert os.path.basename(path).startswith("~")
+
+    def test_first_incremental_run_is_full_and_persisted(self, state_store):
+        result = calculate_tspr("p1", pages=SITE_PAGES, incremental=True)
+
+        assert result["mode"] == "full"
+        assert result["iterations_saved"] == 0
+        state = state_store.load("p1")
+        assert isinstance(state.scores, np.memmap)
+        assert state.sources.dtype == np.int32
+        assert state.urls == list(result["scores"])
+        assert state.scores[:, 0] == pytest.approx([result["scores"][u]["global"] for u in state.urls])
+
+    def test_warm_start_matches_full_recompute(self, monkeypatch):
+        monkeypatch.setenv('TSPR_TOLERANCE', '1e-10')
+        topics = {"blog": [f"{SITE}/blog"]}
+        cold = calculate_tspr("p1", pages=SITE_PAGES, topics=topics)
+
+        recrawled = [page("item2", "shop", "new"), page("post2", "blog", "home")]
+        warm = calculate_tspr("p1", pages=recrawled, incremental=True)
+
+        updated = {p["url"]: p for p in SITE_PAGES + recrawled}
+        full = calculate_tspr("p2", pages=list(updated.values()), topics=topics)
+
+        assert warm["mode"] == "incremental"
+        assert warm["topics"] == ["global", "blog"]
+        assert (warm["links_added"], warm["links_removed"]) == (3, 0)
+        assert warm["pages"] == full["pages"] == 9
+        assert warm["iterations"] < full["iterations"]
+        assert warm["iterations_saved"] == cold["iterations"] - warm["iterations"]
+        assert warm["converged"] and warm["residual"] < 1e-10
+        for url, scores in full["scores"].items():
+            assert warm["scores"][url] == pytest.approx(scores, abs=1e-9)
+
+    def test_unchanged_graph_converges_immediately(self):
+        calculate_tspr("p1", pages=SITE_PAGES)
+
+        result = calculate_tspr("p1", incremental=True)
+
+        assert result["mode"] == "incremental"
+        assert result["iterations"] <= 2
+        assert "scores" in result
+
+    def test_large_graph_warm_start(self):
+        """A few hundred changed pages on a 200k-page graph need fewer iterations than a cold start."""
+        rng = np.random.default_rng(11)
+        n, m = 200_000, 2_000_000
+        urls = [str(i) for i in range(n)]
+        # Heavy-tailed, mostly local links with half the pages dangling, like a site
+        sources = rng.integers(0, n // 2, m)
+        graph = LinkGraph(urls, sources, (sources + rng.zipf(1.5, m)) % n)
+        _, teleport = topic_teleport_matrix(graph)
+        scores, _, _ = topic_sensitive_pagerank(graph, teleport)
+
+        changed = {urls[i]: [urls[j] for j in rng.integers(0, n, 10)] for i in rng.integers(0, n // 2, 300)}
+        updated, _, _ = graph.replace_out_links(changed)
+        warm, warm_iterations, residual = topic_sensitive_pagerank(updated, teleport, x0=scores)
+        full, full_iterations, _ = topic_sensitive_pagerank(updated, teleport)
+
+        assert residual < 1e-6
+        assert warm_iterations < full_iterations
+        assert np.abs(warm - full).sum() < 5e-5
+
+def blobs(n_centers: int, n: int, dim: int = 32, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=10, size=(n_centers, dim))
+    labels = rng.integers(0, n_centers, n)
+    return (centers[labels] + rng.normal(size=(n, dim))).astype(np.float32), labels
+
+def embedding_dicts(X: np.ndarray) -> list:
+    return [{"url": f"{SITE}/p{i}", "embedding": row.tolist()} for i, row in enumerate(X)]
+
+class TestClustering:
+    def test_embedding_matrix_is_float32(self):
+        X = embedding_matrix([{"embedding": [1.0, 2.0]}, {"embedding": [3.0, 4.0]}])
+
+        assert X.dtype == np.float32
+        assert X.tolist() == [[1.0, 2.0], [3.0, 4.0]]
+
+    @pytest.mark.parametrize("engine", ["kmeans", "minibatch"])
+    def test_ragged_embeddings_rejected(self, engine):
+        embeddings = [
+            {"url": f"{SITE}/a", "embedding": [1.0, 2.0]},
+            {"url": f"{SITE}/b", "embedding": [3.0, 4.0, 5.0]},
+        ]
+
+        with pytest.raises(ValueError, match=f"{SITE}/b has dimension 3, expected 2"):
+            cluster_content(embeddings, engine=engine)
+
+    def test_chooses_k_on_sample(self):
+        X, _ = blobs(8, 20_000)
+
+        assert choose_n_clusters(X, sample_size=2000) == 8
+
+    def test_warm_start_keeps_centroids(self):
+        X, truth = blobs(8, 5000)
+        cold = cluster_embeddings(X, n_clusters=8)
+
+        # A recrawl moves a few pages slightly
+        X[:50] += 0.1
+        warm = cluster_embeddings(X, centroids=cold["centroids"])
+
+        assert warm["warm_start"] and warm["n_clusters"] == 8
+        assert warm["centroids"].dtype == np.float32
+        assert (warm["labels"] == cold["labels"]).mean() > 0.99
+        # One cluster per true blob
+        assert len({(t, l) for t, l in zip(truth, cold["labels"])}) == 8
+
+    def test_warm_start_dimension_mismatch(self):
+        X, _ = blobs(2, 100)
+
+        with pytest.raises(ValueError):
+            cluster_embeddings(X, centroids=[[0.0, 0.0]])
+
+    def test_cluster_content_engines(self, monkeypatch):
+        embeddings = embedding_dicts(blobs(12, 600)[0])
+
+        assert len({r["cluster_id"] for r in cluster_content(embeddings)}) <= 5
+
+        monkeypatch.setenv('CLUSTER_ENGINE', 'minibatch')
+        monkeypatch.setenv('CLUSTER_K', '12')
+        result = cluster_content(embeddings)
+        assert [r["url"] for r in result] == [e["url"] for e in embeddings]
+        assert len({r["cluster_id"] for r in result}) == 12
+
+        monkeypatch.setenv('CLUSTER_ENGINE', 'dbscan')
+        with pytest.raises(ValueError):
+            cluster_content(embeddings)
+
+    @pytest.mark.asyncio
+    async def test_update_clusters_activity(self, monkeypatch):
+        monkeypatch.setenv('CPU_POOL_WORKERS', '0')
+        activities.shutdown_process_pool()
+        embeddings = embedding_dicts(blobs(4, 200, dim=8)[0])
+
+        first = await activities.update_clusters(embeddings)
+        second = await activities.update_clusters(embeddings, first["centroids"])
+
+        assert not first["warm_start"] and second["warm_start"]
+        assert second["n_clusters"] == first["n_clusters"] == 4
+        assert [c["cluster_id"] for c in second["clusters"]] == [c["cluster_id"] for c in first["clusters"]]
+        assert await activities.update_clusters([]) == {
+            "clusters": [], "centroids": [], "n_clusters": 0, "inertia": 0.0, "warm_start": False
+        }
+
+class FakeClickHouse:
+    """page_embeddings / clusters / page_clusters kept in memory."""
+
+    def __init__(self, embeddings: dict, clusters: list = None):
+        self.embeddings = embeddings  # site_id -> [(page_id, embedding)]
+        self.clusters = list(clusters or [])  # rows as {column: value}
+        self.page_clusters = []
+        self.block_sizes = []
+        self.inserts = []
+        self.commands = []
+
+    def query(self, sql, parameters=None):
+        site_rows = self.embeddings.get(parameters['site_id'], [])
+
+        class Result:
+            result_rows = None
+
+        result = Result()
+        if "count()" in sql:
+            lengths = [len(e) for _, e in site_rows]
+            result.result_rows = [(len(site_rows), min(lengths, default=0), max(lengths, default=0))]
+        else:
+            result.result_rows = [
+                (c['cluster_id'], c['centroid_embedding']) for c in self.clusters
+                if c['site_id'] == parameters['site_id'] and c.get('centroid_embedding')
+            ]
+        return result
+
+    @contextmanager
+    def query_column_block_stream(self, sql, parameters=None, settings=None):
+        rows = self.embeddings.get(parameters['site_id'], [])
+        size = settings['max_block_size']
+
+        def blocks():
+            for start in range(0, len(rows), size):
+                block = rows[start:start + size]
+                self.block_sizes.append(len(block))
+                yield [[r[0] for r in block], [list(r[1]) for r in block]]
+
+        yield blocks()
+
+    def command(self, sql, parameters=None):
+        self.commands.append(sql)
+        if sql.startswith("DELETE FROM clusters"):
+            # Only rows with a centroid are replaced
+            self.clusters = [
+                c for c in self.clusters
+                if c['site_id'] != parameters['site_id'] or not c.get('centroid_embedding')
+            ]
+
+    def insert(self, table, data, column_names=None, column_oriented=False):
+        self.inserts.append(table)
+        if table == 'page_clusters':
+            assert column_oriented
+            self.page_clusters.extend(zip(*data))
+        else:
+            self.clusters.extend(dict(zip(column_names, row)) for row in data)
+
+class TestSiteClustering:
+    @pytest.fixture
+    def clickhouse(self, monkeypatch):
+        X, truth = blobs(8, 3000, dim=16)
+        client = FakeClickHouse({
+            "site-1": [(f"page-{i}", row) for i, row in enumerate(X)],
+            "other": [("x", [0.0] * 16)]
+        })
+        client.truth = truth
+        monkeypatch.setattr(scoring, "get_clickhouse_client", lambda: client)
+        monkeypatch.setenv('CPU_POOL_WORKERS', '0')
+        monkeypatch.setenv('CLUSTER_STREAM_BLOCK_ROWS', '1000')
+        monkeypatch.setenv('CLUSTER_WRITE_BATCH_ROWS', '1000')
+        activities.shutdown_process_pool()
+        return client
+
+    def test_streams_into_float32_matrix(self, clickhouse):
+        page_ids, X = load_site_embeddings(clickhouse, "site-1", block_rows=700)
+
+        assert X.dtype == np.float32 and X.shape == (3000, 16)
+        assert clickhouse.block_sizes == [700] * 4 + [200]
+        assert page_ids[1234] == "page-1234"
+        np.testing.assert_array_equal(X[1234], clickhouse.embeddings["site-1"][1234][1])
+
+    @pytest.mark.asyncio
+    async def test_compute_clusters_by_site(self, clickhouse):
+        result = await activities.compute_clusters(site_id="site-1")
+
+        assert result["status"] == "success"
+        assert result["pages"] == result["written"] == 3000
+        assert result["dimension"] == 16
+        assert result["n_clusters"] == 8
+        assert result["cluster_sizes"]["min"] + result["cluster_sizes"]["max"] <= 3000
+        assert "labels" not in result and "clusters" not in result
+        assert clickhouse.inserts.count('page_clusters') == 3
+        assignments = {page_id: cluster_id for _, page_id, cluster_id, _ in clickhouse.page_clusters}
+        assert len({(t, assignments[f"page-{i}"]) for i, t in enumerate(clickhouse.truth)}) == 8
+        sites = {c['site_id'] for c in clickhouse.clusters}
+        assert sites == {"site-1"} and len(clickhouse.clusters) == 8
+
+    @pytest.mark.asyncio
+    async def test_keyword_clusters_are_kept(self, clickhouse):
+        """Clusters rows without a centroid survive reclustering and never seed it."""
+        keyword_cluster = {"site_id": "site-1", "cluster_id": "kw-1", "label": "Shoes", "page_count": 12}
+        clickhouse.clusters.append(keyword_cluster)
+
+        await activities.compute_clusters(site_id="site-1")
+        second = await activities.compute_clusters(site_id="site-1", warm_start=True)
+
+        assert second["warm_start"] and second["n_clusters"] == 8
+        assert keyword_cluster in clickhouse.clusters and len(clickhouse.clusters) == 9
+        # Schema comes from setup; activities only replace centroid rows
+        assert all(sql.startswith("DELETE FROM clusters") for sql in clickhouse.commands)
+
+    @pytest.mark.asyncio
+    async def test_warm_start_from_stored_centroids(self, clickhouse):
+        first = await activities.compute_clusters(site_id="site-1")
+        first_assignments = dict((p, c) for _, p, c, _ in clickhouse.page_clusters)
+        clickhouse.page_clusters = []
+
+        second = await activities.compute_clusters(site_id="site-1", warm_start=True)
+
+        assert not first["warm_start"] and second["warm_start"]
+        assert second["n_clusters"] == 8 and len(clickhouse.clusters) == 8
+        assert dict((p, c) for _, p, c, _ in clickhouse.page_clusters) == first_assignments
+
+    def test_mixed_dimensions_rejected(self, clickhouse):
+        clickhouse.embeddings["site-1"].append(("page-short", [0.0] * 8))
+
+        with pytest.raises(ValueError, match="mixed dimensions"):
+            load_site_embeddings(clickhouse, "site-1")
+
+    @pytest.mark.asyncio
+    async def test_empty_site(self, clickhouse):
+        assert await activities.compute_clusters(site_id="missing") == {
+            "status": "empty", "site_id": "missing", "pages": 0
+        }
+
+class TestBatchScoring:
+    def test_depth_matches_per_page(self):
+        texts = ["", "word " * 10, "word " * 500, "word " * 1000, "word " * 2500]
+        counts = [len(text.split()) for text in texts]
+
+        np.testing.assert_allclose(content_depth_scores(counts), [calculate_content_depth(t) for t in texts])
+
+    def test_composite_matches_per_page(self):
+        rng = np.random.default_rng(3)
+        tspr, depth, risk, ux = rng.uniform(0, 15, 50), rng.uniform(0, 100, 50), rng.uniform(0, 80, 50), rng.uniform(0, 100, 50)
+
+        expected = [calculate_composite_score(*values) for values in zip(tspr, depth, risk, ux)]
+
+        np.testing.assert_allclose(composite_scores(tspr, depth, risk, ux), expected)
+        np.testing.assert_allclose(composite_scores(tspr, depth), [calculate_composite_score(t, d) for t, d in zip(tspr, depth)])
+
+    def test_composite_length_mismatch(self):
+        with pytest.raises(ValueError):
+            composite_scores([1.0, 2.0], [1.0, 2.0, 3.0])
+
+    @pytest.mark.asyncio
+    async def test_batch_activities(self, monkeypatch):
+        monkeypatch.setenv('CPU_POOL_WORKERS', '0')
+        activities.shutdown_process_pool()
+        pages = [activities.extract("<p>" + "word " * n + "</p>", f"{SITE}/{n}") for n in (0, 500, 1000)]
+
+        depth = await activities.analyze_content_depth_batch([p["wordCount"] for p in pages])
+        from_texts = await activities.analyze_content_depth_batch(texts=[p["text"] for p in pages])
+        composite = await activities.compute_composite_score_batch([5.0] * 3, depth, ux=[85.0] * 3)
+
+        assert depth == from_texts
+        assert depth == pytest.approx([0.0, 50.0, calculate_content_depth("word " * 1000)])
+        assert composite == pytest.approx([calculate_composite_score(5.0, d, 0, 85.0) for d in depth])
+        assert await activities.analyze_content_depth_batch([]) == []
@@ -0,0 +1,166 @@
+import pytest
+import asyncio
+from unittest.mock import patch, MagicMock
+
+# Import workflows to test
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'compute-worker'))
+
+from temporalio.exceptions import ActivityError, ApplicationError, ChildWorkflowError
+import workflows
+from workflows import CannibalizationWorkflow, ContentScoringWorkflow, _score_range
+from activities import (
+    calculate_cannibalization,
+    compute_content_scores_slice,
+    count_site_pages
+)
+
+def make_pages(n: int, prefix: str = "page") -> list:
+    return [
+        {"url": f"https://example.com/{prefix}-{i}", "content": "text", "target_keyword": "seo"}
+        for i in range(n)
+    ]
+
+def activity_error(message: str) -> ActivityError:
+    error = ActivityError(
+        "Activity task failed", scheduled_event_id=1, started_event_id=2, identity="test",
+        activity_type="compute_content_scores_slice", activity_id="1", retry_state=None
+    )
+    error.__cause__ = ApplicationError(message)
+    return error
+
+def child_error(message: str) -> ChildWorkflowError:
+    error = ChildWorkflowError(
+        "Child Workflow execution failed", namespace="default", workflow_id="child", run_id="run",
+        workflow_type="ContentScoringWorkflow", initiated_event_id=1, started_event_id=2, retry_state=None
+    )
+    error.__cause__ = ApplicationError(message)
+    return error
+
+class FakeWorkflowRuntime:
+    """Stands in for workflow.execute_activity / execute_child_workflow, tracking concurrency."""
+
+    def __init__(self, total_pages: int = 0, pages: list = None, bad_urls: set = (), failed_skips: set = ()):
+        self.total_pages = total_pages
+        self.pages = pages or []
+        self.bad_urls = set(bad_urls)
+        self.failed_skips = set(failed_skips)
+        self.activities = []
+        self.options = {}
+        self.children = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.children_in_flight = 0
+        self.max_children_in_flight = 0
+
+    async def execute_activity(self, activity, arg=None, *, args=(), **kwargs):
+        self.activities.append(activity)
+        self.options.setdefault(activity, kwargs)
+        if activity is calculate_cannibalization:
+            return None
+        if activity is count_site_pages:
+            return self.total_pages
+        assert activity is compute_content_scores_slice
+        _, skip, limit = args
+        batch = self.pages[skip:skip + limit]
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.in_flight -= 1
+        if any(page["url"] in self.bad_urls for page in batch):
+            raise activity_error("ClickHouse unavailable")
+        scorable = [page for page in batch if page.get("target_keyword")]
+        return {"scored": len(scorable), "skipped": len(batch) - len(scorable)}
+
+    async def execute_child_workflow(self, run, input, *, id):
+        assert run == ContentScoringWorkflow.run
+        self.children.append(input)
+        self.children_in_flight += 1
+        self.max_children_in_flight = max(self.max_children_in_flight, self.children_in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if input["skip"] in self.failed_skips:
+                raise child_error("slice timed out")
+            # The child's own run against this runtime
+            return await ContentScoringWorkflow().run(input)
+        finally:
+            self.children_in_flight -= 1
+
+@pytest.fixture
+def runtime():
+    """Patch the workflow APIs used by the compute-worker workflows."""
+    fake = FakeWorkflowRuntime()
+    info = MagicMock()
+    info.return_value.workflow_id = "cannibalization-site-1"
+    with patch.object(workflows.workflow, 'execute_activity', fake.execute_activity), \
+         patch.object(workflows.workflow, 'execute_child_workflow', fake.execute_child_workflow), \
+         patch.object(workflows.workflow, 'info', info), \
+         patch.object(workflows.workflow, 'logger', MagicMock()):
+        yield fake
+
+class TestScoreRange:
+    """Test suite for the bounded content scoring fan-out."""
+
+    @pytest.mark.asyncio
+    async def test_fan_out_is_bounded_and_collects_failures(self, runtime):
+        """Batches run at most max_in_flight at once; a failed batch is reported by its offsets."""
+        runtime.pages = make_pages(10) + [{"url": "https://example.com/no-keyword", "content": "text"}]
+        runtime.bad_urls = {"https://example.com/page-3"}
+
+        result = await _score_range("site-1", 0, 11, max_in_flight=2, batch_size=2)
+
+        assert result["scored"] == 8
+        assert result["skipped"] == 1
+        assert result["failed"] == [{"slice": {"skip": 2, "limit": 2}, "error": "ClickHouse unavailable"}]
+        assert runtime.max_in_flight == 2
+
+class TestCannibalizationWorkflow:
+    """Test suite for scoring fan-out across child workflows."""
+
+    @pytest.mark.asyncio
+    async def test_small_site_scores_inline(self, runtime):
+        runtime.pages = make_pages(5)
+        runtime.total_pages = 5
+
+        result = await CannibalizationWorkflow().run({"siteId": "site-1", "scoreBatchSize": 2})
+
+        assert result == {"status": "Analysis and Scoring Complete", "scored": 5, "skipped": 0, "failed": []}
+        assert runtime.children == []
+        # Stuck analysis is caught by heartbeats, not the start-to-close wall
+        options = runtime.options[calculate_cannibalization]
+        assert options["heartbeat_timeout"] < options["start_to_close_timeout"]
+
+    @pytest.mark.asyncio
+    async def test_large_site_scores_child_slices(self, runtime):
+        """Each slice goes to a child workflow, with at most maxChildren running."""
+        runtime.pages = make_pages(25)
+        runtime.total_pages = 25
+        runtime.bad_urls = {"https://example.com/page-12"}
+
+        result = await CannibalizationWorkflow().run({
+            "siteId": "site-1", "pagesPerChild": 10, "maxChildren": 2, "scoreBatchSize": 5
+        })
+
+        assert [(c["skip"], c["limit"]) for c in runtime.children] == [(0, 10), (10, 10), (20, 5)]
+        assert all(c["scoreBatchSize"] == 5 for c in runtime.children)
+        # Children carry offsets only, never page content
+        assert all("pages" not in c for c in runtime.children)
+        assert runtime.max_children_in_flight == 2
+        assert result["scored"] == 20
+        assert result["failed"] == [{"slice": {"skip": 10, "limit": 5}, "error": "ClickHouse unavailable"}]
+
+    @pytest.mark.asyncio
+    async def test_failed_child_slice_is_collected(self, runtime):
+        """A failed child workflow is reported for its slice; the other slices still count."""
+        runtime.pages = make_pages(25)
+        runtime.total_pages = 25
+        runtime.failed_skips = {10}
+
+        result = await CannibalizationWorkflow().run({"siteId": "site-1", "pagesPerChild": 10})
+
+        assert result["status"] == "Analysis and Scoring Complete"
+        assert result["scored"] == 15
+        assert result["failed"] == [{"slice": {"skip": 10, "limit": 10}, "error": "slice timed out"}]